@@ -0,0 +1,118 @@
+'''
+Benchmark of the all.log parser
+
+Compares the per-line regex loop which EmailReport._parse_all_log used to run
+with cafy_pytest.all_log.AllLogParser over a synthetic CafyLog formatted log.
+
+    python benchmarks/bench_all_log_parser.py --lines 1000000
+'''
+
+import argparse
+import html
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cafy_pytest.all_log import (AllLogParser, GenericLogGrouping, LogLine,  # noqa: E402
+                                 LogState, TestCase)
+
+LEVELS = ("Info", "Debug", "Warning", "Error", "Success")
+
+
+def legacy_parse_all_log(input_file_handler):
+    '''Copy of EmailReport._parse_all_log before the parser was precompiled'''
+    log_parsing_state = LogState.NONE
+    log_grouping = None
+    separator_line = re.compile('-[a-zA-Z]+-+.*> [=]+$')
+    start_test_line = re.compile(r'Start test:\W+(.*)$')
+    end_test_line = re.compile(r'Finish test:\W+(.*)\W\((.*)\)$')
+    split_log_line = re.compile('^-+([a-zA-Z]+)-+(.*)$')
+
+    all_log_groupings = []
+    for log_line in input_file_handler:
+        escape_re = re.compile(r'\x1b\[[0-9;]*m')
+        log_line = re.sub(escape_re, "", log_line)
+        if separator_line.search(log_line):
+            continue
+        elif start_test_line.search(log_line):
+            name = start_test_line.search(log_line).group(1)
+            log_grouping = TestCase(name=name, description="")
+            all_log_groupings.append(log_grouping)
+            log_parsing_state = LogState.TESTCASE
+        elif end_test_line.search(log_line):
+            if log_parsing_state is LogState.TESTCASE:
+                if end_test_line.search(log_line).group(2) == 'failed':
+                    log_grouping.failed = True
+                log_parsing_state = LogState.NONE
+        else:
+            if log_parsing_state is LogState.NONE:
+                log_grouping = GenericLogGrouping()
+                all_log_groupings.append(log_grouping)
+                log_parsing_state = LogState.GENERIC
+            processed_log_line = split_log_line.search(log_line)
+            if processed_log_line:
+                log_grouping.append_log_line(LogLine(html.escape(processed_log_line.group(2)), processed_log_line.group(1).upper()))
+            else:
+                log_grouping.append_log_line(LogLine(html.escape(log_line), 'OUT'))
+    return all_log_groupings
+
+
+def write_synthetic_log(path, total_lines, lines_per_test=2000):
+    '''Write a log shaped like all.log: test banners, leveled lines, colored lines and raw output'''
+    with open(path, 'w') as log_file:
+        written = 0
+        test_index = 0
+        while written < total_lines:
+            name = "TestSuite.test_case_%d" % test_index
+            log_file.write("-Title---- 2026-10-17 10:00:00,000 [cafy] > %s\n" % ("=" * 60))
+            log_file.write("-Title---- 2026-10-17 10:00:00,000 [cafy] Start test:  %s\n" % name)
+            written += 2
+            for i in range(min(lines_per_test, total_lines - written)):
+                level = LEVELS[i % len(LEVELS)]
+                if i % 17 == 0:
+                    log_file.write("router-1#show interfaces brief | include <up>\n")
+                elif i % 29 == 0:
+                    log_file.write("-%s---- 2026-10-17 10:00:01,%03d [%s] \x1b[31mcolored message %d\x1b[0m\n"
+                                   % (level, i % 1000, name, i))
+                else:
+                    log_file.write("-%s---- 2026-10-17 10:00:01,%03d [%s] message number %d\n"
+                                   % (level, i % 1000, name, i))
+                written += 1
+            log_file.write("-Title---- 2026-10-17 10:00:09,000 [cafy] Finish test: %s (%s)\n"
+                           % (name, "failed" if test_index % 5 == 0 else "passed"))
+            written += 1
+            test_index += 1
+    return written
+
+
+def run(label, parse, path, lines):
+    with open(path, 'r') as input_file_handler:
+        start = time.perf_counter()
+        groupings = 0
+        for _ in parse(input_file_handler):
+            groupings += 1
+        elapsed = time.perf_counter() - start
+    print("%-10s %10d lines %6d groupings %8.2fs %12.0f lines/sec"
+          % (label, lines, groupings, elapsed, lines / elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=1000000, help='number of log lines to generate')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'all.log')
+        lines = write_synthetic_log(path, args.lines)
+        before = run('before', legacy_parse_all_log, path, lines)
+        after = run('after', AllLogParser().parse, path, lines)
+    print("speedup    %.2fx" % (before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+'''
+Benchmark of the per-call overhead of the GTA set/get timing backends
+
+Compares the functools.wraps wrapper which TimeCollectorPlugin patches into the
+classes (patch) with the MethodTimer backends of cafy_pytest.gta_monitor
+(monitoring on python 3.12+, setprofile), for calls of a timed set/get method
+and for calls of any other function made while timing is active.
+
+    python benchmarks/bench_gta_overhead.py --calls 1000000
+'''
+
+import argparse
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cafy_pytest.gta_monitor import MONITORING, SETPROFILE, MethodTimer  # noqa: E402
+
+
+class Interface:
+    def get_state(self):
+        return self
+
+    def describe(self):
+        return self
+
+
+class LegacyWrapper:
+    '''Copy of the TimeCollectorPlugin wrapper and the bookkeeping it does on every call'''
+
+    def __init__(self):
+        self.granular_time_testcase_dict = dict()
+        self.test_case_name = "TestSuite.test_case"
+
+    def update_granular_time_testcase_dict(self, current_test, event, method_name, elapsed_time, feature_type):
+        if current_test not in self.granular_time_testcase_dict:
+            self.granular_time_testcase_dict[current_test] = dict()
+        if event not in self.granular_time_testcase_dict[current_test]:
+            self.granular_time_testcase_dict[current_test][event] = dict()
+        if method_name not in self.granular_time_testcase_dict[current_test][event]:
+            self.granular_time_testcase_dict[current_test][event][method_name] = list()
+        self.granular_time_testcase_dict[current_test][event][method_name].append([float(elapsed_time), feature_type])
+
+    def get_method_type(self, method):
+        file_path = method.__code__.co_filename
+        feature_type = None
+        if file_path:
+            feature_type = "non-infra" if "lib/feature_lib" in file_path or "lib/hw" in file_path else "infra"
+        return feature_type
+
+    def measure_time_for_set_or_get_methods(self, method, cls_name):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            result = method(*args, **kwargs)
+            end_time = time.perf_counter()
+            elapsed_time = '%.2f' % ((end_time - start_time) * 1000000)
+            current_test = self.test_case_name
+            if current_test not in self.granular_time_testcase_dict:
+                self.granular_time_testcase_dict[current_test] = dict()
+            method_name = method.__name__
+            feature_type = self.get_method_type(method)
+            if method_name.startswith('set'):
+                self.update_granular_time_testcase_dict(current_test, 'set_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type)
+            elif method_name.startswith('get'):
+                self.update_granular_time_testcase_dict(current_test, 'get_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type)
+            return result
+        return wrapper
+
+
+def time_calls(method, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        method()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def measure(calls):
+    '''
+    :return: dict of backend -> (ns per timed call, ns per other call)
+    '''
+    results = {}
+    interface = Interface()
+    results['none'] = (time_calls(interface.get_state, calls), time_calls(interface.describe, calls))
+
+    original = Interface.get_state
+    Interface.get_state = LegacyWrapper().measure_time_for_set_or_get_methods(original, "Interface")
+    try:
+        results['patch'] = (time_calls(interface.get_state, calls), time_calls(interface.describe, calls))
+    finally:
+        Interface.get_state = original
+
+    for backend in (MONITORING, SETPROFILE):
+        timer = MethodTimer(backend, capacity=calls)
+        timer.track(Interface.get_state.__code__, 'get_command', 'Interface.get_state', 'infra')
+        timer.begin("TestSuite.test_case")
+        timer.start()
+        try:
+            if timer.backend != backend:
+                continue
+            results[backend] = (time_calls(interface.get_state, calls), time_calls(interface.describe, calls))
+        finally:
+            timer.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=1000000, help='number of calls per measurement')
+    args = parser.parse_args()
+
+    results = measure(args.calls)
+    base_timed, base_other = results['none']
+    print("python %s" % sys.version.split()[0])
+    print("%-11s %14s %14s %16s %16s" % ("backend", "timed ns/call", "other ns/call",
+                                         "timed overhead", "other overhead"))
+    for backend, (timed, other) in results.items():
+        print("%-11s %14.1f %14.1f %16.1f %16.1f" % (backend, timed, other, timed - base_timed, other - base_other))
+
+
+if __name__ == '__main__':
+    main()
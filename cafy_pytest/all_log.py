@@ -0,0 +1,268 @@
+'''
+Parsing and HTML rendering of CafyLog formatted logs (all.log / captured stdout)
+
+The parser yields one log grouping at a time so that callers can render the
+report incrementally; memory is bounded by the largest single grouping rather
+than by the size of the whole log.
+'''
+
+import html
+import io
+import json
+import os
+import re
+import shutil
+from enum import Enum
+
+# Log levels which get their own view in the html report, in display order
+LOG_TYPES = ("INFO", "ERROR", "DEBUG", "SUCCESS", "WARNING", "OUT")
+# One character level code per line in the chunks of the compact html report
+LOG_TYPE_CODES = {log_type: str(code) for code, log_type in enumerate(LOG_TYPES)}
+# Directory of the chunks of a compact html report, next to it
+CHUNKS_DIR_SUFFIX = '.chunks'
+
+
+class LogGrouping:
+    def __init__(self):
+        self.log_lines = []
+        # Per level views, filled in the same pass which appends to log_lines
+        self.log_lines_by_type = {log_type: [] for log_type in LOG_TYPES}
+
+    def get_subgroupings(self):
+        return []
+
+    def get_title(self):
+        pass
+
+    def get_log_lines(self, log_type=None):
+        if log_type is None:
+            return self.log_lines
+        return self.log_lines_by_type.get(log_type, [])
+
+    def append_log_line(self, line):
+        self.log_lines.append(line)
+        if line.type in self.log_lines_by_type:
+            self.log_lines_by_type[line.type].append(line)
+
+
+class LogLine:
+    def __init__(self, line, type = None):
+        self.line = line
+        self.type = type
+
+
+class GenericLogGrouping(LogGrouping):
+    def get_title(self):
+        if len(self.log_lines) > 0:
+            return self.log_lines[0].line[0:80] + "... and " + str(len(self.log_lines)) + " more lines"
+        else:
+            return "Generic log line"
+
+
+class TestCase(LogGrouping):
+    # Not a pytest test class, even though the name looks like one
+    __test__ = False
+
+    def __init__(self, name=None, description=None):
+        super().__init__()
+        self.name = name
+        self.description = description
+        self.failed = False
+
+    def get_title(self):
+        return 'Test case: ' + self.name + (' ***Failed***' if self.failed else '')
+
+
+class LogState(Enum):
+    NONE = 1
+    GENERIC = 2
+    TESTCASE = 3
+    STEP = 3
+
+
+# Compiled once per process; AllLogParser guards each of them with a cheap
+# substring/prefix test so that most lines are matched by a single regex.
+ESCAPE_RE = re.compile(r'\x1b\[[0-9;]*m')
+SEPARATOR_LINE_RE = re.compile(r'-[a-zA-Z]+-+.*> [=]+$')
+START_TEST_LINE_RE = re.compile(r'Start test:\W+(.*)$')
+END_TEST_LINE_RE = re.compile(r'Finish test:\W+(.*)\W\((.*)\)$')
+SPLIT_LOG_LINE_RE = re.compile(r'^-+([a-zA-Z]+)-+(.*)$')
+
+
+class AllLogParser:
+    '''
+    Incremental parser of CafyLog formatted lines into log groupings
+
+    feed() one line at a time and collect the groupings it completes, or use
+    parse() to iterate over the groupings of a whole log.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.log_parsing_state = LogState.NONE
+        self.log_grouping = None
+        self._log_types = {}
+
+    def _log_type(self, level):
+        log_type = self._log_types.get(level)
+        if log_type is None:
+            log_type = self._log_types[level] = level.upper()
+        return log_type
+
+    def feed(self, log_line):
+        '''
+        Parse one log line
+        :param log_line: log line, with or without the trailing newline
+        :return: the previous LogGrouping if this line completed it, else None
+        '''
+        completed = None
+        log_line = log_line.rstrip('\n')
+        if '\x1b' in log_line:
+            log_line = ESCAPE_RE.sub("", log_line)
+        if log_line.endswith('=') and '> =' in log_line and SEPARATOR_LINE_RE.search(log_line):
+            return None
+        start_match = START_TEST_LINE_RE.search(log_line) if 'Start test:' in log_line else None
+        if start_match:
+            # When we encounter start of test case, irrespective of current state we reset to LogState.TESTCASE
+            completed = self.log_grouping
+            self.log_grouping = TestCase(name=start_match.group(1), description="")
+            self.log_parsing_state = LogState.TESTCASE
+            return completed
+        end_match = END_TEST_LINE_RE.search(log_line) if 'Finish test:' in log_line else None
+        if end_match:
+            if self.log_parsing_state is LogState.TESTCASE:
+                if end_match.group(2) == 'failed':
+                    self.log_grouping.failed = True
+                self.log_parsing_state = LogState.NONE
+            return None
+        if self.log_parsing_state is LogState.NONE:
+            completed = self.log_grouping
+            self.log_grouping = GenericLogGrouping()
+            self.log_parsing_state = LogState.GENERIC
+        processed_log_line = SPLIT_LOG_LINE_RE.match(log_line) if log_line.startswith('-') else None
+        if processed_log_line:
+            self.log_grouping.append_log_line(LogLine(html.escape(processed_log_line.group(2)),
+                                                      self._log_type(processed_log_line.group(1))))
+        else:
+            self.log_grouping.append_log_line(LogLine(html.escape(log_line), 'OUT'))
+        return completed
+
+    def close(self):
+        '''
+        Finish parsing
+        :return: the last LogGrouping, if any
+        '''
+        completed = self.log_grouping
+        self.reset()
+        return completed
+
+    def parse(self, input_file_handler):
+        '''
+        Parse log lines and yield each LogGrouping once it is complete
+        :param input_file_handler: any iterable of log lines (open file, list of str)
+        :return: generator of TestCase / GenericLogGrouping objects
+        '''
+        self.reset()
+        feed = self.feed
+        for log_line in input_file_handler:
+            completed = feed(log_line)
+            if completed is not None:
+                yield completed
+        completed = self.close()
+        if completed is not None:
+            yield completed
+
+
+def iter_log_groupings(input_file_handler):
+    '''
+    Parse log lines and yield each LogGrouping once it is complete
+    :param input_file_handler: any iterable of log lines (open file, list of str)
+    :return: generator of TestCase / GenericLogGrouping objects
+    '''
+    return AllLogParser().parse(input_file_handler)
+
+
+class _FilePrefix(io.RawIOBase):
+    '''
+    Raw reader of the first size bytes of a binary file
+    '''
+    def __init__(self, file, size):
+        self.file = file
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def iter_log_snapshot(log_path, size, errors='replace'):
+    '''
+    Yields the complete lines of the first size bytes of a log which is still written to,
+    read as open(log_path, errors=errors) would; a line cut short at size is left out
+    :param size: size of the log when the snapshot is taken
+    '''
+    with open(log_path, 'rb') as log_file, \
+            io.TextIOWrapper(io.BufferedReader(_FilePrefix(log_file, size)), errors=errors) as text_file:
+        for line in text_file:
+            if not line.endswith('\n'):
+                return
+            yield line
+
+
+def write_all_log_html(template, input_file_handler, output_file):
+    '''
+    Render the log groupings of input_file_handler into output_file as they are parsed
+    :param template: jinja2 Template of all_log_template.html
+    :param input_file_handler: iterable of log lines
+    :param output_file: writable text file object
+    '''
+    stream = template.stream(log_groupings=iter_log_groupings(input_file_handler))
+    stream.enable_buffering(size=64)
+    stream.dump(output_file)
+
+
+def write_log_chunk(log_grouping, index, chunk_file):
+    '''
+    Write the lines of a log grouping once, as cafyLogChunk(index, {"c": level codes, "t": lines})
+    :return: line count and line count per level of LOG_TYPES
+    '''
+    codes = []
+    lines = []
+    for log_line in log_grouping.get_log_lines():
+        code = LOG_TYPE_CODES.get(log_line.type)
+        if code is not None:
+            codes.append(code)
+            lines.append(log_line.line)
+    chunk_file.write('cafyLogChunk(%d, ' % index)
+    json.dump({"c": "".join(codes), "t": lines}, chunk_file, ensure_ascii=False, separators=(',', ':'))
+    chunk_file.write(');\n')
+    return len(lines), [len(log_grouping.get_log_lines(log_type)) for log_type in LOG_TYPES]
+
+
+def write_compact_all_log_html(template, input_file_handler, output_path):
+    '''
+    Render a log as a compact html report: the page only has the title of each log grouping
+    and loads the lines of a grouping from <output_path>.chunks/<index>.js when it is opened
+    :param template: jinja2 Template of all_log_compact_template.html
+    :param input_file_handler: iterable of log lines
+    :param output_path: path of the html report
+    '''
+    chunks_dir = output_path + CHUNKS_DIR_SUFFIX
+    shutil.rmtree(chunks_dir, ignore_errors=True)
+    os.makedirs(chunks_dir)
+    log_groupings = []
+    for index, log_grouping in enumerate(iter_log_groupings(input_file_handler)):
+        with open(os.path.join(chunks_dir, '%d.js' % index), 'w', encoding='utf-8') as chunk_file:
+            line_count, level_counts = write_log_chunk(log_grouping, index, chunk_file)
+        log_groupings.append({"title": log_grouping.get_title(), "failed": getattr(log_grouping, 'failed', False),
+                              "lines": line_count, "levels": level_counts})
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        template.stream(log_groupings=log_groupings, log_types=LOG_TYPES,
+                        chunks_dir=os.path.basename(chunks_dir)).dump(output_file)
@@ -0,0 +1,310 @@
+'''
+Helpers to attach files to the allure report
+'''
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from uuid import uuid4
+
+import allure
+from allure_commons.model2 import ATTACHMENT_PATTERN
+from allure_commons.types import AttachmentType
+
+
+def get_allure_reporter(config):
+    '''
+    Return the AllureReporter of the allure-pytest listener, or None if allure is not active
+    :param config: pytest config
+    '''
+    listener = config.pluginmanager.get_plugin("allure_listener")
+    return getattr(listener, "allure_logger", None)
+
+
+def resolve_attachment_type(attachment_type, extension=None):
+    '''
+    :param attachment_type: allure.attachment_type member or mime type
+    :param extension: file extension if attachment_type is a mime type, guessed from it if None
+    :return: (mime type, file extension)
+    '''
+    if isinstance(attachment_type, AttachmentType):
+        return attachment_type.mime_type, attachment_type.extension
+    if extension is None:
+        extension = (mimetypes.guess_extension(attachment_type or '') or '.attach').lstrip('.')
+    return attachment_type, extension
+
+
+def reserve_allure_attachment(config, name, attachment_type, extension=None):
+    '''
+    Attach an empty file to the currently running allure test/step and return
+    the path of that file in the allure results dir, so that the content can be
+    written later (e.g. from a background thread) after the test has finished.
+    :param config: pytest config
+    :param name: attachment name shown in the report
+    :param attachment_type: allure.attachment_type member or mime type
+    :param extension: file extension, default the one of attachment_type
+    :return: path of the attachment file or None if allure is not active
+    '''
+    reporter = get_allure_reporter(config)
+    report_dir = getattr(config.option, "allure_report_dir", None)
+    if reporter is None or not report_dir:
+        return None
+    mime_type, default_extension = resolve_attachment_type(attachment_type)
+    extension = extension or default_extension
+    uuid = str(uuid4())
+    reporter.attach_data(uuid, b"", name=name, attachment_type=mime_type, extension=extension)
+    return os.path.join(report_dir, ATTACHMENT_PATTERN.format(prefix=uuid, ext=extension))
+
+
+def open_attachment(path, mode='w'):
+    '''
+    Open a temporary file next to path; see commit_attachment
+    '''
+    return open(path + ".tmp", mode)
+
+
+def commit_attachment(path):
+    '''
+    Atomically replace path with the temporary file written through open_attachment
+    '''
+    os.replace(path + ".tmp", path)
+
+
+# AttachmentStore used by attach, set by the plugin
+_attachment_store = None
+
+
+def set_attachment_store(store):
+    '''
+    :param store: AttachmentStore used by attach, None attaches through allure.attach
+    '''
+    global _attachment_store
+    _attachment_store = store
+
+
+def get_attachment_store():
+    return _attachment_store
+
+
+def attach(body, name, attachment_type):
+    '''
+    Attach body to the currently running allure test/step through the attachment store,
+    or through allure.attach if there is no store
+    :param body: str or bytes
+    :param name: attachment name shown in the report
+    :param attachment_type: allure.attachment_type member or mime type
+    '''
+    if _attachment_store is None or _attachment_store.attach(body, name, attachment_type) is None:
+        allure.attach(body, name=name, attachment_type=attachment_type)
+
+
+class AttachmentWriter:
+    '''
+    Binary file object hashing the uncompressed content written to it, str is utf-8 encoded
+    '''
+    def __init__(self, raw_file, compress_level=None):
+        self._raw_file = raw_file
+        self._file = raw_file
+        if compress_level is not None:
+            # mtime=0, so that identical content is compressed to identical files
+            self._file = gzip.GzipFile(fileobj=raw_file, mode='wb', compresslevel=compress_level, mtime=0)
+        self._hash = hashlib.sha256()
+        self.size = 0
+        # file name in the allure results dir, set when the attachment is stored
+        self.file_name = None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8', errors='replace')
+        self._hash.update(data)
+        self.size += len(data)
+        self._file.write(data)
+        return len(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        if self._file is not self._raw_file:
+            self._file.close()
+        self._raw_file.close()
+
+
+class AttachmentStore:
+    '''
+    Content-addressed attachments of the allure results dir
+
+    Attachments are streamed to a temporary file while they are hashed and are
+    stored as <sha256>-attachment.<ext>: identical attachments (the same
+    traceback, the same test log ...) are written once and referenced by every
+    test/step attaching them. With compress, they are stored gzip-compressed as
+    <ext>.gz with their original mime type, so a report server mapping .gz to
+    Content-Encoding: gzip (e.g. Apache AddEncoding) serves the original content.
+    '''
+    def __init__(self, config, compress=False, compress_min_size=64 * 1024, compress_level=6):
+        '''
+        :param config: pytest config, allure_report_dir and the allure listener are looked up from it
+        :param compress: gzip-compress the attachments
+        :param compress_min_size: min size in bytes of the attachments compressed by attach and attach_file,
+                                  streamed attachments are always compressed as their size is not known upfront
+        :param compress_level: gzip compression level
+        '''
+        self.config = config
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self.attached = 0
+        self.deduplicated = 0
+        self.bytes_attached = 0
+        self.bytes_written = 0
+        self._unsupported_warned = False
+
+    @property
+    def report_dir(self):
+        return getattr(self.config.option, "allure_report_dir", None)
+
+    def _get_reporter(self):
+        reporter = get_allure_reporter(self.config)
+        if reporter is None or not self.report_dir:
+            return None
+        # the attachment entries are added through the reporter, without the allure hooks writing a file
+        if not hasattr(reporter, "_attach"):
+            if not self._unsupported_warned:
+                self._unsupported_warned = True
+                warnings.warn("The allure reporter has no _attach, this allure-pytest version is not supported "
+                              "by the attachment store, the attachments are written by allure")
+            return None
+        return reporter
+
+    @property
+    def active(self):
+        '''
+        True if allure is active, the attachments are then written by this store
+        '''
+        return self._get_reporter() is not None
+
+    def _store(self, tmp_path, writer, extension):
+        '''
+        Move the temporary file to its content address, or drop it if that content is already stored
+        :return: (digest, file name in the results dir)
+        '''
+        digest = writer.hexdigest()
+        file_name = ATTACHMENT_PATTERN.format(prefix=digest, ext=extension)
+        path = os.path.join(self.report_dir, file_name)
+        with self._lock:
+            self.attached += 1
+            self.bytes_attached += writer.size
+            if os.path.exists(path):
+                self.deduplicated += 1
+                os.remove(tmp_path)
+            else:
+                self.bytes_written += os.path.getsize(tmp_path)
+                os.replace(tmp_path, path)
+        return digest, file_name
+
+    @contextmanager
+    def writer(self, name, attachment_type, extension=None, compress=None):
+        '''
+        Context manager yielding an AttachmentWriter to stream an attachment into. It is stored and
+        attached to the allure test/step running when the block exits, unless the block raises.
+        :param name: attachment name shown in the report
+        :param attachment_type: allure.attachment_type member or mime type
+        :param extension: file extension if attachment_type is a mime type
+        :param compress: False to store uncompressed when compress is set
+        :raise RuntimeError: if allure is not active, see active
+        '''
+        reporter = self._get_reporter()
+        if reporter is None:
+            raise RuntimeError("allure is not active")
+        mime_type, extension = resolve_attachment_type(attachment_type, extension)
+        compress = self.compress and compress is not False
+        if compress:
+            extension += ".gz"
+        raw_file = tempfile.NamedTemporaryFile(dir=self.report_dir, prefix=".attachment-", suffix=".tmp",
+                                               delete=False)
+        writer = AttachmentWriter(raw_file, self.compress_level if compress else None)
+        try:
+            yield writer
+            writer.close()
+        except BaseException:
+            writer.close()
+            os.remove(raw_file.name)
+            raise
+        digest, writer.file_name = self._store(raw_file.name, writer, extension)
+        # the allure file name is <uuid>-attachment.<ext>, the digest takes the place of the uuid
+        reporter._attach(digest, name=name, attachment_type=mime_type, extension=extension)
+
+    def attach(self, body, name, attachment_type, extension=None):
+        '''
+        Attach body to the currently running allure test/step
+        :param body: str or bytes
+        :return: file name of the attachment in the results dir, None if allure is not active
+        '''
+        if not self.active:
+            return None
+        if isinstance(body, str):
+            body = body.encode('utf-8', errors='replace')
+        with self.writer(name, attachment_type, extension,
+                         compress=len(body) >= self.compress_min_size) as writer:
+            writer.write(body)
+        return writer.file_name
+
+    def attach_file(self, source, name, attachment_type, extension=None, chunk_size=1024 * 1024):
+        '''
+        Attach the content of the file source, read in chunks
+        :return: file name of the attachment in the results dir, None if allure is not active
+        '''
+        if not self.active:
+            return None
+        with open(source, 'rb') as source_file, \
+                self.writer(name, attachment_type, extension,
+                            compress=os.path.getsize(source) >= self.compress_min_size) as writer:
+            for chunk in iter(lambda: source_file.read(chunk_size), b''):
+                writer.write(chunk)
+        return writer.file_name
+
+    def reserve(self, name, attachment_type):
+        '''
+        reserve_allure_attachment, with the compressed extension when compress is set
+        '''
+        _, extension = resolve_attachment_type(attachment_type)
+        if self.compress:
+            extension += ".gz"
+        return reserve_allure_attachment(self.config, name, attachment_type, extension)
+
+    def open_reserved(self, path):
+        '''
+        Open an AttachmentWriter on a temporary file to stream the content of a reserved attachment
+        into, gzip-compressed if path ends with .gz; see commit_reserved
+        '''
+        return AttachmentWriter(open(path + ".tmp", 'wb'), self.compress_level if path.endswith(".gz") else None)
+
+    def commit_reserved(self, path, writer):
+        '''
+        Replace the reserved attachment path with the content written through open_reserved.
+        The allure result already references the reserved file name, so it becomes a hard link
+        to the content address: identical attachments share their blocks on disk.
+        '''
+        writer.close()
+        extension = path.rsplit("-attachment.", 1)[-1]
+        _, file_name = self._store(path + ".tmp", writer, extension)
+        content_path = os.path.join(self.report_dir, file_name)
+        try:
+            os.link(content_path, path + ".tmp")
+        except OSError:
+            # no hard links on this file system
+            shutil.copyfile(content_path, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        writer.file_name = os.path.basename(path)
+        return path
+
+    def summary(self):
+        return ("attachments: attached=%s deduplicated=%s bytes attached=%s bytes written=%s" %
+                (self.attached, self.deduplicated, self.bytes_attached, self.bytes_written))
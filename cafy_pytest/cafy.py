@@ -12,6 +12,8 @@ log = CafyLog("cafy_pytest_step")
 import traceback
 import allure
 
+from .attachments import attach
+
 class Cafy:
 
     class Globals: 
@@ -68,7 +70,7 @@ class Cafy:
                         exc_val=exc_val,
                         exc_type=exc_type,
                         exc_tb=exc_tb))
-                    allure.attach(full_traceback, name=f"Exception in {self.title}", attachment_type=allure.attachment_type.TEXT)
+                    attach(full_traceback, name=f"Exception in {self.title}", attachment_type=allure.attachment_type.TEXT)
                     Cafy.RunInfo.active_exceptions.append(exc_val)
                     exception_dict = {
                         'exc_type': exc_type,
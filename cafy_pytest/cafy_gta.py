@@ -4,13 +4,80 @@ import os
 import inspect
 import functools
 import inspect
-import requests
+import itertools
 import json
+import locale
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import warnings
+import pytest
+from tabulate import tabulate
 from utils.cafybase import CafyBase
 from .cafygta_config import CafyGTA_Configs
+from .gta_budget import BUDGET_EVENTS, TimeBudgets, TimeBudgetWarning
+from .gta_context import (NOT_LOCKED, ThreadBuffers, get_concurrency, get_current_test_case,
+                          install_context_propagation, set_current_test_case, uninstall_context_propagation)
+from .gta_monitor import MethodTimer
+from .gta_journal import GtaJournal
+from .gta_stats import CommandStats, TimingStats, histograms_to_dict
+from .gta_upload import DEFAULT_TESTS_PER_BATCH, SPOOL_DIR_NAME, GtaSender, GtaSpool
+
+# attributes of feature lib instances holding the device they configure
+DEVICE_ATTRIBUTES = ('device', 'router', 'uut', 'dut', 'connection', 'handle')
+
 
 class TimeCollectorPlugin:
-    def __init__(self):
+    def __init__(self, backend='patch', max_samples=0, upload_batch_size=DEFAULT_TESTS_PER_BATCH,
+                 upload_attempts=2, upload_timeout=30, upload_compress=False, incremental=False,
+                 thread_aware=False, time_subprocesses=False, time_phases=False, per_device=False,
+                 time_budgets=None, budget_strict=False):
+        '''
+        :param backend: how set/get methods are timed, 'patch' wraps them in the classes,
+                        'monitoring' or 'setprofile' time them with a MethodTimer (see gta_monitor)
+        :param max_samples: number of raw timings kept per testcase and method, 0 keeps none
+        :param upload_batch_size: max testcases per uploaded gta batch
+        :param upload_attempts: attempts per gta batch at the end of the run
+        :param upload_timeout: timeout in seconds of each gta upload request
+        :param upload_compress: upload the gta batches gzip compressed, plain json by default
+        :param incremental: append every finished testcase to cafy_gta.jsonl and release it from memory,
+                            the reports are then built by streaming over that file (see gta_journal)
+        :param thread_aware: propagate the testcase to the threads and executor tasks it starts, time
+                             asyncio sleeps/waits and report per thread busy time, wall and overlap time
+        :param time_subprocesses: time the subprocess.Popen processes (subprocess.run, check_output ...)
+                                  and os.system commands run by the testcases in the exc_command event
+        :param time_phases: time the setup, call and teardown phases and the fixtures of the testcases
+        :param per_device: also time the set/get methods per topology device of the call in the device
+                           event (patch backend only) and print a per device summary table
+        :param time_budgets: TimeBudgets of the run (budget file), the time_budget markers are checked without it
+        :param budget_strict: fail the testcases exceeding their time budget at teardown instead of warning
+        '''
+        self.time_budgets = time_budgets if time_budgets is not None else TimeBudgets()
+        self.budget_strict = budget_strict
+        self.budget_violations = []
+        self.per_device = per_device
+        self.time_phases = time_phases
+        self.fixture_teardown_starts = dict()
+        self.time_subprocesses = time_subprocesses
+        self.subprocess_timing_installed = False
+        self.original_subprocess_functions = dict()
+        self.in_test = False
+        self.thread_aware = thread_aware
+        self.thread_aware_installed = False
+        self.original_asyncio_waits = dict()
+        self.main_thread_ident = threading.get_ident()
+        self.thread_buffers = ThreadBuffers()
+        self.incremental = incremental
+        self.gta_journal = None
+        self.max_samples = max_samples
+        self.upload_batch_size = upload_batch_size
+        self.upload_attempts = upload_attempts
+        self.upload_timeout = upload_timeout
+        self.upload_compress = upload_compress
+        self.method_timer = MethodTimer(backend) if backend != 'patch' else None
+        self.tracked_modules = set()
         self.original_sleep = time.sleep
         self.granular_time_testcase_dict = dict()
         self.test_case_name = None
@@ -20,29 +87,84 @@ class TimeCollectorPlugin:
         self.total_exc_command_time = 0
         self.command_list = ['set_command','get_command','sleep','exc_command']
 
-    def update_granular_time_testcase_dict(self, current_test, event, method_name, elapsed_time, feature_type):
+    def current_test(self):
+        """
+        Test case of the running thread/asyncio task, the one which started it for worker threads
+        """
+        return get_current_test_case(self.test_case_name)
+
+    def update_granular_time_testcase_dict(self, current_test, event, method_name, elapsed_time, feature_type, start_time=None):
         """
         granular_time_testcase_dict
+        Other threads than the main one record into their own buffer, merged at teardown (merge_thread_data)
         param current_test: current_test
         param event: command like set , get or time.sleep
         param method_name: method name
         param elapsed_time: total time for each command ie, set or get
         param feature_type: infra or non-infra
+        param start_time: time.perf_counter() at the start, to compute wall and overlap time when thread aware
         """
-        if current_test not in self.granular_time_testcase_dict:
-            self.granular_time_testcase_dict[current_test] = dict()
-        if event not in self.granular_time_testcase_dict[current_test]:
-            self.granular_time_testcase_dict[current_test][event] = dict()
-        if method_name not in self.granular_time_testcase_dict[current_test][event]:
-            self.granular_time_testcase_dict[current_test][event][method_name] = list()
-        self.granular_time_testcase_dict[current_test][event][method_name].append([float(elapsed_time),feature_type])
-    
+        with self.recording_lock():
+            stats = self.get_timing_stats(current_test, event, method_name, feature_type)
+            stats.add(float(elapsed_time))
+            if start_time is not None and self.thread_aware:
+                self.thread_buffers.get().add_interval(current_test, start_time, start_time + elapsed_time / 1000000)
+
+    def recording_lock(self):
+        """
+        Lock held while the current thread records a timing: the lock of its ThreadBuffer for other threads
+        than the main one, as the teardown of the testcase pops their buffers while they may still record
+        """
+        if threading.get_ident() == self.main_thread_ident:
+            return NOT_LOCKED
+        return self.thread_buffers.get().lock
+
+    def get_timing_stats(self, current_test, event, method_name, feature_type, stats_class=TimingStats):
+        """
+        Get or create the timings record of a method, in the buffer of the current thread for other threads than the main one
+        param stats_class: TimingStats or CommandStats
+        """
+        if threading.get_ident() == self.main_thread_ident:
+            granular = self.granular_time_testcase_dict
+        else:
+            granular = self.thread_buffers.get().granular
+        test_events = granular.get(current_test)
+        if test_events is None:
+            test_events = granular[current_test] = dict()
+        methods = test_events.get(event)
+        if methods is None:
+            methods = test_events[event] = dict()
+        stats = methods.get(method_name)
+        if stats is None:
+            stats = methods[method_name] = stats_class(feature_type, self.max_samples)
+        return stats
+
+    def update_exc_command(self, current_test, method_name, elapsed_time, feature_type, start_time, exit_code, output_bytes=None):
+        """
+        Record an external command in the exc_command event
+        param method_name: caller and command, e.g. Class.method.subprocess.scp
+        param elapsed_time: duration of the command in microseconds
+        param exit_code: exit code of the command
+        param output_bytes: size of the captured output, None if not captured
+        """
+        with self.recording_lock():
+            stats = self.get_timing_stats(current_test, 'exc_command', method_name, feature_type, CommandStats)
+            stats.add_command(float(elapsed_time), exit_code, output_bytes)
+            if self.thread_aware:
+                self.thread_buffers.get().add_interval(current_test, start_time, start_time + elapsed_time / 1000000)
+
     def get_method_type(self,method):
         '''
         method get_method_type
         param method : method 
         '''
-        file_path = method.__code__.co_filename
+        return self.get_file_type(method.__code__.co_filename)
+
+    def get_file_type(self, file_path):
+        '''
+        method get_file_type
+        param file_path : source file of a method
+        '''
         feature_type = None
         if file_path:
             feature_type = "non-infra" if "lib/feature_lib" in file_path or "lib/hw" in file_path else "infra"
@@ -60,44 +182,320 @@ class TimeCollectorPlugin:
             start_time = time.perf_counter()
             result = method(*args, **kwargs)
             end_time = time.perf_counter()
-            elapsed_time_seconds = end_time - start_time
-            elapsed_time_microseconds = elapsed_time_seconds * 1000000
-            elapsed_time = '%.2f' % (elapsed_time_microseconds)
+            elapsed_time = (end_time - start_time) * 1000000
             # Update granular time at the test case level
-            current_test = self.test_case_name
-            if current_test not in self.granular_time_testcase_dict:
-                self.granular_time_testcase_dict[current_test] = dict()
+            current_test = self.current_test()
             method_name = method.__name__
             feature_type = self.get_method_type(method)
             if method_name.startswith('set'):
-                self.update_granular_time_testcase_dict(current_test,'set_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type)
+                self.update_granular_time_testcase_dict(current_test,'set_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type, start_time)
             elif method_name.startswith('get'):
-                self.update_granular_time_testcase_dict(current_test, 'get_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type)
+                self.update_granular_time_testcase_dict(current_test, 'get_command', ".".join([cls_name, method.__name__]), elapsed_time, feature_type, start_time)
+            if self.per_device:
+                device_name = self.get_call_device_name(args, kwargs)
+                if device_name is not None:
+                    self.update_granular_time_testcase_dict(current_test, 'device', device_name, elapsed_time, 'device')
             return result
         return wrapper
 
+    def get_device_name(self, obj):
+        '''
+        Name of a topology device (an object with an is_connected method, as in the topology of cafykit)
+        return : device name or None if obj is not a device
+        '''
+        if obj is None or isinstance(obj, (str, bytes, int, float, bool, dict, list, tuple, set)):
+            return None
+        if not callable(getattr(obj, 'is_connected', None)):
+            return None
+        for attribute in ('name', 'hostname', 'alias'):
+            name = getattr(obj, attribute, None)
+            if isinstance(name, str) and name:
+                return name
+        return None
+
+    def get_call_device_name(self, args, kwargs):
+        '''
+        Device of a set/get call: the bound instance, its device/connection attribute,
+        or the first device passed as argument
+        param args: positional arguments of the call, the bound instance first
+        param kwargs: keyword arguments of the call
+        return : device name or None
+        '''
+        if args:
+            device_name = self.get_device_name(args[0])
+            if device_name is not None:
+                return device_name
+            for attribute in DEVICE_ATTRIBUTES:
+                device_name = self.get_device_name(getattr(args[0], attribute, None))
+                if device_name is not None:
+                    return device_name
+        for arg in itertools.chain(args[1:], kwargs.values()):
+            device_name = self.get_device_name(arg)
+            if device_name is not None:
+                return device_name
+        return None
+
+    def get_caller_source(self, caller_frame):
+        '''
+        Name and feature type of the caller of a sleep or wait
+        param caller_frame: frame of the caller
+        return : ('Class.method' for methods or 'module.function' for functions, feature type)
+        '''
+        caller_method_name = caller_frame.f_code.co_name
+        caller_self = caller_frame.f_locals.get('self')
+        if caller_self is not None:
+            caller_class = caller_self.__class__
+            # Get the method of the caller's class
+            caller_method = getattr(caller_class, caller_method_name, None)
+            if caller_method is not None and hasattr(caller_method, '__code__'):
+                return ".".join([caller_class.__name__, caller_method.__name__]), self.get_method_type(caller_method)
+        module_name = caller_frame.f_globals.get('__name__', '')
+        return ".".join([module_name, caller_method_name]), self.get_file_type(caller_frame.f_code.co_filename)
+
     def measure_sleep_time(self, duration):
         '''
         Method measure_sleep_time : it will measure the actual time taken by testcase method during sleep
         param duration: duration or sleep time declared in TC fucntion's
         return : Update the graunular time at test case level
         '''
-        caller_frame = inspect.currentframe().f_back
-        caller_method_name = caller_frame.f_code.co_name
-        caller_class = caller_frame.f_locals.get('self').__class__
-        # Get the method of the caller's class
-        if caller_class is not None:
-            caller_method = getattr(caller_class, caller_method_name, None)
-            if caller_method is not None:
-                current_test = self.test_case_name
-                start_time = time.perf_counter()
-                self.original_sleep(duration)
-                end_time = time.perf_counter()
-                elapsed_time_seconds = end_time - start_time
-                elapsed_time_microseconds = elapsed_time_seconds * 1000000
-                elapsed_time = '%.2f' % (elapsed_time_microseconds)
-                feature_type = self.get_method_type(caller_method)
-                self.update_granular_time_testcase_dict(current_test, "sleep", ".".join([caller_class.__name__, caller_method.__name__,"time.sleep"]), elapsed_time, feature_type)
+        source, feature_type = self.get_caller_source(inspect.currentframe().f_back)
+        start_time = time.perf_counter()
+        self.original_sleep(duration)
+        end_time = time.perf_counter()
+        elapsed_time = (end_time - start_time) * 1000000
+        self.update_granular_time_testcase_dict(self.current_test(), "sleep", ".".join([source, "time.sleep"]), elapsed_time, feature_type, start_time)
+
+    def measure_asyncio_wait(self, original, wait_name):
+        '''
+        Wrap asyncio.sleep, asyncio.wait or asyncio.wait_for to time the awaiting in the sleep event
+        param original: the asyncio function
+        param wait_name: e.g. asyncio.sleep
+        '''
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            source, feature_type = self.get_caller_source(sys._getframe(1))
+            return self.timed_wait(original(*args, **kwargs), ".".join([source, wait_name]), feature_type)
+        return wrapper
+
+    async def timed_wait(self, awaitable, source, feature_type):
+        start_time = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            elapsed_time = (time.perf_counter() - start_time) * 1000000
+            self.update_granular_time_testcase_dict(self.current_test(), "sleep", source, elapsed_time, feature_type, start_time)
+
+    def install_thread_aware_timing(self):
+        '''
+        Propagate the testcase into threads and executors and time asyncio sleeps/waits
+        '''
+        if self.thread_aware_installed:
+            return
+        import asyncio
+        install_context_propagation()
+        for name in ('sleep', 'wait', 'wait_for'):
+            original = getattr(asyncio, name)
+            self.original_asyncio_waits[name] = original
+            setattr(asyncio, name, self.measure_asyncio_wait(original, "asyncio." + name))
+        self.thread_aware_installed = True
+
+    def uninstall_thread_aware_timing(self):
+        if not self.thread_aware_installed:
+            return
+        import asyncio
+        uninstall_context_propagation()
+        for name, original in self.original_asyncio_waits.items():
+            setattr(asyncio, name, original)
+        self.thread_aware_installed = False
+
+    def get_command_name(self, args):
+        '''
+        Name of the program of a command, e.g. scp for ['/usr/bin/scp', ...] or 'scp -r a b'
+        param args: Popen args or os.system command
+        '''
+        if isinstance(args, (str, bytes)):
+            if isinstance(args, bytes):
+                args = args.decode(errors='replace')
+            try:
+                args = shlex.split(args)
+            except ValueError:
+                args = args.split()
+        elif isinstance(args, os.PathLike):
+            args = [args]
+        else:
+            args = list(args)
+        if not args:
+            return ''
+        program = args[0]
+        if isinstance(program, bytes):
+            program = program.decode(errors='replace')
+        return os.path.basename(os.fspath(program))
+
+    def get_command_caller_frame(self):
+        '''
+        First frame outside of subprocess, os and this module
+        '''
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_globals.get('__name__') in ('subprocess', 'os', __name__):
+            frame = frame.f_back
+        return frame
+
+    def install_subprocess_timing(self):
+        '''
+        Wrap subprocess.Popen (used by subprocess.run, call, check_output ...) and os.system
+        to time the external commands in the exc_command event
+        '''
+        if self.subprocess_timing_installed:
+            return
+        popen = subprocess.Popen
+        self.original_subprocess_functions = {
+            (popen, '__init__'): popen.__init__,
+            (popen, 'wait'): popen.wait,
+            (popen, 'communicate'): popen.communicate,
+            (popen, 'poll'): popen.poll,
+            (os, 'system'): os.system,
+        }
+        original_init, original_wait = popen.__init__, popen.wait
+        original_communicate, original_poll = popen.communicate, popen.poll
+        original_system = os.system
+        plugin = self
+
+        @functools.wraps(original_init)
+        def init(process, *args, **kwargs):
+            original_init(process, *args, **kwargs)
+            if plugin.in_test:
+                source, feature_type = plugin.get_caller_source(plugin.get_command_caller_frame())
+                process._cafy_gta = (time.perf_counter(), plugin.current_test(), ".".join(
+                    [source, "subprocess", plugin.get_command_name(process.args)]), feature_type)
+
+        @functools.wraps(original_wait)
+        def wait(process, *args, **kwargs):
+            returncode = original_wait(process, *args, **kwargs)
+            if not getattr(process, '_cafy_gta_communicating', False):
+                plugin.record_process(process)
+            return returncode
+
+        @functools.wraps(original_poll)
+        def poll(process, *args, **kwargs):
+            returncode = original_poll(process, *args, **kwargs)
+            if returncode is not None and not getattr(process, '_cafy_gta_communicating', False):
+                plugin.record_process(process)
+            return returncode
+
+        @functools.wraps(original_communicate)
+        def communicate(process, *args, **kwargs):
+            # communicate waits for the process itself, record it once with its output
+            process._cafy_gta_communicating = True
+            try:
+                stdout, stderr = original_communicate(process, *args, **kwargs)
+            finally:
+                process._cafy_gta_communicating = False
+            plugin.record_process(process, plugin.get_output_size(process, stdout, stderr))
+            return stdout, stderr
+
+        @functools.wraps(original_system)
+        def system(command):
+            if not plugin.in_test:
+                return original_system(command)
+            source, feature_type = plugin.get_caller_source(sys._getframe(1))
+            start_time = time.perf_counter()
+            status = original_system(command)
+            elapsed_time = (time.perf_counter() - start_time) * 1000000
+            exit_code = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+            plugin.update_exc_command(plugin.current_test(), ".".join([source, "os.system", plugin.get_command_name(command)]),
+                                      elapsed_time, feature_type, start_time, exit_code)
+            return status
+
+        popen.__init__, popen.wait, popen.communicate, popen.poll = init, wait, communicate, poll
+        os.system = system
+        self.subprocess_timing_installed = True
+
+    def uninstall_subprocess_timing(self):
+        if not self.subprocess_timing_installed:
+            return
+        for (owner, name), original in self.original_subprocess_functions.items():
+            setattr(owner, name, original)
+        self.subprocess_timing_installed = False
+
+    def get_output_size(self, process, *outputs):
+        '''
+        Size in bytes of the output returned by communicate, text mode output is encoded back
+        with the encoding it was decoded with
+        param outputs: stdout, stderr, None if not captured
+        '''
+        size = 0
+        for output in outputs:
+            if isinstance(output, str):
+                output = output.encode(getattr(process, 'encoding', None) or locale.getpreferredencoding(False),
+                                       getattr(process, 'errors', None) or 'strict')
+            size += len(output or b'')
+        return size
+
+    def record_process(self, process, output_bytes=None):
+        '''
+        Record a finished subprocess.Popen process once in the exc_command event
+        param output_bytes: size of the output returned by communicate, None if not captured
+        '''
+        info = getattr(process, '_cafy_gta', None)
+        if info is None or process.returncode is None:
+            return
+        del process._cafy_gta
+        start_time, current_test, method_name, feature_type = info
+        elapsed_time = (time.perf_counter() - start_time) * 1000000
+        self.update_exc_command(current_test, method_name, elapsed_time, feature_type, start_time,
+                                process.returncode, output_bytes)
+
+    def merge_thread_data(self, current_test):
+        '''
+        Merge the gta data recorded by other threads for a test case and, when thread aware,
+        add its per thread busy time and its wall and overlap time
+        param current_test: test case name
+        '''
+        popped = self.thread_buffers.pop_granular(current_test)
+        lanes = self.thread_buffers.pop_intervals(current_test)
+        if not popped and not lanes:
+            return
+        test_events = self.granular_time_testcase_dict.setdefault(current_test, dict())
+        for events in popped:
+            for event, methods in events.items():
+                test_methods = test_events.setdefault(event, dict())
+                for method_name, stats in methods.items():
+                    if method_name in test_methods:
+                        test_methods[method_name].merge(stats)
+                    else:
+                        test_methods[method_name] = stats
+        if lanes:
+            threads, wall, overlap = get_concurrency(lanes)
+            if len(threads) > 1 or overlap > 0:
+                test_events['threads'] = {thread_name: [busy * 1000000, count]
+                                          for thread_name, (busy, count) in threads.items()}
+                test_events['concurrency'] = {'wall': wall * 1000000, 'overlap': overlap * 1000000}
+
+    def iter_set_or_get_methods(self, module):
+        """
+        Yield the set/get methods of the classes of a test module which are timed
+        param module: module of the test case class
+        Yields: (class name, class, method name, method)
+        """
+        for class_name, class_obj in inspect.getmembers(module, inspect.isclass):
+            # Iterate over the attributes of the class
+            for method_name, method in inspect.getmembers(class_obj, inspect.isfunction):
+                # Check if the attribute is callable and its name starts with 'set'
+                if callable(method) and method_name.startswith('set') or method_name.startswith('get') :
+                    #skipping appyling timer on setup method of testclass
+                    if method_name == 'setup_method':
+                        continue
+                    else:
+                        original_method = getattr(class_obj, method_name)
+                        # if method is non-infra and method belong to cafykit/lib/feature_lib or cafykit/lib/hw and ends with base.py,
+                        # then applying decorator for collecting time on  get and set methods of non-infra methods
+                        # else  if method is infra then applying decorator for collecting time on  get and set methods of infra methods
+                        file_path = original_method.__code__.co_filename
+                        if 'lib/feature_lib' in file_path or 'lib/hw' in file_path:
+                            if issubclass(class_obj, CafyBase):
+                                yield class_name, class_obj, method_name, original_method
+                        elif 'lib' in file_path:
+                            yield class_name, class_obj, method_name, original_method
 
     def patch_set_or_get_methods_for_test_instance(self, item):
         """
@@ -113,28 +511,40 @@ class TimeCollectorPlugin:
         if test_case_class:
             # Get the module of the test case class
             module = inspect.getmodule(test_case_class)
-            for class_name, class_obj in inspect.getmembers(module, inspect.isclass):
-                # Iterate over the attributes of the class
-                for method_name, method in inspect.getmembers(class_obj, inspect.isfunction):
-                    # Check if the attribute is callable and its name starts with 'set'
-                    if callable(method) and method_name.startswith('set') or method_name.startswith('get') :
-                        #skipping appyling timer on setup method of testclass
-                        if method_name == 'setup_method':
-                            continue
-                        else:
-                            original_method = getattr(class_obj, method_name)
-                            # if method is non-infra and method belong to cafykit/lib/feature_lib or cafykit/lib/hw and ends with base.py,
-                            # then applying decorator for collecting time on  get and set methods of non-infra methods
-                            # else  if method is infra then applying decorator for collecting time on  get and set methods of infra methods
-                            file_path = original_method.__code__.co_filename
-                            if 'lib/feature_lib' in file_path or 'lib/hw' in file_path:
-                                if issubclass(class_obj, CafyBase):
-                                    setattr(class_obj, method_name, self.measure_time_for_set_or_get_methods(original_method,class_name))
-                            elif 'lib' in file_path:
-                                setattr(class_obj, method_name, self.measure_time_for_set_or_get_methods(original_method,class_name))
+            for class_name, class_obj, method_name, original_method in self.iter_set_or_get_methods(module):
+                setattr(class_obj, method_name, self.measure_time_for_set_or_get_methods(original_method,class_name))
         if item.cls is not None:
             setattr(item.cls, '_decorated', True)
 
+    def track_set_or_get_methods_for_test_instance(self, item):
+        """
+        Register the set/get methods of the test module with the method timer, without modifying the classes
+        param item: test case item
+        """
+        test_case_class = item.cls
+        if test_case_class is None:
+            return
+        module = inspect.getmodule(test_case_class)
+        if module in self.tracked_modules:
+            return
+        self.tracked_modules.add(module)
+        for class_name, class_obj, method_name, method in self.iter_set_or_get_methods(module):
+            event = 'set_command' if method_name.startswith('set') else 'get_command'
+            self.method_timer.track(method.__code__, event, ".".join([class_name, method_name]),
+                                    self.get_method_type(method))
+
+    def flush_method_timer(self, test_case_name=None):
+        """
+        Move the timings recorded by the method timer into granular_time_testcase_dict
+        and record the following calls for test_case_name
+        param test_case_name: name of the next test case
+        """
+        current_test, timings = self.method_timer.begin(test_case_name)
+        methods = self.method_timer.methods
+        for method_id, elapsed_time in timings:
+            event, source, feature_type = methods[method_id]
+            self.update_granular_time_testcase_dict(current_test, event, source, elapsed_time, feature_type)
+
     def pytest_runtest_protocol(self, item, nextitem):
         '''
         Method pytest_runtest_protocol : it will Monkey patch sleep , subprocess run etc
@@ -145,8 +555,17 @@ class TimeCollectorPlugin:
         '''
         # Monkey patch time.sleep
         time.sleep = self.measure_sleep_time
-        # Monkey patch 'set' methods for all classes in the module
-        self.patch_set_or_get_methods_for_test_instance(item)
+        if self.thread_aware:
+            self.install_thread_aware_timing()
+        if self.time_subprocesses:
+            self.install_subprocess_timing()
+        self.in_test = True
+        if self.method_timer is not None:
+            self.method_timer.start()
+            self.track_set_or_get_methods_for_test_instance(item)
+        else:
+            # Monkey patch 'set' methods for all classes in the module
+            self.patch_set_or_get_methods_for_test_instance(item)
         # get class name of the test case method
         base_class_name = ""
         if item.cls:
@@ -157,6 +576,9 @@ class TimeCollectorPlugin:
             self.test_case_name = f"{base_class_name}.{item.name}"
         else:
             self.test_case_name = f"{item.name}"
+        set_current_test_case(self.test_case_name)
+        if self.method_timer is not None:
+            self.flush_method_timer(self.test_case_name)
         return None
     
     def update_gta_dict(self,current_test, command):
@@ -182,6 +604,66 @@ class TimeCollectorPlugin:
         for command in self.command_list:
             self.update_gta_dict(current_test,command)
 
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        start_time = time.perf_counter()
+        yield
+        if self.time_phases:
+            self.update_phase_time('setup', start_time)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        start_time = time.perf_counter()
+        yield
+        if self.time_phases:
+            self.update_phase_time('call', start_time)
+
+    def update_phase_time(self, phase, start_time):
+        '''
+        Record the duration of a phase (setup, call or teardown) of the current test in the phase event
+        '''
+        elapsed_time = (time.perf_counter() - start_time) * 1000000
+        self.update_granular_time_testcase_dict(self.test_case_name, 'phase', phase, elapsed_time, 'phase')
+
+    def get_fixture_name(self, fixturedef):
+        '''
+        Fixture name with its scope, e.g. enable_collection[module]
+        the xunit setup_method/setup_class fixtures of pytest are named after their class
+        '''
+        name = fixturedef.argname
+        xunit_fixture = re.match(r'_xunit_setup_(\w+?)_fixture_(.+)$', name)
+        if xunit_fixture:
+            name = "%s.setup_%s" % (xunit_fixture.group(2), xunit_fixture.group(1))
+        return "%s[%s]" % (name, fixturedef.scope)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        if not self.time_phases:
+            yield
+            return
+        start_time = time.perf_counter()
+        yield
+        elapsed_time = (time.perf_counter() - start_time) * 1000000
+        self.update_granular_time_testcase_dict(self.test_case_name, 'fixture',
+                                                self.get_fixture_name(fixturedef) + ".setup",
+                                                elapsed_time, 'fixture')
+        # finalizers run last in first out: this one runs before the teardown of the fixture,
+        # pytest_fixture_post_finalizer after it
+        fixturedef.addfinalizer(functools.partial(self.start_fixture_teardown, fixturedef))
+
+    def start_fixture_teardown(self, fixturedef):
+        self.fixture_teardown_starts[fixturedef] = time.perf_counter()
+
+    def pytest_fixture_post_finalizer(self, fixturedef, request):
+        start_time = self.fixture_teardown_starts.pop(fixturedef, None)
+        if start_time is None:
+            return
+        elapsed_time = (time.perf_counter() - start_time) * 1000000
+        self.update_granular_time_testcase_dict(self.test_case_name, 'fixture',
+                                                self.get_fixture_name(fixturedef) + ".teardown",
+                                                elapsed_time, 'fixture')
+
+    @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_teardown(self, item, nextitem):
         """
         Execute teardown actions after a test has been executed
@@ -192,20 +674,138 @@ class TimeCollectorPlugin:
         current_test = self.test_case_name
         self.update_CafyLog_gta_dict(current_test)
         CafyLog.gta_dict = {}
+        start_time = time.perf_counter()
+        outcome = yield
+        self.in_test = False
+        if self.time_phases:
+            self.update_phase_time('teardown', start_time)
+        self.merge_thread_data(current_test)
+        budget = self.get_time_budget(item, current_test)
+        if self.method_timer is not None and (self.incremental or budget):
+            # after the fixture teardowns, so their set/get calls are included
+            self.flush_method_timer(current_test)
+        failure = self.check_time_budget(current_test, budget) if budget else None
+        if self.incremental:
+            self.flush_test_to_journal(current_test)
+        if failure is not None:
+            if hasattr(outcome, 'force_exception'):
+                outcome.force_exception(failure)
+            else:
+                raise failure
+
+    def get_time_budget(self, item, current_test):
+        '''
+        Budget of a test from its time_budget marker and the budget file
+        :return: dict of budget key -> seconds, empty if the test has none
+        '''
+        if item is None:
+            return self.time_budgets.get_budget(current_test)
+        return self.time_budgets.get_budget(current_test, item.nodeid, item.get_closest_marker('time_budget'))
+
+    def get_event_time(self, events):
+        '''
+        Time of a test per event, from its live gta data
+        :param events: gta data of the test, event -> method -> timings
+        :return: dict of event -> seconds and total -> seconds
+        '''
+        usage = dict()
+        for event in BUDGET_EVENTS:
+            event_time = 0
+            for timings in events.get(event, {}).values():
+                if isinstance(timings, TimingStats):
+                    event_time = event_time + timings.total
+                elif isinstance(timings, list):
+                    event_time = event_time + sum(sublist[0] for sublist in timings)
+            usage[event] = event_time / 1000000
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def check_time_budget(self, current_test, budget):
+        '''
+        Compare the gta data accumulated by a test with its budget, warn about the exceeded budgets
+        :return: exception failing the test in strict mode, None otherwise
+        '''
+        exceeded = self.time_budgets.check(budget, self.get_event_time(self.granular_time_testcase_dict.get(current_test, {})))
+        if not exceeded:
+            return None
+        message = "%s exceeded its time budget: %s" % (current_test, ", ".join(
+            "%s %.2fs > %.2fs" % (key, used, allowed) for key, used, allowed in exceeded))
+        self.budget_violations.extend((current_test, key, used, allowed) for key, used, allowed in exceeded)
+        if self.budget_strict:
+            return pytest.fail.Exception(message, pytrace=False)
+        warnings.warn(TimeBudgetWarning(message))
+        return None
+
+    def flush_test_to_journal(self, current_test):
+        """
+        Append the gta data of a test to cafy_gta.jsonl and release it
+        :param current_test: test case name
+        """
+        events = self.granular_time_testcase_dict.pop(current_test, None)
+        if events is None:
+            return
+        if self.gta_journal is None:
+            self.gta_journal = GtaJournal(os.path.join(CafyLog.work_dir, 'cafy_gta.jsonl'))
+        journal_events = dict()
+        for event, methods in events.items():
+            journal_events[event] = dict()
+            for method, timings in methods.items():
+                if isinstance(timings, TimingStats):
+                    journal_events[event][method] = {"stats": timings.to_dict()}
+                else:
+                    journal_events[event][method] = {"value": timings}
+        self.gta_journal.append(current_test, journal_events)
+
+    def get_events_from_journal(self, records):
+        """
+        Merge the journal records of a test back into granular_time_testcase_dict format
+        :param records: events of the records of one test, see GtaJournal.read
+        :return: dict of event -> method -> TimingStats or raw value
+        """
+        events = dict()
+        for journal_events in records:
+            for event, methods in journal_events.items():
+                event_methods = events.setdefault(event, dict())
+                for method, timings in methods.items():
+                    if "stats" in timings:
+                        stats_class = CommandStats if "exit_codes" in timings["stats"] else TimingStats
+                        stats = stats_class.from_dict(timings["stats"])
+                        if isinstance(event_methods.get(method), TimingStats):
+                            event_methods[method].merge(stats)
+                        else:
+                            event_methods[method] = stats
+                    else:
+                        # like update_gta_dict, the CafyLog.gta_dict data of a later run replaces the earlier one
+                        event_methods[method] = timings["value"]
+        return events
+
+    def iter_journal_gta_data(self):
+        """
+        Yields (test case name, transformed gta data, events) per test of the journal, in run order
+        """
+        for test_case, offsets in self.gta_journal.index().items():
+            events = self.get_events_from_journal(self.gta_journal.read(offsets))
+            time_report = {test_case: self.get_test_time_report(events)}
+            yield test_case, self.get_tranformed_gta_data(time_report)[test_case], events
 
     def get_time_data(self,data, event):
         '''
         get time data
-        this method will take the timings list for each sleep_time , set_command or get_command 
+        this method will take the timings for each sleep_time , set_command or get_command 
         and it will club into as sum and occurence
-        param data : timings data
+        param data : timings data, TimingStats or list of [time, feature_type] per command
         '''
         tmp_dict = {}
         for command, timings_list in data.items():
-            if isinstance(timings_list, list):
-                total_sum = sum(sublist[0] for sublist in timings_list)
-                length = len(timings_list)
-                feature_type = timings_list[0][1]
+            if isinstance(timings_list, (list, TimingStats)):
+                if isinstance(timings_list, TimingStats):
+                    total_sum = timings_list.total
+                    length = timings_list.count
+                    feature_type = timings_list.feature_type
+                else:
+                    total_sum = sum(sublist[0] for sublist in timings_list)
+                    length = len(timings_list)
+                    feature_type = timings_list[0][1]
                 if event == 'sleep':
                     self.total_sleep_time = self.total_sleep_time + total_sum
                 elif event == 'set_command':
@@ -215,6 +815,8 @@ class TimeCollectorPlugin:
                 elif event == 'exc_command':
                     self.total_exc_command_time = self.total_exc_command_time + total_sum
                 tmp_dict[command] = ["{:.2f}".format(total_sum), length, feature_type]
+                if isinstance(timings_list, TimingStats):
+                    tmp_dict[command].append(timings_list.latency())
             else:
                 tmp_dict[command] = timings_list
         return tmp_dict
@@ -226,59 +828,78 @@ class TimeCollectorPlugin:
         '''
         time_report = dict()
         for test_case, events in self.granular_time_testcase_dict.items():
-            time_report[test_case] = dict()
-            if 'sleep' in events:
-                time_report[test_case]['sleep'] = self.get_time_data(events["sleep"],'sleep')
-            else:
-                time_report[test_case]['sleep'] =  dict()
-            if 'set_command' in events:
-                time_report[test_case]['set_command'] = self.get_time_data(events["set_command"],'set_command')
-            else:
-                time_report[test_case]['set_command'] = dict()
-            if 'get_command' in events:
-                time_report[test_case]['get_command'] = self.get_time_data(events["get_command"],'get_command')
-            else:
-                time_report[test_case]['get_command'] = dict()
-            if 'exc_command' in events:
-                time_report[test_case]['exc_command'] = self.get_time_data(events["exc_command"],'exc_command')
-            else:
-                time_report[test_case]['exc_command'] = dict()
-
-
-
-            time_report[test_case]['total_sleep_time'] = "{:.2f}".format(self.total_sleep_time)
-            time_report[test_case]['total_set_command_time'] = "{:.2f}".format(self.total_set_command_time)
-            time_report[test_case]['total_get_command_time'] = "{:.2f}".format(self.total_get_command_time)
-            time_report[test_case]['total_exc_command_time'] = "{:.2f}".format(self.total_exc_command_time)
-            time_report[test_case]['total_time'] = "{:.2f}".format(self.total_sleep_time+self.total_set_command_time+self.total_get_command_time+self.total_exc_command_time)
-            self.total_sleep_time = 0
-            self.total_set_command_time = 0
-            self.total_get_command_time = 0
-            self.total_exc_command_time = 0
+            time_report[test_case] = self.get_test_time_report(events)
         return time_report
     
+    def get_test_time_report(self, events):
+        '''
+        get_test_time_report
+        :param events: gta data of one test case, event -> method -> timings
+        :return: time report of the test case
+        '''
+        test_report = dict()
+        for event in ('sleep', 'set_command', 'get_command', 'exc_command'):
+            if event in events:
+                test_report[event] = self.get_time_data(events[event], event)
+            else:
+                test_report[event] = dict()
+        test_report['total_sleep_time'] = "{:.2f}".format(self.total_sleep_time)
+        test_report['total_set_command_time'] = "{:.2f}".format(self.total_set_command_time)
+        test_report['total_get_command_time'] = "{:.2f}".format(self.total_get_command_time)
+        test_report['total_exc_command_time'] = "{:.2f}".format(self.total_exc_command_time)
+        test_report['total_time'] = "{:.2f}".format(self.total_sleep_time+self.total_set_command_time+self.total_get_command_time+self.total_exc_command_time)
+        if 'threads' in events:
+            # busy time and number of timings per thread
+            test_report['threads'] = {thread_name: ["{:.2f}".format(busy), count, 'thread']
+                                      for thread_name, (busy, count) in events['threads'].items()}
+        if 'concurrency' in events:
+            test_report['total_wall_time'] = "{:.2f}".format(events['concurrency']['wall'])
+            test_report['total_overlap_time'] = "{:.2f}".format(events['concurrency']['overlap'])
+        if 'device' in events:
+            test_report['device'] = self.get_time_data(events['device'], 'device')
+        if 'phase' in events or 'fixture' in events:
+            event_time = self.total_sleep_time+self.total_set_command_time+self.total_get_command_time+self.total_exc_command_time
+            phase_time = fixture_time = 0
+            for phase in ('setup', 'call', 'teardown'):
+                timings = events.get('phase', {}).get(phase)
+                phase_total = timings.total if timings is not None else 0
+                test_report['total_%s_time' % phase] = "{:.2f}".format(phase_total)
+                phase_time = phase_time + phase_total
+            test_report['phase'] = self.get_time_data(events.get('phase', {}), 'phase')
+            test_report['fixture'] = self.get_time_data(events.get('fixture', {}), 'fixture')
+            for timings in events.get('fixture', {}).values():
+                fixture_time = fixture_time + timings.total
+            test_report['total_fixture_time'] = "{:.2f}".format(fixture_time)
+            # phase time spent outside of the fixtures and timed events, a lower bound as
+            # the events of the fixtures are counted in both
+            test_report['total_unattributed_time'] = "{:.2f}".format(max(0, phase_time - fixture_time - event_time))
+        self.total_sleep_time = 0
+        self.total_set_command_time = 0
+        self.total_get_command_time = 0
+        self.total_exc_command_time = 0
+        return test_report
+
     def add_gta_data_into_db(self, time_report,aggregated_gta_data,run_id='local_run'):
         '''
         add_gta_data_into_db
-        :param time_report: gta report json data
+        The gta data is spooled as compressed batches under CafyLog.work_dir/gta_spool first,
+        batches which could not be sent are left there for cafy-gta-replay
+        :param time_report: gta report json data, or an iterable of (test case, gta data) pairs
         '''
         try:
-            URL = CafyGTA_Configs.get_gta_url()
-            API_KEY = CafyGTA_Configs.get_api_key()
-            data = dict()
             if run_id == 'local_run':
                 return
-            data['run_id'] = int(run_id)
-            data['gta'] = time_report
-            data['aggregated_gta'] = aggregated_gta_data
-            data_json = json.dumps(data)
-            headers = {'Content-Type': 'application/json',
-                       'Authorization': 'Bearer {}'.format(API_KEY)}
-            response = requests.post(URL, data=data_json, headers=headers)
-            if response.status_code == 200:
-                print('GTA data updated to Mongo db:', response.status_code)
+            spool = GtaSpool(os.path.join(CafyLog.work_dir, SPOOL_DIR_NAME))
+            spool.write_batches(run_id, time_report, aggregated_gta_data, tests_per_batch=self.upload_batch_size)
+            sender = GtaSender(CafyGTA_Configs.get_gta_url(), CafyGTA_Configs.get_api_key(),
+                               max_attempts=self.upload_attempts, timeout=self.upload_timeout,
+                               compress=self.upload_compress)
+            sent, left = sender.drain(spool, max_seconds=self.upload_timeout * self.upload_attempts)
+            if left:
+                print('GTA data: %d batch(es) sent, %d left in %s, upload them later with: cafy-gta-replay %s'
+                      % (sent, left, spool.spool_dir, spool.spool_dir))
             else:
-                print('Failed to update GTA data to Mongo db, Status code:', response.status_code)
+                print('GTA data updated to Mongo db: %d batch(es)' % sent)
         except Exception as e:
             print(e)
 
@@ -296,17 +917,124 @@ class TimeCollectorPlugin:
                         transformed_gta[key]["totals"][category] = float(data)
                     else:
                         transformed_gta[key]["categories"][category] = [
-                            {
-                                "source": method.replace(".", "."),
-                                "total_time": float(values[0]),
-                                "occurence": float(values[1]),
-                                "type": values[2]
-                            }
+                            self.get_transformed_method_data(method, values)
                             for method, values in data.items()
                         ]
         return transformed_gta
 
-    def get_aggregated_gta_data(self,gta_data,run_time):
+    def get_transformed_method_data(self, method, values):
+        '''
+        get_transformed_method_data
+        :param method: method name
+        :param values: [total time, occurence, type] and optionally the latency dict of get_time_data
+        '''
+        method_data = {
+            "source": method.replace(".", "."),
+            "total_time": float(values[0]),
+            "occurence": float(values[1]),
+            "type": values[2]
+        }
+        if len(values) > 3:
+            # p50/p90/p99/max
+            method_data.update(values[3])
+        return method_data
+
+    def get_aggregated_timing_stats(self):
+        '''
+        Merge the timings of every testcase per event and method
+        :return: dict of event -> method -> TimingStats
+        '''
+        aggregated = dict()
+        for events in self.granular_time_testcase_dict.values():
+            self.add_to_aggregated_timing_stats(aggregated, events)
+        return aggregated
+
+    def add_to_aggregated_timing_stats(self, aggregated, events):
+        '''
+        Merge the timings of one testcase into aggregated
+        :param aggregated: dict of event -> method -> TimingStats
+        :param events: gta data of the testcase, event -> method -> timings
+        '''
+        for event, methods in events.items():
+            for method, timings in methods.items():
+                if not isinstance(timings, TimingStats):
+                    continue
+                event_stats = aggregated.setdefault(event, dict())
+                if method not in event_stats:
+                    event_stats[method] = type(timings)(timings.feature_type)
+                event_stats[method].merge(timings)
+
+    def get_gta_histograms(self, aggregated_stats):
+        '''
+        Histograms of the timings per testcase and aggregated over the run, they can be merged
+        with the ones of other runs or workers with gta_stats.merge_histogram_dicts
+        :param aggregated_stats: get_aggregated_timing_stats()
+        '''
+        tests = dict()
+        for test_case, events in self.granular_time_testcase_dict.items():
+            test_histograms = self.get_test_histograms(events)
+            if test_histograms:
+                tests[test_case] = test_histograms
+        aggregated = {event: {method: timings.histogram for method, timings in methods.items()}
+                      for event, methods in aggregated_stats.items()}
+        return histograms_to_dict({"tests": tests, "aggregated": aggregated})
+
+    def get_test_histograms(self, events):
+        '''
+        :param events: gta data of one testcase, event -> method -> timings
+        :return: dict of event -> method -> LogHistogram
+        '''
+        histograms = dict()
+        for event, methods in events.items():
+            for method, timings in methods.items():
+                if isinstance(timings, TimingStats):
+                    histograms.setdefault(event, dict())[method] = timings.histogram
+        return histograms
+
+    def write_gta_report_from_journal(self, path, run_time, aggregated_stats=None):
+        '''
+        Build cafy_gta.json and cafy_gta_histograms.json by streaming over cafy_gta.jsonl
+        :param path: directory of the reports
+        :param run_time: run time in microseconds
+        :param aggregated_stats: dict filled with the timings merged per event and method
+        :return: aggregated gta data
+        '''
+        if aggregated_stats is None:
+            aggregated_stats = dict()
+
+        def iter_test_gta_data():
+            for test_case, test_gta, events in self.iter_journal_gta_data():
+                self.add_to_aggregated_timing_stats(aggregated_stats, events)
+                yield test_gta
+        # the latency of aggregated_stats is added once iter_test_gta_data is exhausted
+        aggregated_data = self.get_aggregated_gta_data(iter_test_gta_data(), run_time, aggregated_stats)
+
+        with open(os.path.join(path, 'cafy_gta.json'), 'w') as fp, \
+                open(os.path.join(path, 'cafy_gta_histograms.json'), 'w') as histograms_fp:
+            fp.write('{')
+            histograms_fp.write('{"tests": {')
+            separator = histograms_separator = ''
+            for test_case, test_gta, events in self.iter_journal_gta_data():
+                fp.write('%s%s: %s' % (separator, json.dumps(test_case), json.dumps(test_gta)))
+                separator = ', '
+                test_histograms = self.get_test_histograms(events)
+                if test_histograms:
+                    histograms_fp.write('%s%s: %s' % (histograms_separator, json.dumps(test_case),
+                                                      json.dumps(histograms_to_dict(test_histograms))))
+                    histograms_separator = ', '
+            fp.write('}')
+            aggregated = {event: {method: timings.histogram for method, timings in methods.items()}
+                          for event, methods in aggregated_stats.items()}
+            histograms_fp.write('}, "aggregated": %s}' % json.dumps(histograms_to_dict(aggregated)))
+        return aggregated_data
+
+    def get_aggregated_gta_data(self,gta_data,run_time,aggregated_stats=None):
+        '''
+        get_aggregated_gta_data
+        :param gta_data: transformed gta data, or an iterable of the transformed gta data of each test
+        :param run_time: run time in microseconds
+        :param aggregated_stats: get_aggregated_timing_stats(), adds the run wide latency per event and method
+        '''
         aggregated_data = {
                 'total_sleep_time': 0,
                 'total_set_command_time': 0,
@@ -315,35 +1043,106 @@ class TimeCollectorPlugin:
                 'total_event_time': 0,
                 'total_run_time': run_time
                 }
-        for test,value in gta_data.items():
-            sleep_time = gta_data[test]['totals']['total_sleep_time']
-            set_command_time = gta_data[test]['totals']['total_set_command_time']
-            get_command_time = gta_data[test]['totals']['total_get_command_time']
-            exc_command_time = gta_data[test]['totals']['total_exc_command_time']
+        if isinstance(gta_data, dict):
+            gta_data = gta_data.values()
+        for value in gta_data:
+            sleep_time = value['totals']['total_sleep_time']
+            set_command_time = value['totals']['total_set_command_time']
+            get_command_time = value['totals']['total_get_command_time']
+            exc_command_time = value['totals']['total_exc_command_time']
             aggregated_data['total_sleep_time'] = aggregated_data['total_sleep_time'] + sleep_time
             aggregated_data['total_set_command_time'] = aggregated_data['total_set_command_time'] + set_command_time
             aggregated_data['total_get_command_time'] = aggregated_data['total_get_command_time'] + get_command_time
             aggregated_data['total_exc_command_time'] = aggregated_data['total_exc_command_time'] + exc_command_time
             aggregated_data['total_event_time'] = aggregated_data['total_event_time'] + sleep_time + get_command_time + set_command_time + exc_command_time
+        if aggregated_stats is not None:
+            aggregated_data['latency'] = dict()
+            for event, methods in aggregated_stats.items():
+                aggregated_data['latency'][event] = dict()
+                for method, timings in methods.items():
+                    latency = timings.latency()
+                    latency['occurence'] = timings.count
+                    aggregated_data['latency'][event][method] = latency
         return aggregated_data
 
+    def get_device_summary(self, aggregated_stats):
+        '''
+        Rows of the per device summary table, slowest device first
+        :param aggregated_stats: dict of event -> method -> TimingStats, see get_aggregated_timing_stats
+        '''
+        rows = []
+        for device_name, timings in aggregated_stats.get('device', {}).items():
+            latency = timings.latency()
+            rows.append([device_name, timings.count, "{:.3f}".format(timings.total / 1000000),
+                         "{:.2f}".format(timings.mean / 1000), "{:.2f}".format(latency['p50'] / 1000),
+                         "{:.2f}".format(latency['p90'] / 1000), "{:.2f}".format(latency['p99'] / 1000),
+                         "{:.2f}".format(latency['max'] / 1000)])
+        rows.sort(key=lambda row: -float(row[2]))
+        return rows
+
+    def write_device_summary(self, terminalreporter, aggregated_stats):
+        rows = self.get_device_summary(aggregated_stats)
+        if not rows or terminalreporter is None:
+            return
+        headers = ['Device', 'Calls', 'Total(s)', 'Mean(ms)', 'p50(ms)', 'p90(ms)', 'p99(ms)', 'Max(ms)']
+        terminalreporter.write_line("\n GTA Device Summary Table")
+        terminalreporter.write_line(tabulate(rows, headers=headers, tablefmt='grid'))
+
+    def write_budget_summary(self, terminalreporter):
+        if not self.budget_violations or terminalreporter is None:
+            return
+        headers = ['Testcase_name', 'Budget', 'Used(s)', 'Allowed(s)']
+        rows = [[test_case, key, "{:.2f}".format(used), "{:.2f}".format(allowed)]
+                for test_case, key, used, allowed in self.budget_violations]
+        terminalreporter.write_line("\n GTA Time Budget Violations Table")
+        terminalreporter.write_line(tabulate(rows, headers=headers, tablefmt='grid'))
+
     def pytest_terminal_summary(self, terminalreporter):
         '''
         Method pytest_terminal_summary : terminal reporting 
         return : None
         '''
-        time_report = self.collect_granular_time_accouting_report()
-        gta_data = self.get_tranformed_gta_data(time_report)
+        if self.method_timer is not None:
+            self.flush_method_timer()
+            self.method_timer.stop()
+        self.uninstall_thread_aware_timing()
+        self.uninstall_subprocess_timing()
+        self.write_budget_summary(terminalreporter)
+        for test_case in self.thread_buffers.test_cases():
+            self.merge_thread_data(test_case)
         run_start_time =  float(os.environ.get('START_TIME'))
         run_end_time = time.perf_counter()
         elapsed_run_time_seconds = run_end_time - run_start_time
         elapsed_run_time_microseconds = elapsed_run_time_seconds * 1000000
         run_time = float('%.2f' % (elapsed_run_time_microseconds))
-        aggregated_data = self.get_aggregated_gta_data(gta_data,run_time)
+        if self.incremental:
+            for test_case in list(self.granular_time_testcase_dict):
+                self.flush_test_to_journal(test_case)
+            if self.gta_journal is None:
+                self.gta_journal = GtaJournal(os.path.join(CafyLog.work_dir, 'cafy_gta.jsonl'))
+            aggregated_stats = dict()
+            aggregated_data = self.write_gta_report_from_journal(CafyLog.work_dir, run_time, aggregated_stats)
+            self.write_device_summary(terminalreporter, aggregated_stats)
+            with open(os.path.join(CafyLog.work_dir, 'cafy_gta_aggregated.json'), 'w') as fp:
+                json.dump(aggregated_data,fp)
+            run_id = os.environ.get("CAFY_RUN_ID", 'local_run')
+            self.add_gta_data_into_db(((test_case, test_gta) for test_case, test_gta, _ in self.iter_journal_gta_data()),
+                                      aggregated_data, run_id)
+            self.gta_journal.close()
+            return
+        time_report = self.collect_granular_time_accouting_report()
+        gta_data = self.get_tranformed_gta_data(time_report)
+        aggregated_stats = self.get_aggregated_timing_stats()
+        aggregated_data = self.get_aggregated_gta_data(gta_data,run_time,aggregated_stats)
         path=CafyLog.work_dir
         file_name='cafy_gta.json'
         with open(os.path.join(path, file_name), 'w') as fp:
             json.dump(gta_data,fp)
+        with open(os.path.join(path, 'cafy_gta_histograms.json'), 'w') as fp:
+            json.dump(self.get_gta_histograms(aggregated_stats),fp)
+        with open(os.path.join(path, 'cafy_gta_aggregated.json'), 'w') as fp:
+            json.dump(aggregated_data,fp)
+        self.write_device_summary(terminalreporter, aggregated_stats)
         #Update gta data into mongo db
         run_id = os.environ.get("CAFY_RUN_ID", 'local_run')
         self.add_gta_data_into_db(gta_data,aggregated_data,run_id)
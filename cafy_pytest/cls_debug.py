@@ -1,14 +1,18 @@
+import copy
 import logging
 import requests
 import traceback
-from requests.adapters import HTTPAdapter
-from urllib3 import Retry, request
 import json
 import time
 import os
+import stat
 import sys
+import threading
 from debug import DebugLibrary
 
+from .http_client import get_http_client
+from .status_wait import BackoffWait, StatusWaiter
+
 # CLS metadata: prefer ``dirname(work_dir)/debug_activate/`` (e.g. cafy3-run-992489 when
 # CafyLog.work_dir is cafy3-run-992489/2916), else ``work_dir/debug_activate/``.
 CLS_DATA_FILE_JSON = "cls_data_file.json"
@@ -146,31 +150,32 @@ def _build_cls_host_from_container(meta):
     return "{}://{}:{}".format(scheme, ip, port_str)
 
 
-def resolve_cls_configuration(work_dir=None):
+def _cls_data_file_stat(work_dir):
     """
-    Resolve CLS, CLS_HOST, LOGSTASH_SERVER, LOGSTASH_PORT, and REG_ID.
+    First existing ``cls_data_file.json`` among :func:`_cls_data_file_candidates` and its
+    ``(st_mtime_ns, st_size)``, or ``(None, None)``. One ``stat`` per candidate, no open.
+    """
+    for path in _cls_data_file_candidates(work_dir):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            return path, (st.st_mtime_ns, st.st_size)
+    return None, None
 
-    - Default: read from environment (CLS as string \"true\"/\"false\"/\"1\"/\"0\", etc.).
-    - If ``dirname(work_dir)/debug_activate/cls_data_file.json`` or
-      ``work_dir/debug_activate/cls_data_file.json`` exists (first match wins): for each setting, use the file
-      only when that variable's key(s) are present in the JSON; otherwise keep the env-based value.
-      For ``cls_host``, when the file is used: only if **both** container IP and port are set
-      (``cls_container_host_ip`` or ``CLS_CONTAINER_HOST_IP``, and ``cls_container_host_port``
-      or ``CLS_CONTAINER_HOST_PORT``), build the URL from those keys; otherwise use ``cls_host`` /
-      ``CLS_HOST`` from the file if present, else ``CLS_HOST`` from the environment.
-    - If ``CLS`` / ``cls`` is present in the file and ``REG_ID`` / ``reg_id`` is present in the file,
-      ``REG_ID`` is taken from the file instead of ``os.environ``.
+
+def _read_cls_configuration(env_defaults, env_reg_id, meta_path):
+    """
+    Overlay ``meta_path`` (``cls_data_file.json``, may be None) on the env based values.
 
     Returns:
-        tuple: (cls 0|1, cls_host, logstash_server, logstash_port, reg_id)
-        ``logstash_port`` is stored as a string when set (same as os.environ) for backward compatibility.
-        ``reg_id`` matches prior behavior (from ``REG_ID`` env) unless overridden by the file as above.
+        tuple: ((cls, cls_host, logstash_server, logstash_port, reg_id), cls_host_source, logstash_unset)
     """
-    cls_val, cls_host, logstash_server, logstash_port = _env_cls_defaults()
-    reg_id = _env_reg_id()
+    cls_val, cls_host, logstash_server, logstash_port = env_defaults
+    reg_id = env_reg_id
     cls_host_source = "environment (CLS_HOST)" if cls_host else "unset"
-    meta_path = _cls_data_file_path(work_dir)
-    if meta_path and os.path.isfile(meta_path):
+    if meta_path:
         try:
             with open(meta_path, "r", encoding="utf-8") as fh:
                 meta = json.load(fh)
@@ -208,12 +213,20 @@ def resolve_cls_configuration(work_dir=None):
                 rid = meta["REG_ID"] if "REG_ID" in meta else meta["reg_id"]
                 reg_id = _normalize_optional_str(rid)
 
+    logstash_unset = False
     if not (logstash_port or logstash_server) and cls_val == 1:
+        logstash_unset = True
+        cls_val = 0
+
+    return (cls_val, cls_host, logstash_server, logstash_port, reg_id), cls_host_source, logstash_unset
+
+
+def _log_cls_configuration(resolved, cls_host_source, logstash_unset):
+    cls_val, cls_host = resolved[0], resolved[1]
+    if logstash_unset:
         _log.warning(
             "CLS disabled: LOGSTASH_SERVER and LOGSTASH_PORT are unset while CLS was enabled"
         )
-        cls_val = 0
-
     if cls_host:
         _log.info("CLS cls_host=%s (source: %s)", cls_host, cls_host_source)
     else:
@@ -225,15 +238,84 @@ def resolve_cls_configuration(work_dir=None):
         else:
             _log.info("CLS cls_host is not set (source: %s)", cls_host_source)
 
-    return cls_val, cls_host, logstash_server, logstash_port, reg_id
+
+class ClsConfigResolver:
+    """
+    Caching front end of the CLS configuration resolution.
+
+    The parsed result is cached keyed by the env values and the path,
+    ``st_mtime_ns`` and ``st_size`` of ``cls_data_file.json``, so the file is
+    only re-read when orchestration rewrites it, and the resolution is only
+    logged when the resolved values change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache_key = None
+        self._cached = None
+        self._logged = None
+        self.reads = 0
+        self.hits = 0
+
+    def resolve(self, work_dir=None):
+        env_defaults = _env_cls_defaults()
+        env_reg_id = _env_reg_id()
+        meta_path, meta_stat = _cls_data_file_stat(work_dir)
+        cache_key = (env_defaults, env_reg_id, meta_path, meta_stat)
+        with self._lock:
+            if cache_key == self._cache_key:
+                self.hits += 1
+                return self._cached
+            resolved, cls_host_source, logstash_unset = _read_cls_configuration(env_defaults, env_reg_id, meta_path)
+            self.reads += 1
+            self._cache_key = cache_key
+            self._cached = resolved
+            if resolved != self._logged:
+                _log_cls_configuration(resolved, cls_host_source, logstash_unset)
+                self._logged = resolved
+            return resolved
+
+    def invalidate(self):
+        with self._lock:
+            self._cache_key = None
+            self._cached = None
+
+
+_cls_config_resolver = ClsConfigResolver()
+
+
+def resolve_cls_configuration(work_dir=None):
+    """
+    Resolve CLS, CLS_HOST, LOGSTASH_SERVER, LOGSTASH_PORT, and REG_ID.
+
+    - Default: read from environment (CLS as string \"true\"/\"false\"/\"1\"/\"0\", etc.).
+    - If ``dirname(work_dir)/debug_activate/cls_data_file.json`` or
+      ``work_dir/debug_activate/cls_data_file.json`` exists (first match wins): for each setting, use the file
+      only when that variable's key(s) are present in the JSON; otherwise keep the env-based value.
+      For ``cls_host``, when the file is used: only if **both** container IP and port are set
+      (``cls_container_host_ip`` or ``CLS_CONTAINER_HOST_IP``, and ``cls_container_host_port``
+      or ``CLS_CONTAINER_HOST_PORT``), build the URL from those keys; otherwise use ``cls_host`` /
+      ``CLS_HOST`` from the file if present, else ``CLS_HOST`` from the environment.
+    - If ``CLS`` / ``cls`` is present in the file and ``REG_ID`` / ``reg_id`` is present in the file,
+      ``REG_ID`` is taken from the file instead of ``os.environ``.
+    - The result is cached by :class:`ClsConfigResolver` until the env values or the
+      file's mtime/size change, so calling this per testcase is cheap.
+
+    Returns:
+        tuple: (cls 0|1, cls_host, logstash_server, logstash_port, reg_id)
+        ``logstash_port`` is stored as a string when set (same as os.environ) for backward compatibility.
+        ``reg_id`` matches prior behavior (from ``REG_ID`` env) unless overridden by the file as above.
+    """
+    return _cls_config_resolver.resolve(work_dir)
 
 
-def requests_retry(logger, url, method, data=None, files=None,  headers=None, timeout=None, retry_count=5, **kwargs):
+def requests_retry(logger, url, method, data=None, files=None,  headers=None, timeout=None, retry_count=None, **kwargs):
     """ Retry Connection to server and database.
 
     Args:
         url: String of URL .
         method: String of 'GET', 'POST', 'PUT' or 'DELETE'.
+        retry_count: number of retries, defaults to --http-retries (5).
         **kwargs: Other Response arguments
 
     Examples:
@@ -243,13 +325,6 @@ def requests_retry(logger, url, method, data=None, files=None,  headers=None, ti
         _requests_retry(url, 'POST', data=json.dumps(context,
                              default=json_serial))
     """
-    retries = Retry(total=retry_count,
-                    backoff_factor=1,
-                    status_forcelist=[502, 503, 504, 404])
-    s = requests.Session()
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    s.mount('https://', HTTPAdapter(max_retries=retries))
-
     response = None
     try:
         if method in ['GET', 'PUT', 'PATCH', 'POST', 'DELETE']:
@@ -262,7 +337,8 @@ def requests_retry(logger, url, method, data=None, files=None,  headers=None, ti
                 kwargs['headers'] = headers
             if timeout:
                 kwargs['timeout']  = timeout
-            response = s.request(method=method, url=url, **kwargs)
+            # pooled keep-alive session shared with every other caller in the process
+            response = get_http_client().request(method, url, retry_count=retry_count, **kwargs)
 
 
         if response.status_code != 200:
@@ -311,6 +387,12 @@ class DebugAdapter:
         self.topo_file= kwargs.get('topo_file',None)
         self.test_name = kwargs.get("test_name", None)
         self.logger = kwargs.get('logger', None)
+        # status polling of collections/snapshots, see _wait_for_status
+        self.status_backoff_initial = kwargs.get('status_backoff_initial', 2)
+        self.status_backoff_ceiling = kwargs.get('status_backoff_ceiling', None)
+        self.status_long_poll = kwargs.get('status_long_poll', 0)
+        self._status_waiter = None
+        self._status_waiter_lock = threading.Lock()
         if not self.logger:
             import logging
             from logging import getLogger
@@ -466,6 +548,50 @@ class DebugAdapter:
                     self.logger.warning(f'Error {e}')
                     self.logger.warning(f'Http call to registration service url:{url} is not successful')
 
+    def _wait_for_status(self, status_path, status_key, params, headers, max_wait, ceiling):
+        """
+        Poll a status endpoint of the registration service until status_key is True.
+        Polls back off exponentially with jitter from status_backoff_initial up to
+        status_backoff_ceiling (default ceiling), so short collections return quickly.
+        With status_long_poll the number of seconds the server may hold the request
+        open is sent as "wait", a server without long poll support answers right away.
+
+        Args:
+            status_path (str): e.g. collectionstatus
+            status_key (str): key of the status in the json response
+            params (dict) : dictionary of parameters sent to the status service.
+            headers (dict): {'content-type': 'application/json'}
+            max_wait (int): give up after this many seconds
+            ceiling (int): default max seconds between polls
+
+        Returns:
+            response or None
+        """
+        url_status = f'http://{self.debug_server}:5001/{status_path}/'
+
+        def poll(long_poll):
+            body = params
+            if long_poll:
+                body = dict(params, wait=long_poll)
+            response = requests_retry(self.logger, url_status, 'POST', json=body, headers=headers,
+                                      timeout=30 + long_poll)
+            if response.status_code != 200:
+                self.logger.info(f'{status_path} api return status other then 200 response {response.status_code}')
+                return True, None
+            if response.json()[status_key] == True:
+                return True, response
+            return False, None
+
+        waiter = BackoffWait(max_wait,
+                             initial=self.status_backoff_initial,
+                             ceiling=self.status_backoff_ceiling or ceiling,
+                             long_poll=self.status_long_poll)
+        start = time.monotonic()
+        response = waiter.run(poll)
+        self.logger.info(f'{status_path}: {"done" if response is not None else "not done"} '
+                         f'after {waiter.polls} polls in {time.monotonic() - start:.1f}s')
+        return response
+
     def collector_call(self, params, headers):
         """_summary_
 
@@ -475,8 +601,6 @@ class DebugAdapter:
 
         Returns:
             response or None
-
-        ##this code needs to improve. 
         """
         if self.debug_server is None:
             self.logger.info("debug_server name not provided in topo file")
@@ -487,23 +611,8 @@ class DebugAdapter:
                 self.logger.info(f'Calling registration service (url:{url}) to start collecting')
                 response = requests_retry(self.logger, url, 'POST', json=params, headers=headers, timeout=1500)
                 if response.status_code == 200:
-                    waiting_time = 0
-                    poll_flag = True
-                    while(poll_flag):
-                        url_status = f'http://{self.debug_server}:5001/collectionstatus/'
-                        response = requests_retry(self.logger, url_status, 'POST', json=params, headers=headers, timeout=30)
-                        if response.status_code == 200:
-                            message = response.json()
-                            if message["collector_status"] == True:
-                                return response
-                            else:
-                                time.sleep(30)
-                                waiting_time = waiting_time + 30
-                                if waiting_time > 900:
-                                    poll_flag = False
-                        else:
-                            poll_flag = False
-                            self.logger.info(f'collection status api return status other then 200 response {response.status_code}')
+                    return self._wait_for_status('collectionstatus', 'collector_status', params, headers,
+                                                 max_wait=900, ceiling=30)
                 else:
                     self.logger.warning(f'start_debug part of handshake server returned code {response.status_code}')
                     return None
@@ -534,24 +643,8 @@ class DebugAdapter:
                 self.logger.info(f'Calling registration service (url:{url}) to start collecting')
                 response = requests_retry(self.logger, url, 'POST', json=params, headers=headers, timeout=2700)
                 if response.status_code == 200:
-                    waiting_time = 0
-                    poll_flag = True
-                    while(poll_flag):
-                        # Changed from /collectionstatus/ to /snapshotstatus/ as requested
-                        url_status = f'http://{self.debug_server}:5001/snapshotstatus/'
-                        response = requests_retry(self.logger, url_status, 'POST', json=params, headers=headers, timeout=30)
-                        if response.status_code == 200:
-                            message = response.json()
-                            if message["snapshot_status"] == True: # Assuming "collector_status" key remains relevant for snapshot status
-                                return response
-                            else:
-                                time.sleep(90)
-                                waiting_time = waiting_time + 90
-                                if waiting_time > 2700:
-                                    poll_flag = False
-                        else:
-                            poll_flag = False
-                            self.logger.info(f'collection status api return status other then 200 response {response.status_code}')
+                    return self._wait_for_status('snapshotstatus', 'snapshot_status', params, headers,
+                                                 max_wait=2700, ceiling=90)
                 else:
                     self.logger.warning(f'start_debug part of handshake server returned code {response.status_code}')
                     return None
@@ -560,6 +653,62 @@ class DebugAdapter:
                 self.logger.warning(f'Http call to registration service url:{url} is not successful')
                 return None
 
+    @property
+    def status_waiter(self):
+        return self._get_status_waiter()
+
+    def _get_status_waiter(self):
+        with self._status_waiter_lock:
+            if self._status_waiter is None:
+                self._status_waiter = StatusWaiter()
+            return self._status_waiter
+
+    def with_logger(self, logger):
+        """
+        Copy of this adapter logging to logger, e.g. for calls made from a background thread.
+        The copy shares the status_waiter, so join_status_waits also waits for its calls.
+        """
+        # created before copying, otherwise the copy would create its own
+        self._get_status_waiter()
+        adapter = copy.copy(self)
+        adapter.logger = logger
+        return adapter
+
+    def collector_call_future(self, params, headers):
+        """
+        collector_call in the background
+
+        Returns:
+            concurrent.futures.Future of the collector_call response
+        """
+        return self.status_waiter.submit(self.collector_call, params, headers)
+
+    def collector_call_snapshot_future(self, params, headers):
+        """
+        collector_call_snapshot in the background
+
+        Returns:
+            concurrent.futures.Future of the collector_call_snapshot response
+        """
+        return self.status_waiter.submit(self.collector_call_snapshot, params, headers)
+
+    def join_status_waits(self, timeout=None):
+        """
+        Wait for the collections started with collector_call_future/collector_call_snapshot_future
+
+        Args:
+            timeout (int): max seconds to wait, None waits forever
+
+        Returns:
+            number of collections still running
+        """
+        if self._status_waiter is None:
+            return 0
+        outstanding = self._status_waiter.outstanding()
+        if outstanding:
+            self.logger.info(f'Waiting for {outstanding} outstanding debug collection(s)')
+        return self._status_waiter.join(timeout)
+
     def rc_call(self, params, headers):
         """_summary_
 
@@ -673,13 +822,14 @@ class ClsAdapter:
             log_handler.setFormatter(log_formatter)
             self.logger.addHandler(log_handler)
 
-    def update_cls_testcase(self, test_case):
+    def update_cls_testcase(self, test_case, cls_host=None):
         '''
         update cls with test case change update
         :param testcase:
+        :param cls_host: cls host to notify, default self.cls_host
         :return: Boolean for able to succeed to inform CLS for testcase change.
         '''
-        url = f'{self.cls_host}/api/collector/{self.reg_id}/case-update'
+        url = f'{cls_host or self.cls_host}/api/collector/{self.reg_id}/case-update'
         try:
             params ={
                    "case_name" : test_case
@@ -698,3 +848,99 @@ class ClsAdapter:
             return False
 
 
+
+
+class ClsNotifier:
+    '''
+    Sends CLS case-update notifications from a background thread so that test
+    setup never waits on the CLS round trip.
+
+    Notifications are sent in order. If several testcases start while a
+    notification is in flight, only the latest one is sent: CLS only needs to
+    know which testcase is running now, the intermediate ones are stale.
+    '''
+
+    def __init__(self, send, logger=None):
+        '''
+        :param send: callable(test_case, *args) doing the actual update, e.g. ClsAdapter.update_cls_testcase,
+                     args are the ones given to notify
+        :param logger: logger
+        '''
+        self.send = send
+        self.logger = logger or _log
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="cafy-cls-notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, test_case, *args):
+        '''
+        Queue a case-update for test_case, returns immediately
+        :param args: more arguments of send, resolved by the caller (the worker thread reads no shared state)
+        '''
+        with self._cond:
+            if self._closed:
+                return
+            if self._pending is not None:
+                self.coalesced += 1
+                self.logger.info("CLS case-update for %s superseded by %s", self._pending[0], test_case)
+            self._pending = (test_case,) + args
+            self.queued += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                pending, self._pending = self._pending, None
+                self._busy = True
+            test_case = pending[0]
+            try:
+                if self.send(*pending):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.warning("CLS case-update for %s failed: %s", test_case, e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        '''
+        Wait until the queued notification has been sent
+        :param timeout: max seconds to wait, None waits forever
+        :return: True if everything was sent within timeout
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending is not None or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        '''
+        Flush and stop the background thread
+        :param timeout: max seconds to wait for the queued notification
+        '''
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.logger.info("CLS case-update notifier: queued=%s sent=%s coalesced=%s failed=%s",
+                         self.queued, self.sent, self.coalesced, self.failed)
+        return flushed
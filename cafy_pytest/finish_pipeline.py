@@ -0,0 +1,177 @@
+'''
+Dependency graph of the session finish steps
+
+The steps run at the end of a session (allure report, debug collector logs,
+email report ...) mostly wait on external processes and servers. A
+FinishPipeline runs them on up to max_workers threads as soon as the steps
+they require are settled, so independent steps overlap:
+
+    pipeline = FinishPipeline(max_workers=4, default_timeout=900, logger=log)
+    pipeline.add("allure_report", generate_allure_report, requires=("testlog_render",))
+    pipeline.add("testlog_render", renderer.shutdown)
+    timings = pipeline.join()
+
+A step is settled when it returned, raised or ran past its timeout. The
+steps requiring it run in all three cases, as the serial code did; a step
+requiring a step which was not added does not wait for it. Threads can't be
+killed, so a step past its timeout is left running on a daemon thread and
+does not hold the interpreter at exit.
+'''
+
+import threading
+import time
+
+OK = 'ok'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+NOT_RUN = 'not_run'
+
+
+class FinishStep:
+    __slots__ = ('name', 'func', 'requires', 'timeout', 'status', 'start', 'duration', 'error', 'deadline')
+
+    def __init__(self, name, func, requires, timeout):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.timeout = timeout
+        self.status = None
+        self.start = None
+        self.duration = None
+        self.error = None
+        self.deadline = None
+
+    @property
+    def settled(self):
+        return self.status in (OK, FAILED, TIMEOUT)
+
+
+class FinishPipeline:
+    def __init__(self, max_workers=4, default_timeout=900, logger=None, clock=time.monotonic):
+        '''
+        :param max_workers: max steps running at once
+        :param default_timeout: timeout in seconds of the steps added without one, None waits forever
+        :param logger: logger of the step failures and timeouts
+        :param clock: monotonic clock
+        '''
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.log = logger
+        self._clock = clock
+        self._steps = dict()
+        self._condition = threading.Condition()
+        self._running = dict()
+        self._origin = None
+
+    def add(self, name, func, requires=(), timeout=None):
+        '''
+        :param name: step name, reported in the timings
+        :param func: callable without arguments
+        :param requires: names of the steps to settle before this one starts
+        :param timeout: seconds, default_timeout if None
+        '''
+        if name in self._steps:
+            raise ValueError("Duplicate finish step %s" % name)
+        self._steps[name] = FinishStep(name, func, requires, timeout if timeout is not None else self.default_timeout)
+        return self
+
+    def step_names(self):
+        '''
+        :return: names of the steps added so far, e.g. for a step to run after all of them
+        '''
+        return list(self._steps)
+
+    def start(self):
+        '''
+        Start the steps which are ready, without waiting; see join
+        '''
+        with self._condition:
+            if self._origin is None:
+                self._origin = self._clock()
+            self._start_ready()
+
+    def join(self):
+        '''
+        Run the remaining steps and wait until every step is settled
+        :return: timings, see timings()
+        '''
+        self.start()
+        with self._condition:
+            while True:
+                self._expire()
+                self._start_ready()
+                if not self._running:
+                    break
+                deadlines = [step.deadline for step in self._running.values() if step.deadline is not None]
+                wait = max(0.0, min(deadlines) - self._clock()) if deadlines else None
+                self._condition.wait(wait)
+            for step in self._steps.values():
+                if step.status is None:
+                    # requires a step of a cycle
+                    step.status = NOT_RUN
+        return self.timings()
+
+    def _start_ready(self):
+        for step in self._steps.values():
+            if len(self._running) >= self.max_workers:
+                return
+            if step.status is not None:
+                continue
+            if all(self._steps[name].settled for name in step.requires if name in self._steps):
+                step.status = 'running'
+                step.start = self._clock()
+                if step.timeout is not None:
+                    step.deadline = step.start + step.timeout
+                self._running[step.name] = step
+                thread = threading.Thread(target=self._run_step, args=(step,),
+                                          name="cafy-finish-%s" % step.name, daemon=True)
+                thread.start()
+
+    def _expire(self):
+        now = self._clock()
+        for step in list(self._running.values()):
+            if step.deadline is not None and now >= step.deadline:
+                step.status = TIMEOUT
+                step.duration = now - step.start
+                del self._running[step.name]
+                if self.log is not None:
+                    self.log.warning("Session finish step %s did not finish within %ss" % (step.name, step.timeout))
+
+    def _run_step(self, step):
+        error = None
+        try:
+            step.func()
+        except BaseException as e:
+            # pytest outcomes (fail, skip, exit), SystemExit... settle the step as failed too
+            error = e
+        with self._condition:
+            if step.status == 'running':
+                step.duration = self._clock() - step.start
+                step.status = FAILED if error is not None else OK
+                if error is not None:
+                    step.error = "%s: %s" % (type(error).__name__, error)
+                    if self.log is not None:
+                        self.log.warning("Session finish step %s failed: %s" % (step.name, step.error))
+                del self._running[step.name]
+            self._condition.notify_all()
+
+    def timings(self):
+        '''
+        :return: dict of step name -> {status, start (seconds after the pipeline start), duration,
+                 timeout, requires, error}, and 'total' -> seconds from the start to the last settled step
+        '''
+        timings = dict()
+        end = self._origin
+        for step in self._steps.values():
+            timings[step.name] = {
+                "status": step.status,
+                "start": round(step.start - self._origin, 3) if step.start is not None else None,
+                "duration": round(step.duration, 3) if step.duration is not None else None,
+                "timeout": step.timeout,
+                "requires": list(step.requires),
+                "error": step.error,
+            }
+            if step.duration is not None:
+                end = max(end, step.start + step.duration)
+        timings["total"] = round(end - self._origin, 3) if self._origin is not None else 0.0
+        return timings
@@ -0,0 +1,102 @@
+'''
+Per testcase time budgets checked against the GTA data
+
+A budget is a dict of seconds for the total GTA time of a testcase and/or for
+its sleep, set_command, get_command and exc_command time. It comes from the
+marker of the testcase
+
+    @pytest.mark.time_budget(total=120, sleep=60)
+
+and from the run wide budget file (--cafygta-budget-file), a yaml or json
+
+    default:
+      total: 600
+    tests:
+      TestBgp.test_neighbors:
+        get_command: 30
+      "TestIsis.*":
+        sleep: 120
+
+The testcase patterns are matched (fnmatch) against the GTA testcase name and
+the node id. The marker overrides the matching file entries, which override
+the default, key by key.
+'''
+
+import fnmatch
+
+import yaml
+
+BUDGET_EVENTS = ('sleep', 'set_command', 'get_command', 'exc_command')
+BUDGET_KEYS = ('total',) + BUDGET_EVENTS
+
+
+class TimeBudgetWarning(UserWarning):
+    '''
+    A testcase exceeded its time budget
+    '''
+
+
+def _validate(budget, where):
+    if not isinstance(budget, dict):
+        raise ValueError("%s: a budget must be a mapping of %s to seconds" % (where, ", ".join(BUDGET_KEYS)))
+    unknown = set(budget) - set(BUDGET_KEYS)
+    if unknown:
+        raise ValueError("%s: unknown budget keys %s, expected %s" % (
+            where, ", ".join(sorted(unknown)), ", ".join(BUDGET_KEYS)))
+    for key, seconds in budget.items():
+        if not isinstance(seconds, (int, float)) or isinstance(seconds, bool) or seconds < 0:
+            raise ValueError("%s: budget %s must be a positive number of seconds, got %r" % (where, key, seconds))
+    return {key: float(seconds) for key, seconds in budget.items()}
+
+
+class TimeBudgets:
+    def __init__(self, default=None, tests=None):
+        '''
+        :param default: budget of every testcase
+        :param tests: list of (testcase pattern, budget)
+        '''
+        self.default = _validate(default or {}, "default")
+        self.tests = [(pattern, _validate(budget, pattern)) for pattern, budget in (tests or [])]
+
+    @classmethod
+    def from_file(cls, path):
+        '''
+        :param path: yaml or json budget file
+        :raise ValueError: if the file is not a valid budget file
+        '''
+        with open(path) as budget_file:
+            data = yaml.safe_load(budget_file) or {}
+        if not isinstance(data, dict) or set(data) - {'default', 'tests'}:
+            raise ValueError("%s: expected a mapping with 'default' and/or 'tests'" % path)
+        tests = data.get('tests') or {}
+        if not isinstance(tests, dict):
+            raise ValueError("%s: 'tests' must map testcase patterns to budgets" % path)
+        return cls(data.get('default'), list(tests.items()))
+
+    def get_budget(self, test_case_name, nodeid=None, marker=None):
+        '''
+        :param test_case_name: GTA testcase name, Class.test
+        :param nodeid: pytest node id of the testcase
+        :param marker: time_budget marker of the testcase, its first positional argument is the total
+        :return: budget of the testcase, key -> seconds
+        '''
+        budget = dict(self.default)
+        for pattern, test_budget in self.tests:
+            if fnmatch.fnmatchcase(test_case_name, pattern) or (nodeid and fnmatch.fnmatchcase(nodeid, pattern)):
+                budget.update(test_budget)
+        if marker is not None:
+            marker_budget = dict(marker.kwargs)
+            if marker.args:
+                marker_budget['total'] = marker.args[0]
+            budget.update(_validate(marker_budget, "time_budget marker of %s" % test_case_name))
+        return budget
+
+    @staticmethod
+    def check(budget, usage):
+        '''
+        :param budget: key -> seconds, see get_budget
+        :param usage: key -> seconds used by the testcase
+        :return: list of (key, used seconds, budget seconds) exceeded
+        '''
+        return [(key, usage.get(key, 0.0), budget[key]) for key in BUDGET_KEYS
+                if key in budget and usage.get(key, 0.0) > budget[key]]
@@ -0,0 +1,315 @@
+'''
+Comparison of the GTA data of runs
+
+    cafy-gta-compare BASELINE [BASELINE ...] CANDIDATE [--threshold 1.25] [--alpha 0.05]
+
+Each run is a cafy_gta.json file or the work_dir holding it. The runs before
+the last one are pooled as the baseline. The testcases run by both sides are
+aligned by testcase name, event and method source, then compared:
+
+- per method: time per call, with one sample per (run, testcase) calling it
+- per event: time per testcase (total_<event>_time)
+- totals: the get_aggregated_gta_data totals over the aligned testcases
+
+A change is a regression (or an improvement) when the candidate is at least
+threshold times slower (faster), the time per run moved by at least min_delta
+microseconds and, when both sides have min_samples samples, a Mann-Whitney U
+test finds the difference significant at alpha. The candidate has a single
+sample of each total, so the totals are gated on threshold and min_delta only. The exit status is 1 when a
+regression is found, so nightly pipelines can gate on it.
+'''
+
+import argparse
+import json
+import math
+import os
+import sys
+
+GTA_FILE_NAME = 'cafy_gta.json'
+AGGREGATED_FILE_NAME = 'cafy_gta_aggregated.json'
+EVENTS = ('sleep', 'set_command', 'get_command', 'exc_command')
+TOTALS = tuple('total_%s_time' % event for event in EVENTS) + ('total_event_time',)
+
+REGRESSION = 'regression'
+IMPROVEMENT = 'improvement'
+UNCHANGED = 'unchanged'
+
+
+class GtaRun:
+    def __init__(self, path, tests, aggregated=None):
+        '''
+        :param path: path of the cafy_gta.json file
+        :param tests: its transformed gta data, testcase -> {"categories", "totals"}
+        :param aggregated: content of cafy_gta_aggregated.json, None if missing
+        '''
+        self.path = path
+        self.tests = tests
+        self.aggregated = aggregated
+
+    @classmethod
+    def load(cls, path):
+        '''
+        :param path: cafy_gta.json or the work_dir holding it
+        '''
+        if os.path.isdir(path):
+            path = os.path.join(path, GTA_FILE_NAME)
+        with open(path) as gta_file:
+            tests = json.load(gta_file)
+        aggregated = None
+        aggregated_path = os.path.join(os.path.dirname(path), AGGREGATED_FILE_NAME)
+        if os.path.exists(aggregated_path):
+            with open(aggregated_path) as aggregated_file:
+                aggregated = json.load(aggregated_file)
+        return cls(path, tests, aggregated)
+
+
+class Change:
+    __slots__ = ('kind', 'event', 'source', 'baseline', 'candidate', 'ratio', 'delta',
+                 'p_value', 'samples', 'status')
+
+    def __init__(self, kind, event, source, baseline, candidate, ratio, delta, p_value, samples):
+        '''
+        :param kind: method, event or total
+        :param baseline: baseline time per call (method) or per testcase/run (event, total)
+        :param candidate: candidate time, same unit
+        :param ratio: candidate / baseline, math.inf when only the candidate spent time (null in json)
+        :param delta: change of the time per run in microseconds
+        :param p_value: two sided p-value of the Mann-Whitney U test, None when not enough samples
+        :param samples: (baseline samples, candidate samples)
+        '''
+        self.kind = kind
+        self.event = event
+        self.source = source
+        self.baseline = baseline
+        self.candidate = candidate
+        self.ratio = ratio
+        self.delta = delta
+        self.p_value = p_value
+        self.samples = samples
+        self.status = UNCHANGED
+
+    def classify(self, threshold, min_delta, alpha):
+        significant = self.p_value is None or self.p_value < alpha
+        if significant and self.ratio >= threshold and self.delta >= min_delta:
+            self.status = REGRESSION
+        elif significant and self.ratio <= 1.0 / threshold and -self.delta >= min_delta:
+            self.status = IMPROVEMENT
+        return self.status
+
+    def to_dict(self):
+        change = {slot: getattr(self, slot) for slot in self.__slots__}
+        if math.isinf(self.ratio):
+            # json has no infinity
+            change['ratio'] = None
+        return change
+
+
+def mann_whitney_u(sample_a, sample_b):
+    '''
+    Two sided Mann-Whitney U test, normal approximation with tie and continuity corrections
+    :return: p-value
+    '''
+    n_a, n_b = len(sample_a), len(sample_b)
+    values = sorted([(value, 0) for value in sample_a] + [(value, 1) for value in sample_b])
+    n = n_a + n_b
+    rank_sum_a = 0.0
+    ties = 0.0
+    start = 0
+    while start < n:
+        end = start
+        while end + 1 < n and values[end + 1][0] == values[start][0]:
+            end += 1
+        # ranks are 1 based, tied values get the average of their ranks
+        rank = (start + end) / 2.0 + 1
+        tied = end - start + 1
+        ties += tied ** 3 - tied
+        rank_sum_a += rank * sum(1 for _, side in values[start:end + 1] if side == 0)
+        start = end + 1
+    u = rank_sum_a - n_a * (n_a + 1) / 2.0
+    variance = n_a * n_b / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = max(0.0, abs(u - n_a * n_b / 2.0) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(z / math.sqrt(2)))
+
+
+def _ratio(baseline, candidate):
+    if baseline:
+        return candidate / baseline
+    return math.inf if candidate else 1.0
+
+
+def _p_value(baseline_samples, candidate_samples, min_samples):
+    if min(len(baseline_samples), len(candidate_samples)) < min_samples:
+        return None
+    return mann_whitney_u(baseline_samples, candidate_samples)
+
+
+def get_method_timings(runs, test_cases):
+    '''
+    :return: dict of (event, source) -> [total time, calls, per call samples] over the runs
+    '''
+    timings = dict()
+    for run in runs:
+        for test_case in test_cases:
+            for event, methods in run.tests[test_case].get("categories", {}).items():
+                if event not in EVENTS:
+                    continue
+                for method in methods:
+                    if not method["occurence"]:
+                        continue
+                    method_timings = timings.setdefault((event, method["source"]), [0.0, 0.0, []])
+                    method_timings[0] += method["total_time"]
+                    method_timings[1] += method["occurence"]
+                    method_timings[2].append(method["total_time"] / method["occurence"])
+    return timings
+
+
+def get_totals(run, test_cases):
+    '''
+    The get_aggregated_gta_data totals of a run over test_cases
+    '''
+    totals = dict.fromkeys(TOTALS, 0.0)
+    for test_case in test_cases:
+        test_totals = run.tests[test_case].get("totals", {})
+        for event in EVENTS:
+            event_time = test_totals.get('total_%s_time' % event, 0.0)
+            totals['total_%s_time' % event] += event_time
+            totals['total_event_time'] += event_time
+    return totals
+
+
+def compare_runs(baseline_runs, candidate_run, threshold=1.25, min_delta=1000.0, alpha=0.05, min_samples=3):
+    '''
+    :param baseline_runs: list of GtaRun pooled as baseline
+    :param candidate_run: GtaRun
+    :param threshold: slowdown (or speedup) factor to report
+    :param min_delta: minimum change of the time per run in microseconds
+    :param alpha: significance level of the Mann-Whitney U test
+    :param min_samples: minimum samples per side to test the significance, below it the ratio is enough
+    :return: dict with the aligned testcases, the changes per method, event and total, and the run times
+    '''
+    baseline_tests = set.intersection(*(set(run.tests) for run in baseline_runs))
+    candidate_tests = set(candidate_run.tests)
+    test_cases = sorted(baseline_tests & candidate_tests)
+    n_baseline = float(len(baseline_runs))
+    changes = []
+
+    baseline_methods = get_method_timings(baseline_runs, test_cases)
+    candidate_methods = get_method_timings([candidate_run], test_cases)
+    for key in sorted(set(baseline_methods) & set(candidate_methods)):
+        base_total, base_calls, base_samples = baseline_methods[key]
+        cand_total, cand_calls, cand_samples = candidate_methods[key]
+        base_per_call, cand_per_call = base_total / base_calls, cand_total / cand_calls
+        changes.append(Change('method', key[0], key[1], base_per_call, cand_per_call,
+                              _ratio(base_per_call, cand_per_call), cand_total - base_total / n_baseline,
+                              _p_value(base_samples, cand_samples, min_samples),
+                              (len(base_samples), len(cand_samples))))
+
+    for event in EVENTS:
+        total = 'total_%s_time' % event
+        base_samples = [run.tests[test_case].get("totals", {}).get(total, 0.0)
+                        for run in baseline_runs for test_case in test_cases]
+        cand_samples = [candidate_run.tests[test_case].get("totals", {}).get(total, 0.0)
+                        for test_case in test_cases]
+        if not any(base_samples) and not any(cand_samples):
+            continue
+        base_mean = sum(base_samples) / len(base_samples)
+        cand_mean = sum(cand_samples) / len(cand_samples)
+        changes.append(Change('event', event, None, base_mean, cand_mean, _ratio(base_mean, cand_mean),
+                              sum(cand_samples) - sum(base_samples) / n_baseline,
+                              _p_value(base_samples, cand_samples, min_samples),
+                              (len(base_samples), len(cand_samples))))
+
+    baseline_totals = [get_totals(run, test_cases) for run in baseline_runs]
+    candidate_totals = get_totals(candidate_run, test_cases)
+    for total in TOTALS:
+        base_samples = [totals[total] for totals in baseline_totals]
+        base_mean = sum(base_samples) / n_baseline
+        cand_value = candidate_totals[total]
+        # a single candidate sample: no significance test, threshold and min_delta only
+        changes.append(Change('total', None, total, base_mean, cand_value, _ratio(base_mean, cand_value),
+                              cand_value - base_mean, None, (len(base_samples), 1)))
+
+    for change in changes:
+        change.classify(threshold, min_delta, alpha)
+
+    run_times = None
+    if all(run.aggregated for run in baseline_runs) and candidate_run.aggregated:
+        # whole runs, including setup and the testcases not aligned: reported, not gated
+        run_times = {'baseline': sum(run.aggregated['total_run_time'] for run in baseline_runs) / n_baseline,
+                     'candidate': candidate_run.aggregated['total_run_time']}
+    return {
+        'test_cases': test_cases,
+        'only_in_baseline': sorted(baseline_tests - candidate_tests),
+        'only_in_candidate': sorted(candidate_tests - baseline_tests),
+        'changes': changes,
+        'run_times': run_times,
+    }
+
+
+def _format_change(change):
+    name = change.source if change.kind != 'event' else 'total_%s_time' % change.event
+    if change.kind == 'method':
+        name = '%s %s' % (change.event, name)
+    unit = '/call' if change.kind == 'method' else ''
+    if change.kind == 'total':
+        p_value = 'threshold only'
+    else:
+        p_value = 'p=%.3g' % change.p_value if change.p_value is not None else 'p=n/a'
+    return '%-12s %-7s %s: %.2fus -> %.2fus%s x%.2f (%+.2fus per run, %s, n=%d/%d)' % (
+        change.status.upper(), change.kind, name, change.baseline, change.candidate, unit,
+        change.ratio, change.delta, p_value, change.samples[0], change.samples[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cafy-gta-compare',
+                                     description='Compare the GTA data of runs, the last run is the candidate '
+                                                 'and the ones before are pooled as the baseline')
+    parser.add_argument('runs', nargs='+', metavar='RUN', help='cafy_gta.json file or work_dir of a run')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown/speedup factor to report, default is 1.25')
+    parser.add_argument('--min-delta', type=float, default=1000.0, metavar='US',
+                        help='minimum change of the time per run in microseconds, default is 1000')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='significance level of the Mann-Whitney U test, default is 0.05')
+    parser.add_argument('--min-samples', type=int, default=3,
+                        help='minimum samples per side to test the significance, default is 3')
+    parser.add_argument('--show-all', action='store_true', help='also print the unchanged methods and events')
+    parser.add_argument('--json', dest='json_path', metavar='PATH', help='write the comparison as json to PATH')
+    args = parser.parse_args(argv)
+
+    if len(args.runs) < 2:
+        parser.error("at least a baseline and a candidate run are needed")
+    if args.threshold <= 1:
+        parser.error("--threshold must be greater than 1")
+    try:
+        runs = [GtaRun.load(path) for path in args.runs]
+    except (OSError, ValueError) as e:
+        parser.error("cannot load the GTA data: %s" % e)
+    comparison = compare_runs(runs[:-1], runs[-1], threshold=args.threshold, min_delta=args.min_delta,
+                              alpha=args.alpha, min_samples=args.min_samples)
+
+    changes = comparison['changes']
+    print('GTA comparison, baseline: %s, candidate: %s' % (', '.join(run.path for run in runs[:-1]), runs[-1].path))
+    print('Testcases compared: %d, only in baseline: %d, only in candidate: %d' % (
+        len(comparison['test_cases']), len(comparison['only_in_baseline']), len(comparison['only_in_candidate'])))
+    if comparison['run_times']:
+        print('Run time: %.2fus -> %.2fus' % (comparison['run_times']['baseline'], comparison['run_times']['candidate']))
+    for change in sorted(changes, key=lambda change: -abs(change.delta)):
+        if args.show_all or change.kind == 'total' or change.status != UNCHANGED:
+            print(_format_change(change))
+    regressions = sum(1 for change in changes if change.status == REGRESSION)
+    improvements = sum(1 for change in changes if change.status == IMPROVEMENT)
+    print('Regressions: %d, improvements: %d' % (regressions, improvements))
+
+    if args.json_path:
+        comparison = dict(comparison, changes=[change.to_dict() for change in changes],
+                          baseline=[run.path for run in runs[:-1]], candidate=runs[-1].path)
+        with open(args.json_path, 'w') as json_file:
+            json.dump(comparison, json_file, indent=2, allow_nan=False)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+'''
+Testcase attribution of GTA timings across threads and asyncio tasks
+
+The running testcase is kept in a ContextVar. asyncio tasks copy the context
+by themselves; install_context_propagation() makes threading.Thread.start and
+ThreadPoolExecutor.submit copy it too, so the work a testcase fans out to
+threads or executors is attributed to that testcase.
+
+Timings recorded outside the main thread go to a buffer owned by the recording
+thread (no lock on the hot path). The buffers are registered once per thread
+and their data of a testcase is popped and merged at teardown; the buffers of
+the threads which exited are dropped once they are empty. Each timing is
+also kept as an interval of its lane (thread, asyncio task) so that the busy
+time per thread and the wall and overlap time of the testcase can be computed.
+'''
+
+import sys
+import threading
+import weakref
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import contextvars
+except ImportError:
+    # python 3.6: no propagation, GTA falls back to the testcase name set on the plugin
+    contextvars = None
+
+if contextvars is not None:
+    _current_test_case = contextvars.ContextVar('cafy_gta_test_case', default=None)
+
+
+def set_current_test_case(test_case_name):
+    if contextvars is not None:
+        _current_test_case.set(test_case_name)
+
+
+def get_current_test_case(default=None):
+    '''
+    :return: testcase of the current thread/task context, default if not set
+    '''
+    if contextvars is None:
+        return default
+    test_case_name = _current_test_case.get()
+    return default if test_case_name is None else test_case_name
+
+
+_original_thread_start = threading.Thread.start
+_original_executor_submit = ThreadPoolExecutor.submit
+
+
+def _thread_start(thread):
+    context = contextvars.copy_context()
+    run = thread.run
+    thread.run = lambda: context.run(run)
+    return _original_thread_start(thread)
+
+
+def _executor_submit(executor, fn, *args, **kwargs):
+    return _original_executor_submit(executor, contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def install_context_propagation():
+    '''
+    Make new threads and executor tasks run in a copy of the context of their creator
+    '''
+    if contextvars is None:
+        return False
+    threading.Thread.start = _thread_start
+    ThreadPoolExecutor.submit = _executor_submit
+    return True
+
+
+def uninstall_context_propagation():
+    threading.Thread.start = _original_thread_start
+    ThreadPoolExecutor.submit = _original_executor_submit
+
+
+def _current_lane():
+    '''
+    :return: (thread name, id of the running asyncio task or None)
+    '''
+    task_id = None
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            # no running event loop in this thread
+            task = None
+        if task is not None:
+            task_id = id(task)
+    return threading.current_thread().name, task_id
+
+
+class _NotLocked:
+    '''
+    Context manager standing in for a lock which is not needed
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOT_LOCKED = _NotLocked()
+
+
+class ThreadBuffer:
+    '''
+    GTA data recorded by one thread: granular data of other threads than the main
+    one and the intervals of every timing, per testcase
+    '''
+    __slots__ = ('granular', 'intervals', 'thread', 'lock')
+
+    def __init__(self, thread=None):
+        self.granular = dict()
+        self.intervals = dict()
+        # held by the thread while it records, and at teardown while the data of a testcase is popped
+        self.lock = threading.RLock()
+        # weakref to the recording thread, the buffer is dropped once it exited and is empty
+        self.thread = weakref.ref(thread) if thread is not None else None
+
+    @property
+    def finished(self):
+        thread = self.thread() if self.thread is not None else None
+        return (thread is None or not thread.is_alive()) and not self.granular and not self.intervals
+
+    def add_interval(self, test_case_name, start, end):
+        lane = _current_lane()
+        with self.lock:
+            lanes = self.intervals.get(test_case_name)
+            if lanes is None:
+                lanes = self.intervals[test_case_name] = dict()
+            lane_intervals = lanes.get(lane)
+            if lane_intervals is None:
+                lane_intervals = lanes[lane] = array('d')
+            lane_intervals.append(start)
+            lane_intervals.append(end)
+
+
+class ThreadBuffers:
+    def __init__(self):
+        self._local = threading.local()
+        # taken once per thread to register its buffer and at teardown to drop the finished buffers
+        self._lock = threading.Lock()
+        self._buffers = []
+
+    def get(self):
+        '''
+        :return: the ThreadBuffer of the current thread
+        '''
+        try:
+            return self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = ThreadBuffer(threading.current_thread())
+            with self._lock:
+                self._buffers.append(buffer)
+            return buffer
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def _prune(self):
+        '''
+        Drop the buffers of the threads which exited, once their data is popped
+        '''
+        with self._lock:
+            self._buffers = [buffer for buffer in self._buffers if not buffer.finished]
+
+    def pop_granular(self, test_case_name):
+        '''
+        :return: list of the granular data of test_case_name recorded by each thread
+        '''
+        popped = []
+        for buffer in list(self._buffers):
+            with buffer.lock:
+                events = buffer.granular.pop(test_case_name, None)
+            if events is not None:
+                popped.append(events)
+        self._prune()
+        return popped
+
+    def pop_intervals(self, test_case_name):
+        '''
+        :return: dict of lane -> flat [start, end, start, end ...] intervals of test_case_name
+        '''
+        lanes = dict()
+        for buffer in list(self._buffers):
+            with buffer.lock:
+                buffer_lanes = buffer.intervals.pop(test_case_name, {})
+            for lane, lane_intervals in buffer_lanes.items():
+                lanes.setdefault(lane, array('d')).extend(lane_intervals)
+        self._prune()
+        return lanes
+
+    def test_cases(self):
+        '''
+        :return: the testcases with data not popped yet
+        '''
+        test_cases = set()
+        for buffer in list(self._buffers):
+            with buffer.lock:
+                test_cases.update(buffer.granular)
+                test_cases.update(buffer.intervals)
+        return test_cases
+
+
+def union_intervals(intervals):
+    '''
+    :param intervals: iterable of (start, end)
+    :return: sorted list of the disjoint [start, end] covering intervals
+    '''
+    union = []
+    for start, end in sorted(intervals):
+        if union and start <= union[-1][1]:
+            if end > union[-1][1]:
+                union[-1][1] = end
+        else:
+            union.append([start, end])
+    return union
+
+
+def get_concurrency(lanes):
+    '''
+    :param lanes: dict of lane -> flat intervals, see ThreadBuffers.pop_intervals
+    :return: (dict of thread name -> [busy seconds, number of timings], wall seconds, overlap seconds)
+             the nested timings of a lane are counted once; overlap is the time spent by
+             several lanes at once, counted once per extra lane
+    '''
+    threads = dict()
+    lane_unions = []
+    for (thread_name, _), flat in lanes.items():
+        lane_union = union_intervals(zip(flat[0::2], flat[1::2]))
+        lane_unions.extend(lane_union)
+        thread = threads.setdefault(thread_name, [0.0, 0])
+        thread[0] += sum(end - start for start, end in lane_union)
+        thread[1] += len(flat) // 2
+    busy = sum(thread[0] for thread in threads.values())
+    wall = sum(end - start for start, end in union_intervals(lane_unions))
+    return threads, wall, max(0.0, busy - wall)
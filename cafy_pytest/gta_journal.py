@@ -0,0 +1,73 @@
+'''
+Per testcase GTA journal (cafy_gta.jsonl)
+
+Every finished testcase is appended as one json line
+{"test": name, "events": {event: {method: {"stats": TimingStats.to_dict()} or {"value": raw}}}}
+and flushed, so the GTA data of a crashed or killed run is kept up to its
+last finished testcase. The reports are built by streaming over the file;
+only an index of the line offsets per testcase is kept in memory.
+'''
+
+import json
+from collections import OrderedDict
+
+from .jsonl import iter_jsonl, parse_json_line
+
+
+class GtaJournal:
+    def __init__(self, path):
+        '''
+        :param path: path of the jsonl file, truncated
+        '''
+        self.path = path
+        self._file = open(path, 'w')
+        self.records = 0
+
+    def append(self, test_case, events):
+        '''
+        :param test_case: testcase name
+        :param events: dict of event -> method -> {"stats": ...} or {"value": ...}
+        '''
+        self._file.write(json.dumps({"test": test_case, "events": events}) + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def index(self):
+        '''
+        :return: OrderedDict of testcase name -> byte offsets of its records, in order of
+                 first appearance; a testcase has several records when it ran several times
+        '''
+        self._file.flush()
+        offsets = OrderedDict()
+        with open(self.path, 'rb') as journal_file:
+            offset = 0
+            for line in journal_file:
+                record = parse_json_line(line)
+                if record is not None:
+                    offsets.setdefault(record["test"], []).append(offset)
+                offset += len(line)
+        return offsets
+
+    def read(self, offsets):
+        '''
+        :param offsets: byte offsets from index()
+        :return: list of the events of the records at offsets
+        '''
+        records = []
+        with open(self.path, 'rb') as journal_file:
+            for offset in offsets:
+                journal_file.seek(offset)
+                records.append(parse_json_line(journal_file.readline())["events"])
+        return records
+
+    def __iter__(self):
+        '''
+        Yields (testcase name, events) of every record
+        '''
+        self._file.flush()
+        for record in iter_jsonl(self.path):
+            yield record["test"], record["events"]
@@ -0,0 +1,207 @@
+'''
+GTA timing of the set*/get* library methods without wrapping them
+
+MethodTimer is told which code objects to time (track()) and records their
+duration through sys.monitoring (python 3.12+) or, on older pythons, through
+sys.setprofile. The user classes are left untouched. The method of each code
+object is looked up once in a dict, and every call stores two numbers into the
+preallocated arrays of a TimingBuffer. With sys.monitoring, code objects which
+are not tracked are disabled after their first call and cost nothing afterwards.
+
+Like the patch backend, a method raising an exception is not recorded. The
+profile 'return' event also fires when a frame exits by an exception, so the
+setprofile backend only records frames which stopped on a return instruction.
+On python < 3.8 a return out of a finally or with block stops on END_FINALLY,
+which also re-raises, so a method returning None from one is not recorded there.
+'''
+
+import dis
+import inspect
+import sys
+import threading
+import time
+from array import array
+
+MONITORING = "monitoring"
+SETPROFILE = "setprofile"
+TOOL_NAME = "cafy-gta"
+
+_NOT_TIMED_FLAGS = inspect.CO_GENERATOR | inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+# instructions a frame returning (not raising) stops on
+_RETURN_OPCODES = frozenset(dis.opmap[name] for name in ('RETURN_VALUE', 'RETURN_CONST') if name in dis.opmap)
+# python < 3.8: a return out of a finally/with block stops on END_FINALLY, which also re-raises
+_END_FINALLY = dis.opmap['END_FINALLY'] if sys.version_info < (3, 8) else None
+
+
+def _returned(frame, arg):
+    '''
+    :return: True if the frame of a profile 'return' event returned, False if it exits by an exception
+    '''
+    opcode = frame.f_code.co_code[frame.f_lasti]
+    if opcode in _RETURN_OPCODES:
+        return True
+    return opcode == _END_FINALLY and arg is not None
+
+
+class TimingBuffer:
+    '''
+    Durations of the tracked methods called during one testcase,
+    kept as (method id, microseconds) in two preallocated arrays
+    '''
+    __slots__ = ('method_ids', 'durations', 'count')
+
+    def __init__(self, capacity=4096):
+        self.method_ids = array('i', [0]) * capacity
+        self.durations = array('d', [0.0]) * capacity
+        self.count = 0
+
+    def append(self, method_id, duration):
+        count = self.count
+        if count == len(self.method_ids):
+            # double the capacity
+            self.method_ids.extend(self.method_ids)
+            self.durations.extend(self.durations)
+        self.method_ids[count] = method_id
+        self.durations[count] = duration
+        self.count = count + 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return zip(self.method_ids[:self.count], self.durations[:self.count])
+
+
+class MethodTimer:
+    def __init__(self, backend=MONITORING, capacity=4096):
+        '''
+        :param backend: MONITORING or SETPROFILE, MONITORING falls back to
+                        SETPROFILE when sys.monitoring is not available or its
+                        profiler tool id is already in use
+        :param capacity: initial capacity of the TimingBuffer of every testcase
+        '''
+        if backend not in (MONITORING, SETPROFILE):
+            raise ValueError("Unknown GTA backend: %s" % backend)
+        self.requested_backend = backend
+        self.backend = None
+        self.capacity = capacity
+        self.methods = []
+        self._method_ids = {}
+        self._local = threading.local()
+        self._test_case_name = None
+        self._buffer = TimingBuffer(capacity)
+        self._tool_id = None
+
+    def track(self, code, event, source, feature_type):
+        '''
+        Time calls of a code object; a code object is tracked once, later calls are ignored
+        :param code: function.__code__
+        :param event: 'set_command' or 'get_command'
+        :param source: name of the method in the report, e.g. Class.method
+        :param feature_type: infra or non-infra
+        :return: True if the code object is timed
+        '''
+        if code in self._method_ids:
+            return True
+        if code.co_flags & _NOT_TIMED_FLAGS:
+            # generators/coroutines return at every yield/await
+            return False
+        self._method_ids[code] = len(self.methods)
+        self.methods.append((event, source, feature_type))
+        if self.backend == MONITORING:
+            # re-enable the events disabled before the code object was tracked
+            sys.monitoring.restart_events()
+        return True
+
+    def begin(self, test_case_name):
+        '''
+        Record the following calls for test_case_name
+        :return: (testcase name, TimingBuffer) of the previous testcase
+        '''
+        previous = (self._test_case_name, self._buffer)
+        self._test_case_name = test_case_name
+        self._buffer = TimingBuffer(self.capacity)
+        return previous
+
+    def start(self):
+        if self.backend is not None:
+            return
+        if self.requested_backend == MONITORING and self._start_monitoring():
+            self.backend = MONITORING
+        else:
+            sys.setprofile(self._profile)
+            threading.setprofile(self._profile)
+            self.backend = SETPROFILE
+
+    def stop(self):
+        if self.backend == MONITORING:
+            monitoring = sys.monitoring
+            monitoring.set_events(self._tool_id, 0)
+            for event in (monitoring.events.PY_START, monitoring.events.PY_RETURN, monitoring.events.PY_UNWIND):
+                monitoring.register_callback(self._tool_id, event, None)
+            monitoring.free_tool_id(self._tool_id)
+            self._tool_id = None
+        elif self.backend == SETPROFILE:
+            sys.setprofile(None)
+            threading.setprofile(None)
+        self.backend = None
+
+    def _start_monitoring(self):
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is None:
+            return False
+        tool_id = monitoring.PROFILER_ID
+        try:
+            monitoring.use_tool_id(tool_id, TOOL_NAME)
+        except ValueError:
+            # another profiler is active
+            return False
+        events = monitoring.events
+        monitoring.register_callback(tool_id, events.PY_START, self._on_start)
+        monitoring.register_callback(tool_id, events.PY_RETURN, self._on_return)
+        monitoring.register_callback(tool_id, events.PY_UNWIND, self._on_unwind)
+        monitoring.set_events(tool_id, events.PY_START | events.PY_RETURN | events.PY_UNWIND)
+        self._tool_id = tool_id
+        return True
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def _on_start(self, code, offset):
+        if code not in self._method_ids:
+            return sys.monitoring.DISABLE
+        self._stack().append(time.perf_counter())
+
+    def _on_return(self, code, offset, retval):
+        method_id = self._method_ids.get(code)
+        if method_id is None:
+            return sys.monitoring.DISABLE
+        end = time.perf_counter()
+        stack = self._stack()
+        if stack:
+            self._buffer.append(method_id, (end - stack.pop()) * 1000000)
+
+    def _on_unwind(self, code, offset, exception):
+        # like the wrapper, a method raising an exception is not recorded
+        if code in self._method_ids:
+            stack = self._stack()
+            if stack:
+                stack.pop()
+
+    def _profile(self, frame, event, arg):
+        if event == 'call':
+            if frame.f_code in self._method_ids:
+                self._stack().append(time.perf_counter())
+        elif event == 'return':
+            method_id = self._method_ids.get(frame.f_code)
+            if method_id is not None:
+                end = time.perf_counter()
+                stack = self._stack()
+                if stack:
+                    start = stack.pop()
+                    if _returned(frame, arg):
+                        self._buffer.append(method_id, (end - start) * 1000000)
@@ -0,0 +1,260 @@
+'''
+Constant memory aggregation of the GTA timings
+
+One TimingStats record is kept per (testcase, event, method) instead of a list
+entry per call, so soak tests with millions of set/get calls do not grow the
+GTA data. Raw samples are only kept when asked for, and at most max_samples of
+them.
+
+Every TimingStats also has a LogHistogram of its timings, from which the
+percentiles are reported. The buckets only depend on the growth factor, so
+histograms of different testcases, workers or runs can be merged by adding
+their bucket counts.
+'''
+
+import math
+
+DEFAULT_GROWTH = 1.02
+MIN_VALUE = 0.001
+PERCENTILES = (50, 90, 99)
+
+
+class LogHistogram:
+    '''
+    Sparse histogram with logarithmic buckets: bucket i holds the values in
+    [growth**i, growth**(i+1)), so every reported value is within
+    (growth - 1) / 2 of the real one whatever its magnitude.
+    '''
+    __slots__ = ('growth', '_log_growth', 'counts', 'count')
+
+    def __init__(self, growth=DEFAULT_GROWTH):
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.counts = {}
+        self.count = 0
+
+    def add(self, value, count=1):
+        index = math.floor(math.log(max(value, MIN_VALUE)) / self._log_growth)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        '''
+        Add the bucket counts of another histogram with the same growth
+        '''
+        if other.growth != self.growth:
+            raise ValueError("Cannot merge histograms of growth %s and %s" % (self.growth, other.growth))
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+
+    def value_at_percentile(self, percentile):
+        '''
+        :param percentile: 0 to 100
+        :return: middle of the bucket holding the percentile, 0.0 when empty
+        '''
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(percentile / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                break
+        return self.growth ** (index + 0.5)
+
+    def to_dict(self):
+        return {"growth": self.growth, "counts": {str(index): count for index, count in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["growth"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+            histogram.count += count
+        return histogram
+
+
+class TimingStats:
+    __slots__ = ('feature_type', 'count', 'total', 'minimum', 'maximum', 'sum_squares',
+                 'max_samples', 'samples', 'histogram')
+
+    def __init__(self, feature_type=None, max_samples=0):
+        '''
+        :param feature_type: infra or non-infra
+        :param max_samples: number of raw samples kept (the first ones), 0 keeps none
+        '''
+        self.feature_type = feature_type
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sum_squares = 0.0
+        self.max_samples = max_samples
+        self.samples = [] if max_samples else None
+        self.histogram = LogHistogram()
+
+    def add(self, elapsed_time):
+        '''
+        :param elapsed_time: duration of one call in microseconds
+        '''
+        self.count += 1
+        self.total += elapsed_time
+        self.sum_squares += elapsed_time * elapsed_time
+        if elapsed_time < self.minimum:
+            self.minimum = elapsed_time
+        if elapsed_time > self.maximum:
+            self.maximum = elapsed_time
+        self.histogram.add(elapsed_time)
+        if self.samples is not None and len(self.samples) < self.max_samples:
+            self.samples.append(elapsed_time)
+
+    def merge(self, other):
+        '''
+        Add the calls recorded by another TimingStats
+        '''
+        self.count += other.count
+        self.total += other.total
+        self.sum_squares += other.sum_squares
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram.merge(other.histogram)
+        if self.samples is not None and other.samples:
+            self.samples.extend(other.samples[:self.max_samples - len(self.samples)])
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return 0.0
+        mean = self.mean
+        return math.sqrt(max(0.0, self.sum_squares / self.count - mean * mean))
+
+    def percentile(self, percentile):
+        '''
+        :param percentile: 0 to 100
+        :return: approximate timing at that percentile, within the recorded min and max
+        '''
+        if not self.count:
+            return 0.0
+        return min(max(self.histogram.value_at_percentile(percentile), self.minimum), self.maximum)
+
+    def latency(self):
+        '''
+        :return: dict of p50, p90, p99 and max timings
+        '''
+        latency = {"p%d" % percentile: round(self.percentile(percentile), 2) for percentile in PERCENTILES}
+        latency["max"] = round(self.maximum, 2) if self.count else 0.0
+        return latency
+
+    def to_dict(self):
+        '''
+        :return: dict for json, min and max are None without calls (json has no infinity)
+        '''
+        stats = {"type": self.feature_type, "count": self.count, "total": self.total,
+                 "min": self.minimum if self.count else None, "max": self.maximum if self.count else None,
+                 "sum_squares": self.sum_squares, "histogram": self.histogram.to_dict()}
+        if self.samples is not None:
+            stats["max_samples"] = self.max_samples
+            stats["samples"] = self.samples
+        return stats
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data["type"], data.get("max_samples", 0))
+        stats.count = data["count"]
+        stats.total = data["total"]
+        if data["min"] is not None:
+            stats.minimum = data["min"]
+        if data["max"] is not None:
+            stats.maximum = data["max"]
+        stats.sum_squares = data["sum_squares"]
+        stats.histogram = LogHistogram.from_dict(data["histogram"])
+        if stats.samples is not None:
+            stats.samples = data["samples"]
+        return stats
+
+    def __repr__(self):
+        return "TimingStats(count=%d, total=%.2f, min=%.2f, max=%.2f, type=%s)" % (
+            self.count, self.total, self.minimum, self.maximum, self.feature_type)
+
+
+def histograms_to_dict(histograms):
+    '''
+    :param histograms: nested dicts whose leaves are LogHistogram
+    :return: the same dicts with the histograms as dicts, for json
+    '''
+    if isinstance(histograms, LogHistogram):
+        return histograms.to_dict()
+    return {key: histograms_to_dict(value) for key, value in histograms.items()}
+
+
+def merge_histogram_dicts(target, source):
+    '''
+    Merge json histograms (see histograms_to_dict) of another run or worker into target
+    :param target: nested dicts whose leaves are LogHistogram, updated in place
+    :param source: nested dicts whose leaves are LogHistogram.to_dict()
+    :return: target
+    '''
+    for key, value in source.items():
+        if "counts" in value and "growth" in value:
+            histogram = LogHistogram.from_dict(value)
+            if key in target:
+                target[key].merge(histogram)
+            else:
+                target[key] = histogram
+        else:
+            merge_histogram_dicts(target.setdefault(key, {}), value)
+    return target
+
+
+class CommandStats(TimingStats):
+    '''
+    TimingStats of an external command, with the count of each exit code and the bytes of output
+    '''
+    __slots__ = ('exit_codes', 'output_bytes')
+
+    def __init__(self, feature_type=None, max_samples=0):
+        super().__init__(feature_type, max_samples)
+        self.exit_codes = {}
+        self.output_bytes = 0
+
+    def add_command(self, elapsed_time, exit_code, output_bytes=None):
+        '''
+        :param elapsed_time: duration of the command in microseconds
+        :param exit_code: exit code of the command
+        :param output_bytes: size of the captured stdout and stderr, None if not captured
+        '''
+        self.add(elapsed_time)
+        self.exit_codes[exit_code] = self.exit_codes.get(exit_code, 0) + 1
+        if output_bytes:
+            self.output_bytes += output_bytes
+
+    def merge(self, other):
+        super().merge(other)
+        if isinstance(other, CommandStats):
+            for exit_code, count in other.exit_codes.items():
+                self.exit_codes[exit_code] = self.exit_codes.get(exit_code, 0) + count
+            self.output_bytes += other.output_bytes
+
+    def latency(self):
+        latency = super().latency()
+        latency["exit_codes"] = {str(exit_code): count for exit_code, count in sorted(self.exit_codes.items())}
+        latency["output_bytes"] = self.output_bytes
+        return latency
+
+    def to_dict(self):
+        stats = super().to_dict()
+        stats["exit_codes"] = {str(exit_code): count for exit_code, count in self.exit_codes.items()}
+        stats["output_bytes"] = self.output_bytes
+        return stats
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = super().from_dict(data)
+        stats.exit_codes = {int(exit_code): count for exit_code, count in data["exit_codes"].items()}
+        stats.output_bytes = data["output_bytes"]
+        return stats
@@ -0,0 +1,177 @@
+'''
+Spooled upload of the GTA data
+
+The GTA data of a run is written as gzip compressed batches of at most
+tests_per_batch testcases into a spool directory (work_dir/gta_spool). A
+GtaSender posts the batches, one POST each, with a bounded number of
+attempts and removes the ones accepted by the GTA endpoint. The endpoint
+gets the batches of a run as plain json documents with the same run_id and
+'batch': {'index', 'count'}; 'aggregated_gta' is only in batch 0. Batches
+left behind (endpoint down or slow, run interrupted) can be replayed later:
+
+    cafy-gta-replay <work_dir>/gta_spool [--url URL]
+'''
+
+import argparse
+import glob
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+
+from .cafygta_config import CafyGTA_Configs
+from .http_client import get_http_client
+
+SPOOL_DIR_NAME = "gta_spool"
+DEFAULT_TESTS_PER_BATCH = 500
+
+
+class GtaSpool:
+    def __init__(self, spool_dir):
+        '''
+        :param spool_dir: directory of the batch files, created if missing
+        '''
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def write_batches(self, run_id, time_report, aggregated_gta_data, tests_per_batch=DEFAULT_TESTS_PER_BATCH):
+        '''
+        Split the GTA data of a run into gzip compressed batch files
+        Each batch is a {'run_id', 'gta', 'batch'} document, 'gta' holds tests_per_batch
+        testcases and 'batch' is {'index', 'count'} of the batch in the run; the first batch
+        also holds 'aggregated_gta'.
+        :param run_id: cafy run id
+        :param time_report: gta data per testcase, dict or iterable of (testcase, gta data) pairs
+        :param aggregated_gta_data: gta data of the run
+        :param tests_per_batch: max testcases per batch
+        :return: paths of the batch files
+        '''
+        if isinstance(time_report, dict):
+            time_report = time_report.items()
+        items = iter(time_report)
+        chunks = []
+        while True:
+            chunk = dict(itertools.islice(items, tests_per_batch))
+            if not chunk and chunks:
+                break
+            chunks.append(chunk)
+            if len(chunk) < tests_per_batch:
+                break
+        paths = []
+        for index, chunk in enumerate(chunks):
+            data = {
+                'run_id': int(run_id),
+                'gta': chunk,
+                'batch': {'index': index, 'count': len(chunks)},
+            }
+            if index == 0:
+                data['aggregated_gta'] = aggregated_gta_data
+            path = os.path.join(self.spool_dir, "gta-%s-%04d.json.gz" % (run_id, index))
+            # written under another name, pending() only lists complete batches
+            with gzip.open(path + ".tmp", 'wt') as batch_file:
+                json.dump(data, batch_file)
+            os.replace(path + ".tmp", path)
+            paths.append(path)
+        return paths
+
+    def pending(self):
+        '''
+        :return: paths of the batch files not uploaded yet, oldest first
+        '''
+        return sorted(glob.glob(os.path.join(self.spool_dir, "gta-*.json.gz")))
+
+
+class GtaSender:
+    def __init__(self, url, api_key, max_attempts=3, backoff=1.0, timeout=30, compress=False):
+        '''
+        :param url: GTA endpoint
+        :param api_key: GTA api key
+        :param max_attempts: attempts per batch
+        :param backoff: seconds before the 2nd attempt, doubled for every following attempt
+        :param timeout: timeout of each request in seconds
+        :param compress: send the batches gzip compressed (Content-Encoding: gzip), by default
+                         they are decompressed from the spool and sent as plain json
+        '''
+        self.url = url
+        self.api_key = api_key
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.compress = compress
+
+    def send(self, path):
+        '''
+        Post one batch file
+        :return: True if the endpoint accepted it
+        '''
+        with open(path, 'rb') as batch_file:
+            body = batch_file.read()
+        headers = {'Content-Type': 'application/json',
+                   'Authorization': 'Bearer {}'.format(self.api_key)}
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = gzip.decompress(body)
+        delay = self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = get_http_client().request('POST', self.url, retry_count=0, data=body,
+                                                     headers=headers, timeout=self.timeout)
+                if response.status_code == 200:
+                    return True
+                print('Failed to upload GTA batch %s (attempt %d/%d), Status code: %s'
+                      % (os.path.basename(path), attempt, self.max_attempts, response.status_code))
+            except Exception as e:
+                print('Failed to upload GTA batch %s (attempt %d/%d): %s'
+                      % (os.path.basename(path), attempt, self.max_attempts, e))
+            if attempt < self.max_attempts:
+                time.sleep(delay)
+                delay *= 2
+        return False
+
+    def drain(self, spool, max_seconds=None):
+        '''
+        Send the pending batches of a spool, oldest first, removing the accepted ones.
+        Stops at the first batch which is not accepted, the rest is left for a replay.
+        :param spool: GtaSpool
+        :param max_seconds: don't start sending a batch after this many seconds
+        :return: (number of batches sent, number of batches left in the spool)
+        '''
+        pending = spool.pending()
+        deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        sent = 0
+        for path in pending:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            if not self.send(path):
+                break
+            os.remove(path)
+            sent += 1
+        return sent, len(pending) - sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cafy-gta-replay',
+                                     description='Upload the GTA batches left in a spool directory')
+    parser.add_argument('spool_dir', help='spool directory, <work_dir>/%s' % SPOOL_DIR_NAME)
+    parser.add_argument('--url', default=CafyGTA_Configs.get_gta_url(), help='GTA endpoint')
+    parser.add_argument('--api-key', default=CafyGTA_Configs.get_api_key(), help='GTA api key')
+    parser.add_argument('--attempts', type=int, default=3, help='attempts per batch, default is 3')
+    parser.add_argument('--timeout', type=float, default=60, help='timeout of each request in seconds, default is 60')
+    parser.add_argument('--compress', action='store_true',
+                        help='send the batches gzip compressed, the endpoint must accept Content-Encoding: gzip')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.spool_dir):
+        parser.error("spool directory not found: %s" % args.spool_dir)
+    sender = GtaSender(args.url, args.api_key, max_attempts=args.attempts,
+                       timeout=args.timeout, compress=args.compress)
+    sent, left = sender.drain(GtaSpool(args.spool_dir))
+    print('GTA batches sent: %d, left in %s: %d' % (sent, args.spool_dir, left))
+    return 1 if left else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
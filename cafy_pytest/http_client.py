@@ -0,0 +1,149 @@
+'''
+Process wide pooled HTTP client
+
+Every call to the debug/registration server, CLS, the live update API and the
+GTA API goes through the sessions kept here, so connections are reused
+(keep-alive) per host instead of paying a TCP/TLS handshake on every request.
+'''
+
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_RETRY_COUNT = 5
+DEFAULT_BACKOFF_FACTOR = 1
+RETRY_STATUS_FORCELIST = [502, 503, 504, 404]
+
+
+class HttpClient:
+    '''
+    Keeps one requests.Session per retry policy. Each session has per host
+    connection pools of pool_maxsize connections for up to pool_connections hosts.
+    '''
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 retry_count=DEFAULT_RETRY_COUNT, backoff_factor=DEFAULT_BACKOFF_FACTOR, timeout=None):
+        '''
+        :param pool_connections: number of hosts whose connection pool is kept
+        :param pool_maxsize: max number of kept-alive connections per host
+        :param retry_count: default number of retries, see request()
+        :param backoff_factor: urllib3 Retry backoff factor
+        :param timeout: default timeout in seconds of requests which don't pass one
+        '''
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.retry_count = retry_count
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._requests_per_host = defaultdict(int)
+
+    def session(self, retry_count=None):
+        '''
+        :param retry_count: number of retries, defaults to the client's retry_count
+        :return: the shared requests.Session for that retry policy
+        '''
+        if retry_count is None:
+            retry_count = self.retry_count
+        session = self._sessions.get(retry_count)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(retry_count)
+                if session is None:
+                    retries = Retry(total=retry_count,
+                                    backoff_factor=self.backoff_factor,
+                                    status_forcelist=RETRY_STATUS_FORCELIST)
+                    session = requests.Session()
+                    for prefix in ('http://', 'https://'):
+                        session.mount(prefix, HTTPAdapter(pool_connections=self.pool_connections,
+                                                          pool_maxsize=self.pool_maxsize,
+                                                          max_retries=retries))
+                    self._sessions[retry_count] = session
+        return session
+
+    def request(self, method, url, retry_count=None, **kwargs):
+        '''
+        Send a request on the pooled session, exceptions are raised like requests.request()
+        :param method: 'GET', 'POST', 'PUT', 'PATCH' or 'DELETE'
+        :param url: url
+        :param retry_count: number of retries, 0 for a single attempt
+        :param kwargs: other requests arguments (json, data, headers, timeout ...)
+        '''
+        if kwargs.get('timeout') is None and self.timeout:
+            kwargs['timeout'] = self.timeout
+        with self._lock:
+            self._requests_per_host[urlparse(url).hostname] += 1
+        return self.session(retry_count).request(method=method, url=url, **kwargs)
+
+    def connection_stats(self):
+        '''
+        :return: dict of host -> {'requests', 'attempts', 'connections', 'reused'}
+                 requests are the calls made through this client, attempts include retries
+        '''
+        stats = {}
+        with self._lock:
+            for host, count in self._requests_per_host.items():
+                stats[host] = {'requests': count, 'attempts': 0, 'connections': 0, 'reused': 0}
+            for session in self._sessions.values():
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+                    for key in pools.keys():
+                        pool = pools.get(key)
+                        if pool is None:
+                            continue
+                        host_stats = stats.setdefault(pool.host, {'requests': 0, 'attempts': 0,
+                                                                  'connections': 0, 'reused': 0})
+                        host_stats['attempts'] += pool.num_requests
+                        host_stats['connections'] += pool.num_connections
+        for host_stats in stats.values():
+            host_stats['reused'] = max(0, host_stats['attempts'] - host_stats['connections'])
+        return stats
+
+    def log_connection_stats(self, logger):
+        '''
+        Log the connection reuse per host
+        :param logger: logger
+        '''
+        for host, host_stats in sorted(self.connection_stats().items()):
+            logger.info(
+                "HTTP client %s: requests=%s attempts=%s new_connections=%s reused_connections=%s",
+                host,
+                host_stats['requests'],
+                host_stats['attempts'],
+                host_stats['connections'],
+                host_stats['reused'],
+            )
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+_http_client = HttpClient()
+
+
+def get_http_client():
+    '''
+    :return: the process wide HttpClient
+    '''
+    return _http_client
+
+
+def configure_http_client(**kwargs):
+    '''
+    Replace the process wide HttpClient, see HttpClient for the arguments
+    :return: the new HttpClient
+    '''
+    global _http_client
+    _http_client.close()
+    _http_client = HttpClient(**kwargs)
+    return _http_client
@@ -0,0 +1,31 @@
+'''
+Reading the json lines files written by the plugin
+
+The run journal, the log index and the GTA journal are appended one json
+line at a time, so a crash or kill can leave the last line cut short. The
+readers skip any line which is not valid json, such a last line included.
+'''
+
+import json
+
+
+def parse_json_line(line):
+    '''
+    :param line: a line of a json lines file, str or bytes
+    :return: the decoded json, None if the line is malformed
+    '''
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def iter_jsonl(path):
+    '''
+    Yields the records of a json lines file, skipping the malformed lines
+    '''
+    with open(path, 'rb') as jsonl_file:
+        for line in jsonl_file:
+            record = parse_json_line(line)
+            if record is not None:
+                yield record
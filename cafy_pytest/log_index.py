@@ -0,0 +1,412 @@
+'''
+Byte offset index of all.log (all.log.idx) and per testcase log extraction
+
+The index has one json line per testcase, appended when its Finish test
+banner is logged:
+
+    {"name", "status", "start", "end", "levels": {level: line count}}
+
+start is the offset of the Start test banner line and end the offset after
+the Finish test banner line, so the log of a testcase is all.log[start:end],
+sliced through mmap without parsing the log. all.log can be compressed into
+seekable frames: independent gzip members (or zstd frames) of frame_size
+uncompressed bytes each, concatenated so that the file is still a plain
+.gz/.zst. The offsets of the frames are kept in <compressed log>.frames and
+only the frames holding the requested range are decompressed.
+
+    cafy-log list <work_dir>
+    cafy-log show <work_dir> TestBgp.test_neighbors
+    cafy-log compress <work_dir> --format zstd
+'''
+
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import zlib
+from bisect import bisect_right
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .jsonl import iter_jsonl
+
+LOG_FILE_NAME = 'all.log'
+INDEX_SUFFIX = '.idx'
+FRAMES_SUFFIX = '.frames'
+COMPRESSED_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+ESCAPE_RE = re.compile(br'\x1b\[[0-9;]*m')
+LEVEL_RE = re.compile(br'^-+([a-zA-Z]+)-+')
+START_TEST_LINE_RE = re.compile(br'Start test:\W+(.*)$')
+END_TEST_LINE_RE = re.compile(br'Finish test:\W+(.*)\W\((.*)\)$')
+
+
+def _decode(value):
+    return value.decode('utf-8', errors='replace').strip()
+
+
+class LogIndexer:
+    '''
+    Incremental indexer of a log file: update() reads the lines appended since the
+    last update and appends the index entries of the testcases they finish
+    '''
+    def __init__(self, log_path, index_path=None):
+        '''
+        :param log_path: path of all.log
+        :param index_path: path of the index, default <log_path>.idx, truncated
+        '''
+        self.log_path = log_path
+        self.index_path = index_path or log_path + INDEX_SUFFIX
+        self._index_file = open(self.index_path, 'w')
+        self._offset = 0
+        self._current = None
+        self._level_names = {}
+        # last entry of each testcase name
+        self.entries = {}
+
+    def update(self):
+        '''
+        Index the complete lines appended to the log since the last update
+        :return: list of the entries of the testcases finished by these lines
+        '''
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, 'rb') as log_file:
+            log_file.seek(self._offset)
+            return self.scan(log_file, partial=False)
+
+    def scan(self, log_file, partial=True):
+        '''
+        Index the lines of a binary file object read from the current offset
+        :param partial: index a last line without newline, else it is read again by the next update
+        :return: list of the finished entries
+        '''
+        finished = []
+        for line in log_file:
+            if not partial and not line.endswith(b'\n'):
+                break
+            end = self._offset + len(line)
+            entry = self._feed(line, end)
+            self._offset = end
+            if entry is not None:
+                finished.append(entry)
+        return finished
+
+    def _level(self, line):
+        level_match = LEVEL_RE.match(line) if line.startswith(b'-') else None
+        if level_match is None:
+            return 'OUT'
+        level = self._level_names.get(level_match.group(1))
+        if level is None:
+            level = self._level_names[level_match.group(1)] = _decode(level_match.group(1)).upper()
+        return level
+
+    def _feed(self, line, end):
+        stripped = line.rstrip(b'\r\n')
+        if b'\x1b' in stripped:
+            stripped = ESCAPE_RE.sub(b'', stripped)
+        start_match = START_TEST_LINE_RE.search(stripped) if b'Start test:' in stripped else None
+        if start_match:
+            # a testcase which was not finished (interrupted run) ends where the next one starts
+            unfinished = self._finish(None, self._offset) if self._current is not None else None
+            self._current = {"name": _decode(start_match.group(1)), "status": None,
+                             "start": self._offset, "end": None, "levels": {}}
+            return unfinished
+        if self._current is None:
+            return None
+        levels = self._current["levels"]
+        level = self._level(stripped)
+        levels[level] = levels.get(level, 0) + 1
+        end_match = END_TEST_LINE_RE.search(stripped) if b'Finish test:' in stripped else None
+        if end_match:
+            return self._finish(_decode(end_match.group(2)), end)
+        return None
+
+    def _finish(self, status, end):
+        entry = self._current
+        entry["status"] = status
+        entry["end"] = end
+        self._current = None
+        self.entries[entry["name"]] = entry
+        self._index_file.write(json.dumps(entry) + "\n")
+        self._index_file.flush()
+        return entry
+
+    def close(self):
+        '''
+        Index the rest of the log, including an unfinished testcase, and close the index
+        :return: list of the finished entries
+        '''
+        if self._index_file.closed:
+            return []
+        finished = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as log_file:
+                log_file.seek(self._offset)
+                finished = self.scan(log_file)
+        return finished + self.close_index()
+
+    def close_index(self):
+        '''
+        Index the unfinished testcase up to the last offset read and close the index
+        :return: list with the entry of the unfinished testcase, if any
+        '''
+        finished = [self._finish(None, self._offset)] if self._current is not None else []
+        self._index_file.close()
+        return finished
+
+
+def iter_log_index(index_path):
+    '''
+    Yields the entries of an index, skipping the malformed lines, e.g. a last line cut short by a crash
+    '''
+    return iter_jsonl(index_path)
+
+
+def find_log(path):
+    '''
+    :param path: work dir, all.log or a compressed all.log
+    :return: path of the log, all.log or else its compressed file in a work dir
+    :raise OSError: if no log is found
+    '''
+    if os.path.isdir(path):
+        for suffix in ('',) + tuple(COMPRESSED_SUFFIXES.values()):
+            log_path = os.path.join(path, LOG_FILE_NAME + suffix)
+            if os.path.exists(log_path):
+                return log_path
+        raise OSError("no %s in %s" % (LOG_FILE_NAME, path))
+    if not os.path.exists(path):
+        raise OSError("log not found: %s" % path)
+    return path
+
+
+def get_log_format(log_path):
+    '''
+    :return: 'gzip', 'zstd' or None for an uncompressed log
+    '''
+    for log_format, suffix in COMPRESSED_SUFFIXES.items():
+        if log_path.endswith(suffix):
+            return log_format
+    return None
+
+
+def get_index_path(log_path):
+    '''
+    :return: path of the index of a log, the index of all.log is also the one of all.log.gz
+    '''
+    log_format = get_log_format(log_path)
+    if log_format is not None:
+        log_path = log_path[:-len(COMPRESSED_SUFFIXES[log_format])]
+    return log_path + INDEX_SUFFIX
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("zstd logs need the zstandard package")
+
+
+def open_log(log_path):
+    '''
+    Open a log, compressed or not, as a binary stream
+    '''
+    log_format = get_log_format(log_path)
+    if log_format == 'gzip':
+        return gzip.open(log_path, 'rb')
+    if log_format == 'zstd':
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(open(log_path, 'rb'), read_across_frames=True,
+                                                          closefd=True)
+    return open(log_path, 'rb')
+
+
+def build_log_index(log_path, index_path=None):
+    '''
+    Index a whole log, compressed or not, e.g. the all.log of a run without an index
+    :return: list of the entries
+    '''
+    indexer = LogIndexer(log_path, index_path or get_index_path(log_path))
+    with open_log(log_path) as log_file:
+        entries = indexer.scan(log_file)
+    return entries + indexer.close_index()
+
+
+def compress_log(log_path, log_format='gzip', frame_size=1024 * 1024, level=None, output_path=None):
+    '''
+    Compress a log into independently compressed frames of frame_size uncompressed bytes
+    :param log_format: 'gzip' or 'zstd'
+    :param level: compression level, default 6 for gzip and 3 for zstd
+    :param output_path: default log_path with the .gz/.zst suffix
+    :return: path of the compressed log, its frame table is written to <path>.frames
+    '''
+    if log_format not in COMPRESSED_SUFFIXES:
+        raise ValueError("unknown log format %s, expected %s" % (log_format, ", ".join(COMPRESSED_SUFFIXES)))
+    output_path = output_path or log_path + COMPRESSED_SUFFIXES[log_format]
+    if log_format == 'zstd':
+        _require_zstandard()
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        compress = compressor.compress
+    else:
+        def compress(data):
+            # wbits 31: a gzip member, each one decompresses on its own
+            gzip_compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+            return gzip_compressor.compress(data) + gzip_compressor.flush()
+    frames = []
+    offset = compressed_offset = 0
+    with open(log_path, 'rb') as log_file, open(output_path + '.tmp', 'wb') as output_file:
+        for chunk in iter(lambda: log_file.read(frame_size), b''):
+            frame = compress(chunk)
+            frames.append([offset, compressed_offset])
+            output_file.write(frame)
+            offset += len(chunk)
+            compressed_offset += len(frame)
+    with open(output_path + FRAMES_SUFFIX, 'w') as frames_file:
+        json.dump({"format": log_format, "size": offset, "compressed_size": compressed_offset,
+                   "frames": frames}, frames_file)
+    os.replace(output_path + '.tmp', output_path)
+    return output_path
+
+
+def read_log_range(log_path, start, end):
+    '''
+    Read the bytes start:end of a log, through mmap, or through the frame table of a compressed log
+    '''
+    log_format = get_log_format(log_path)
+    if log_format is None:
+        with open(log_path, 'rb') as log_file:
+            if os.fstat(log_file.fileno()).st_size == 0:
+                return b''
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                return log_map[start:end]
+    with open(log_path + FRAMES_SUFFIX) as frames_file:
+        table = json.load(frames_file)
+    frames = table["frames"]
+    if not frames or start >= end:
+        return b''
+    offsets = [frame[0] for frame in frames]
+    first = max(0, bisect_right(offsets, start) - 1)
+    last = max(0, bisect_right(offsets, end - 1) - 1)
+    if log_format == 'zstd':
+        _require_zstandard()
+        decompress = zstandard.ZstdDecompressor().decompress
+    else:
+        def decompress(data):
+            return zlib.decompress(data, 31)
+    chunks = []
+    with open(log_path, 'rb') as log_file:
+        for index in range(first, last + 1):
+            compressed_end = frames[index + 1][1] if index + 1 < len(frames) else table["compressed_size"]
+            log_file.seek(frames[index][1])
+            chunks.append(decompress(log_file.read(compressed_end - frames[index][1])))
+    data = b''.join(chunks)
+    return data[start - frames[first][0]:end - frames[first][0]]
+
+
+class LogIndex:
+    def __init__(self, path):
+        '''
+        :param path: work dir, all.log or a compressed all.log, indexed if it has no index
+        '''
+        self.log_path = find_log(path)
+        self.index_path = get_index_path(self.log_path)
+        if os.path.exists(self.index_path):
+            self.entries = list(iter_log_index(self.index_path))
+        else:
+            self.entries = build_log_index(self.log_path, self.index_path)
+
+    def get_entries(self, name):
+        '''
+        :return: entries of a testcase, one per run of it
+        '''
+        return [entry for entry in self.entries if entry["name"] == name]
+
+    def extract(self, name, occurrence=-1):
+        '''
+        :param name: testcase name
+        :param occurrence: index of the run of the testcase, default the last one
+        :return: bytes of the log of the testcase
+        :raise KeyError: if the testcase is not in the index
+        '''
+        entries = self.get_entries(name)
+        if not entries:
+            raise KeyError(name)
+        entry = entries[occurrence]
+        return read_log_range(self.log_path, entry["start"], entry["end"])
+
+
+def _list(index):
+    for entry in index.entries:
+        levels = ", ".join("%s=%s" % item for item in sorted(entry["levels"].items()))
+        print("%s %s %s-%s (%s bytes) %s" % (entry["name"], entry["status"], entry["start"], entry["end"],
+                                             entry["end"] - entry["start"], levels))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cafy-log', description='Extract the log of a testcase from all.log')
+    subparsers = parser.add_subparsers(dest='command')
+    list_parser = subparsers.add_parser('list', help='list the testcases of the index')
+    list_parser.add_argument('log', help='work dir, all.log or a compressed all.log')
+    show_parser = subparsers.add_parser('show', help='print the log of a testcase')
+    show_parser.add_argument('log', help='work dir, all.log or a compressed all.log')
+    show_parser.add_argument('name', help='testcase name, Class.test')
+    show_parser.add_argument('--occurrence', type=int, default=-1,
+                             help='run of the testcase when it was retested, default is the last one')
+    show_parser.add_argument('-o', '--output', help='write the log to OUTPUT instead of stdout')
+    index_parser = subparsers.add_parser('index', help='(re)build the index of a log')
+    index_parser.add_argument('log', help='work dir, all.log or a compressed all.log')
+    compress_parser = subparsers.add_parser('compress', help='compress a log into seekable frames')
+    compress_parser.add_argument('log', help='work dir or all.log')
+    compress_parser.add_argument('--format', dest='log_format', choices=sorted(COMPRESSED_SUFFIXES),
+                                 default='gzip', help='default is gzip')
+    compress_parser.add_argument('--frame-size', type=int, default=1024 * 1024, metavar='BYTES',
+                                 help='uncompressed bytes per frame, default is 1048576')
+    compress_parser.add_argument('--level', type=int, help='compression level')
+    compress_parser.add_argument('--keep', action='store_true', help='keep the uncompressed log')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("a command is needed")
+
+    try:
+        log_path = find_log(args.log)
+        if args.command == 'index':
+            entries = build_log_index(log_path)
+            print('Indexed %d testcases of %s' % (len(entries), log_path))
+            return 0
+        if args.command == 'compress':
+            if get_log_format(log_path) is not None:
+                parser.error("%s is already compressed" % log_path)
+            if not os.path.exists(get_index_path(log_path)):
+                build_log_index(log_path)
+            output_path = compress_log(log_path, args.log_format, frame_size=args.frame_size, level=args.level)
+            print('Compressed %s (%d bytes) to %s (%d bytes)' % (
+                log_path, os.path.getsize(log_path), output_path, os.path.getsize(output_path)))
+            if not args.keep:
+                os.remove(log_path)
+            return 0
+        index = LogIndex(log_path)
+        if args.command == 'list':
+            return _list(index)
+        try:
+            data = index.extract(args.name, args.occurrence)
+        except (KeyError, IndexError):
+            print('%s: no testcase %s' % (index.index_path, args.name), file=sys.stderr)
+            return 1
+    except (OSError, RuntimeError, ValueError) as e:
+        parser.error(str(e))
+    if args.output:
+        with open(args.output, 'wb') as output_file:
+            output_file.write(data)
+    else:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@
 This plugin will cover all the cafy related plugin like email report
 '''
 
+import concurrent.futures
 import getpass
 import html
 import inspect
@@ -15,8 +16,8 @@ import smtplib
 import socket
 import subprocess
 import sys
+import threading
 import time
-import traceback
 import zipfile
 from collections import namedtuple, OrderedDict, defaultdict
 from configparser import ConfigParser
@@ -24,7 +25,7 @@ from datetime import datetime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import COMMASPACE
-from enum import Enum
+from functools import lru_cache, partial
 from shutil import copyfile
 
 import allure
@@ -33,10 +34,7 @@ import requests
 import validators
 import yaml
 import _pytest
-from jinja2 import Template
-from requests.adapters import HTTPAdapter
 from tabulate import tabulate
-from urllib3 import Retry
 from urllib.parse import urlparse
 from _pytest.terminal import TerminalReporter
 from _pytest.runner import runtestprotocol
@@ -47,11 +45,24 @@ from topology.topo_mgr.topo_mgr import Topology
 from utils.cafyexception import CafyException
 from utils.collectors.confest import Config
 
+# the log grouping classes moved to all_log, imported here for the code importing them from the plugin
+from .all_log import (GenericLogGrouping, LogGrouping, LogLine, LogState, TestCase,
+                      iter_log_groupings, iter_log_snapshot, write_all_log_html,
+                      write_compact_all_log_html)
+from .attachments import AttachmentStore, attach, get_attachment_store, set_attachment_store
 from .cafy import Cafy
 from .cafy_gta import TimeCollectorPlugin
+from .gta_budget import TimeBudgets
 from .cafy_pdb import CafyPdb
 from .cafypdb_config import CafyPdb_Configs
-from .cls_debug import resolve_cls_configuration, parse_logstash_port_value
+from .finish_pipeline import FinishPipeline
+from .log_index import LOG_FILE_NAME, LogIndexer
+from .cls_debug import ClsNotifier, resolve_cls_configuration, parse_logstash_port_value, requests_retry
+from .http_client import configure_http_client, get_http_client
+from .run_journal import (RUN_JOURNAL_FILE_NAME, RunJournal, iter_mode_report, iter_retest_data,
+                          write_json_dict, write_json_list)
+from .templates import ReportTemplates
+from .testlog_render import TestLogRenderer
 
 
 collection_setup = Config()
@@ -99,6 +110,13 @@ if cafy_args:
 class _CafyConfig:
     allure_server = "file://"
     summary = {}
+    # session finish steps past their timeout may still update the summary while it is written
+    summary_lock = threading.Lock()
+
+    @classmethod
+    def set_summary(cls, key, value):
+        with cls.summary_lock:
+            cls.summary[key] = value
 
 @pytest.hookimpl(tryfirst=True)
 def pytest_addoption(parser):
@@ -159,6 +177,47 @@ def pytest_addoption(parser):
     group.addoption('--no-testcase-html', dest='testlog_attachment', action='store_true',
                     default=False,
                     help='If True, attaches testlog html to each testcase of allure report. Default is False.')
+    group.addoption('--testcase-html-async', dest='testlog_async_render', action='store_true',
+                    default=False,
+                    help='Render the testlog html of each testcase in background threads instead of '
+                         'in teardown. Default is False.')
+    group.addoption('--testcase-html-workers', dest='testlog_render_workers', type=int,
+                    default=2, metavar='N',
+                    help='Number of background threads used by --testcase-html-async. Default is 2.')
+    group.addoption('--no-attachment-store', dest='attachment_store', action='store_false', default=True,
+                    help='Attach through allure.attach instead of storing the attachments once per content '
+                         '(<sha256>-attachment.<ext>) in the allure results dir.')
+    group.addoption('--compress-attachments', dest='compress_attachments', action='store_true', default=False,
+                    help='Store the allure attachments gzip-compressed as <ext>.gz, the report server must '
+                         'serve .gz files with Content-Encoding: gzip. Default is False.')
+    group.addoption('--compress-attachments-min-size', dest='compress_attachments_min_size', type=int,
+                    default=64 * 1024, metavar='BYTES',
+                    help='Min size of the attachments compressed by --compress-attachments, the test_log '
+                         'html is always compressed. Default is 65536.')
+    group.addoption('--all-log-html', dest='all_log_html', choices=('full', 'compact'), default='full',
+                    help='Format of all.log.html: full inlines every log line of every testcase in the page, '
+                         'compact writes each line once to per testcase chunks in all.log.html.chunks, '
+                         'loaded when the testcase is opened. Default is full.')
+    group.addoption('--no-log-index', dest='log_index', action='store_false', default=True,
+                    help='Do not index the byte offsets of the testcases of all.log in all.log.idx '
+                         '(used by cafy-log to extract the log of a testcase).')
+    group.addoption('--template-cache-dir', dest='template_cache_dir', metavar='DIR', default=None,
+                    help='Persist the compiled report templates in DIR and reuse them in later runs')
+    group.addoption('--run-journal', dest='run_journal', action='store_true', default=False,
+                    help='Append a record per testcase phase report to run_journal.jsonl in the work dir '
+                         'as the tests finish, retest_data.json and testcase_mode.json are then derived '
+                         'from it. Default is False.')
+    group.addoption('--run-journal-fsync-interval', dest='run_journal_fsync_interval', type=float,
+                    default=1.0, metavar='SECONDS',
+                    help='Max seconds between two fsyncs of the run journal, 0 fsyncs every record. '
+                         'Default is 1.0.')
+    group.addoption('--finish-workers', dest='finish_workers', type=int, default=4, metavar='N',
+                    help='Number of session finish steps (allure report, debug logs, email ...) run at once. '
+                         'Default is 4.')
+    group.addoption('--finish-step-timeout', dest='finish_step_timeout', type=float, default=900,
+                    metavar='SECONDS',
+                    help='Timeout of each session finish step, their timings are recorded in summary.json. '
+                         'Default is 900.')
 
 
     group.addoption('-R','--report-dir', dest="reportdir",
@@ -205,6 +264,39 @@ def pytest_addoption(parser):
                     help='Variable to enable cafykit debug, default is False')
     group.addoption('--snapshot-enable', dest='snapshot_enable', action='store_true',
                     help='Variable to enable snapshot, default is False')
+    group.addoption('--snapshot-async', dest='snapshot_async', action='store_true',
+                    help='Collect the first failure snapshot in the background while the tests '
+                         'keep running, default is False')
+    group.addoption('--cls-sync-update', dest='cls_sync_update', action='store_true',
+                    help='Send the CLS case-update inline in each testcase setup instead of from '
+                         'a background thread, default is False')
+    group.addoption('--debug-collector-async', dest='debug_collector_async', action='store_true',
+                    help='Wait for debug collections of failed testcases in the background and '
+                         'join them at the end of the session, default is False')
+    group.addoption('--debug-status-max-interval', dest='debug_status_max_interval', type=float,
+                    metavar='SECONDS', default=None,
+                    help='Max seconds between polls of the collection/snapshot status, polls back '
+                         'off exponentially up to it, default is 30 (collection) and 90 (snapshot)')
+    group.addoption('--debug-status-long-poll', dest='debug_status_long_poll', type=int,
+                    metavar='SECONDS', default=0,
+                    help='Ask the debug server to hold each status poll open up to SECONDS '
+                         '(long polling), default is 0 (disabled)')
+    group.addoption('--debug-join-timeout', dest='debug_join_timeout', type=float,
+                    metavar='SECONDS', default=2700,
+                    help='Max seconds to wait at the end of the session for background debug '
+                         'collections, default is 2700')
+
+    group = parser.getgroup('HTTP Client')
+    group.addoption('--http-pool-size', dest='http_pool_size', type=int, metavar='N',
+                    default=10,
+                    help='Max number of kept-alive connections per host, and of hosts whose connections '
+                         'are kept, for debug/CLS/live update/GTA HTTP calls, default is 10')
+    group.addoption('--http-retries', dest='http_retries', type=int, metavar='N',
+                    default=5,
+                    help='Default number of retries of debug/CLS HTTP calls, default is 5')
+    group.addoption('--http-timeout', dest='http_timeout', type=float, metavar='SECONDS',
+                    default=None,
+                    help='Timeout of HTTP calls which do not set their own, default is no timeout')
 
     group = parser.getgroup('Script Arguments')
     group.addoption('--script-args', action='store', dest='script_args',
@@ -237,6 +329,51 @@ def pytest_addoption(parser):
     group = parser.getgroup('Cafy gta ')
     group.addoption('--cafygta', dest='cafygta', action='store_true',
                     help='Variable to enable cafy gta, default is False')
+    group.addoption('--cafygta-backend', dest='cafygta_backend', default='patch',
+                    choices=['patch', 'monitoring', 'setprofile'],
+                    help='How cafy gta times set/get methods: patch wraps them in their classes, '
+                         'monitoring uses sys.monitoring (python 3.12+, else setprofile), '
+                         'setprofile uses sys.setprofile, default is patch. With every backend a method '
+                         'raising an exception is not timed (with setprofile on python < 3.8, neither is '
+                         'one returning None from a finally/with block)')
+    group.addoption('--cafygta-samples', dest='cafygta_samples', type=int, metavar='N', default=0,
+                    help='Number of raw timings kept per testcase and method besides the '
+                         'count/sum/min/max aggregates, default is 0')
+    group.addoption('--cafygta-incremental', dest='cafygta_incremental', action='store_true',
+                    help='Append the gta data of every finished testcase to cafy_gta.jsonl and build '
+                         'cafy_gta.json from it at the end, default is False')
+    group.addoption('--cafygta-threads', dest='cafygta_threads', action='store_true',
+                    help='Attribute gta timings of the threads, executors and asyncio tasks a testcase '
+                         'starts to that testcase, time asyncio sleeps/waits and report per thread, '
+                         'wall and overlap time, default is False')
+    group.addoption('--cafygta-subprocess', dest='cafygta_subprocess', action='store_true',
+                    help='Time the subprocess (subprocess.run, Popen ...) and os.system commands run by '
+                         'the testcases in the exc_command event, with their exit codes and output size, '
+                         'default is False')
+    group.addoption('--cafygta-phases', dest='cafygta_phases', action='store_true',
+                    help='Time the setup, call and teardown phases and the fixtures (with their scope) '
+                         'of the testcases, and report the time not attributed to them, default is False')
+    group.addoption('--cafygta-devices', dest='cafygta_devices', action='store_true',
+                    help='Also time the set/get methods per topology device of the call (instance, its '
+                         'device/connection attribute or argument) with the patch backend, and print a '
+                         'per device summary table, default is False')
+    group.addoption('--cafygta-budget-file', dest='cafygta_budget_file', metavar='PATH', default=None,
+                    help='Yaml or json file of the default and per testcase (patterns) time budgets in seconds, '
+                         'checked at teardown like the time_budget markers')
+    group.addoption('--cafygta-budget-strict', dest='cafygta_budget_strict', action='store_true',
+                    help='Fail the testcases exceeding their time budget instead of warning, default is False')
+    group.addoption('--cafygta-upload-batch-size', dest='cafygta_upload_batch_size', type=int,
+                    metavar='N', default=500,
+                    help='Max testcases per gta upload batch, default is 500. The gta data of a run is '
+                         'posted as one json document per batch, all with the run_id and '
+                         '"batch": {"index", "count"}, "aggregated_gta" is only in batch 0')
+    group.addoption('--cafygta-upload-timeout', dest='cafygta_upload_timeout', type=float,
+                    metavar='SECONDS', default=30,
+                    help='Timeout of each gta upload request, batches not sent are left in '
+                         'work_dir/gta_spool for cafy-gta-replay, default is 30')
+    group.addoption('--cafygta-upload-compress', dest='cafygta_upload_compress', action='store_true',
+                    help='Upload the gta batches gzip compressed (Content-Encoding: gzip), the endpoint '
+                         'must accept it, default is False')
     
     
 def is_valid_param(arg, file_type=None):
@@ -323,67 +460,10 @@ def _cls_host_hostname(cls_host):
     except Exception:
         return None
 
-def _requests_retry(logger, url, method, data=None, files=None,  headers=None, timeout=None, retry_count=5, **kwargs):
-    """ Retry Connection to server and database.
-
-    Args:
-        url: String of URL .
-        method: String of 'GET', 'POST', 'PUT' or 'DELETE'.
-        **kwargs: Other Response arguments
-
-    Examples:
-        # without JSON serializer
-        _requests_retry(url, 'POST', json=context)
-        # with JSON serializer
-        _requests_retry(url, 'POST', data=json.dumps(context,
-                             default=json_serial))
-    """
-    retries = Retry(total=retry_count,
-                    backoff_factor=1,
-                    status_forcelist=[502, 503, 504, 404])
-    s = requests.Session()
-    s.mount('http://', HTTPAdapter(max_retries=retries))
-    s.mount('https://', HTTPAdapter(max_retries=retries))
-
-    response = None
-    try:
-        if method in ['GET', 'PUT', 'PATCH', 'POST', 'DELETE']:
-            #kwargs['headers'] = {'Content-Type': 'application/json'}
-            if files:
-                kwargs['files'] = files
-            if data:
-                kwargs['data'] = data
-            if headers:
-                kwargs['headers'] = headers
-            if timeout:
-                kwargs['timeout']  = timeout
-            response = s.request(method=method, url=url, **kwargs)
-
-
-        if response.status_code != 200:
-            logger.warning("HTTP Status Code: {0}\n{1}"
-                              .format(response.status_code, response.text))
-    except requests.exceptions.RetryError as e:
-        # 5XX Database/SQLAlchemy Error handling
-        logger.warning(repr(e))
-        logger.warning(traceback.format_exc())
-        logger.warning("URL and method: {0}\n{1}"
-                       .format(url, method))
-        logger.warning("kwargs={}".format(kwargs))
-    except requests.exceptions.ConnectionError as e:
-        # Server Connection Error
-        logger.warning(repr(e))
-        logger.warning(traceback.format_exc())
-        logger.warning("URL and method: {0}\n{1}"
-                       .format(url, method))
-        logger.warning("kwargs={}".format(kwargs))
-    except Exception as e:
-        logger.warning(repr(e))
-        logger.warning(traceback.format_exc())
-        logger.warning("URL and method: {0}\n{1}"
-                       .format(url, method))
-        logger.warning("kwargs={}".format(kwargs))
-    return response
+def _requests_retry(logger, url, method, data=None, files=None,  headers=None, timeout=None, retry_count=None, **kwargs):
+    """ Retry Connection to server and database, see cls_debug.requests_retry """
+    return requests_retry(logger, url, method, data=data, files=files, headers=headers,
+                          timeout=timeout, retry_count=retry_count, **kwargs)
 
 @pytest.hookimpl(tryfirst=True)
 def pytest_configure(config):
@@ -413,10 +493,16 @@ def pytest_configure(config):
         collection_list.extend(item.split(","))
     cafypdb = config.option.cafypdb
     cafygta = config.option.cafygta
+    configure_http_client(pool_connections=config.option.http_pool_size,
+                          pool_maxsize=config.option.http_pool_size,
+                          retry_count=config.option.http_retries,
+                          timeout=config.option.http_timeout)
     # register additional markers
     config.addinivalue_line("markers", "Future(name): mark test that are planned for future")
     config.addinivalue_line("markers", "Feature(name): mark feature of a testcase")
     config.addinivalue_line("markers", "autofail(name): mark test to Fail when  this testcase has triggered autofail condition")
+    config.addinivalue_line("markers", "time_budget(total, sleep, set_command, get_command, exc_command): "
+                                       "seconds of gta time allowed to the test, checked at teardown with --cafygta")
     if script_list:
         script_path = script_list[0]
         if '::' in script_path:
@@ -621,7 +707,9 @@ def pytest_configure(config):
                     'debug_file': test_input_file_path,
                     'topo_file' : topo_file_path,
                     'test_name' : script_name,
-                    'debug_server' : CafyLog.debug_server
+                    'debug_server' : CafyLog.debug_server,
+                    'status_backoff_ceiling': config.option.debug_status_max_interval,
+                    'status_long_poll': config.option.debug_status_long_poll
             }
             ## Only needed in case if debug is enabled.
             from .cls_debug import DebugAdapter
@@ -639,6 +727,10 @@ def pytest_configure(config):
                 with open(os.path.join(CafyLog.work_dir, "cafy_reg_id.txt"), "w") as f:
                                 f.write(reg_dict['reg_id'])
 
+        if config.option.attachment_store:
+            set_attachment_store(AttachmentStore(config,
+                                                 compress=config.option.compress_attachments,
+                                                 compress_min_size=config.option.compress_attachments_min_size))
         config._email = EmailReport(config.option,
                                     email_list,
                                     email_from,
@@ -654,7 +746,24 @@ def pytest_configure(config):
                                     cafypdb)
         config.pluginmanager.register(config._email)
         if cafygta:
-            config.pluginmanager.register(TimeCollectorPlugin())
+            time_budgets = None
+            if config.option.cafygta_budget_file:
+                try:
+                    time_budgets = TimeBudgets.from_file(config.option.cafygta_budget_file)
+                except (OSError, ValueError, yaml.YAMLError) as e:
+                    pytest.exit('Invalid gta budget file %s: %s' % (config.option.cafygta_budget_file, e))
+            config.pluginmanager.register(TimeCollectorPlugin(backend=config.option.cafygta_backend,
+                                                               max_samples=config.option.cafygta_samples,
+                                                               upload_batch_size=config.option.cafygta_upload_batch_size,
+                                                               upload_timeout=config.option.cafygta_upload_timeout,
+                                                               upload_compress=config.option.cafygta_upload_compress,
+                                                               incremental=config.option.cafygta_incremental,
+                                                               thread_aware=config.option.cafygta_threads,
+                                                               time_subprocesses=config.option.cafygta_subprocess,
+                                                               time_phases=config.option.cafygta_phases,
+                                                               per_device=config.option.cafygta_devices,
+                                                               time_budgets=time_budgets,
+                                                               budget_strict=config.option.cafygta_budget_strict))
 
         #Write all.log path to terminal
         reporter = TerminalReporter(config, sys.stdout)
@@ -670,6 +779,7 @@ def pytest_unconfigure(config):
     if email:
         del config._email
         config.pluginmanager.unregister(email)
+    set_attachment_store(None)
     # removed the env set by this plugins
     arc_dir = 'ARCHIVE_DIR'
     if os.environ.get(arc_dir):
@@ -691,6 +801,13 @@ def pytest_unconfigure(config):
             config.pluginmanager.unregister(time_collector_plugin)
     except:
         pass
+    # The GTA upload in pytest_terminal_summary is the last HTTP call of the session
+    http_client = get_http_client()
+    try:
+        http_client.log_connection_stats(CafyLog("cafy"))
+    except Exception:
+        pass
+    http_client.close()
 
 def pytest_generate_tests(metafunc):
 
@@ -792,7 +909,7 @@ def pytest_collection_modifyitems(session, config, items):
                 log.info("url: {}".format(url))
                 log.info("Calling API service for live logging of reg_id ")
                 params = {"reg_id": CafyLog.registration_id}
-                response = requests.patch(url, json=params, headers=headers, timeout=120)
+                response = get_http_client().request('PATCH', url, retry_count=0, json=params, headers=headers, timeout=120)
                 if response.status_code == 200:
                     log.info("Calling API service for live logging of reg_id successful")
                 else:
@@ -817,7 +934,7 @@ def pytest_collection_modifyitems(session, config, items):
             url = '{0}/api/runs/{1}/cases'.format(os.environ.get('CAFY_API_HOST'), os.environ.get('CAFY_RUN_ID'))
             log.debug("url: {}".format(url))
             log.debug("Calling API service for live logging of collected testcases ")
-            response = requests.post(url, json=CafyLog.collected_testcases, headers=headers, timeout=120)
+            response = get_http_client().request('POST', url, retry_count=0, json=CafyLog.collected_testcases, headers=headers, timeout=120)
             if response.status_code == 200:
                 log.info("Calling API service for live logging of collected testcases successful")
             else:
@@ -940,11 +1057,36 @@ class EmailReport(object):
         self.cafypdb_user_action = ''
         self.first_failure_detected = False
         self.first_failed_testcase_name = None
+        self.snapshot_future = None
+        self.snapshot_started = None
+        # set once the session finish stopped waiting for the snapshot, its late result is not recorded
+        self.snapshot_abandoned = False
         self.teardown_reporting_cases = 0
         self.teardown_reporting_total_seconds = 0.0
         self.teardown_reporting_parse_seconds = 0.0
         self.teardown_reporting_render_seconds = 0.0
         self.teardown_reporting_attach_seconds = 0.0
+        # CLS case-updates are sent from a background thread unless --cls-sync-update
+        self.cls_notifier = None
+        if cls_object is not None and not getattr(config_option, 'cls_sync_update', False):
+            self.cls_notifier = ClsNotifier(self.update_cls_testcase, logger=self.log)
+        self.templates = ReportTemplates(getattr(config_option, 'template_cache_dir', None))
+        self.attachment_store = get_attachment_store()
+        self.testlog_renderer = None
+        if getattr(config_option, 'testlog_async_render', False) and not config_option.testlog_attachment:
+            template = self.templates.get_template("all_log_template.html")
+            self.testlog_renderer = TestLogRenderer(template, self.log,
+                                                    max_workers=max(1, config_option.testlog_render_workers),
+                                                    attachment_store=self.attachment_store)
+        self.run_journal = None
+        if CafyLog.work_dir and getattr(config_option, 'run_journal', False):
+            self.run_journal = RunJournal(os.path.join(CafyLog.work_dir, RUN_JOURNAL_FILE_NAME),
+                                          fsync_interval=config_option.run_journal_fsync_interval)
+        # test_log attachment of each testcase, journaled with its teardown report
+        self.test_log_paths = {}
+        self.log_indexer = None
+        if CafyLog.work_dir and getattr(config_option, 'log_index', False):
+            self.log_indexer = LogIndexer(os.path.join(CafyLog.work_dir, LOG_FILE_NAME))
 
     def _sendemail(self):
         print("\nSending Summary Email to %s" % self.email_addr_list)
@@ -994,14 +1136,8 @@ class EmailReport(object):
                            'collection_report': self.collection_report}
         report = CafyReportData(**cafy_kwargs)
         setattr(report,"tabulate_html", self.tabulate_html)
-        template_file = os.path.join(self.CURRENT_DIR,
-                                     "resources/mail_template.html")
-        css_file = os.path.join(self.CURRENT_DIR,
-                                "resources/cafy_report.css")
-        with open(template_file) as html_src, open(css_file) as css_src:
-            html_template = html_src.read()
-            styles = css_src.read()
-        template = Template(html_template)
+        template = self.templates.get_template("mail_template.html")
+        styles = self.templates.get_resource("cafy_report.css")
         cafy_report_rendered = template.render(report=report,
                                                styles=styles)
         return cafy_report_rendered
@@ -1085,20 +1221,28 @@ class EmailReport(object):
             pass
 
 
-    def update_cls_testcase(self, test_case):
+    def refresh_cls_configuration(self):
         '''
-        update cls with test case change update
-        :param testcase:
-        :return:
+        Resolve the CLS configuration again (cls_data_file.json may have been rewritten), on the main thread
+        :return: cls host
         '''
         global CLS, cls_host, LOGSTASH_SERVER, LOGSTASH_PORT, CLS_RESOLVED_REG_ID
         wd = CafyLog.work_dir
         if wd and cls_object is not None:
             CLS, cls_host, LOGSTASH_SERVER, LOGSTASH_PORT, CLS_RESOLVED_REG_ID = resolve_cls_configuration(wd)
             cls_object.cls_host = cls_host
+        return cls_host
+
+    def update_cls_testcase(self, test_case, cls_host=None):
+        '''
+        update cls with test case change update
+        :param testcase:
+        :param cls_host: cls host resolved when the testcase started, see refresh_cls_configuration
+        :return:
+        '''
         if cls_object is None:
             return None
-        return cls_object.update_cls_testcase(test_case=test_case)
+        return cls_object.update_cls_testcase(test_case=test_case, cls_host=cls_host)
 
     def initiate_analyzer(self, test_case):
         return register_object.initiate_analyzer(testcase=test_case)
@@ -1108,7 +1252,12 @@ class EmailReport(object):
         test_case = self.get_test_name(item.nodeid)
         self.log.set_testcase(test_case)
         if CLS and int(CLS) and CafyLog.registration_id:
-            self.update_cls_testcase(test_case)
+            # the notifier thread only gets the resolved values, the module globals are set here
+            resolved_cls_host = self.refresh_cls_configuration()
+            if self.cls_notifier is not None:
+                self.cls_notifier.notify(test_case, resolved_cls_host)
+            else:
+                self.update_cls_testcase(test_case, resolved_cls_host)
         if item == CafyLog.first_test and self.reg_dict:
             self.initiate_analyzer(test_case)
 
@@ -1189,11 +1338,30 @@ class EmailReport(object):
                             result.outcome = "failed"
                             allure_log_msg = f"Teardown failed due to analyzer custom condition and {CafyLog.fail_log_msg}"
                             result.longrepr = allure_log_msg
-                            allure.attach(allure_log_msg, name="Teardown Error", attachment_type=allure.attachment_type.TEXT)
+                            attach(allure_log_msg, name="Teardown Error", attachment_type=allure.attachment_type.TEXT)
                         self.log.info('Analyzer Status is {}'.format(analyzer_status))
                     else:
                         self.log.info('Analyzer is not invoked as testcase failed in setup')
-                if not self.config_option.testlog_attachment:
+                if self.testlog_renderer is not None and \
+                        self.testlog_renderer.submit(item.config, testcase_name, result.capstdout):
+                    self.test_log_paths[testcase_name] = self.testlog_renderer.last_attachment_path
+                    self.log.info("Teardown reporting HTML generation for %s queued to background", testcase_name)
+                elif not self.config_option.testlog_attachment and \
+                        self.attachment_store is not None and self.attachment_store.active:
+                    # parsed and rendered straight into the attachment file, the html is never held in memory
+                    render_start = time.perf_counter()
+                    template = self.templates.get_template("all_log_template.html")
+                    with self.attachment_store.writer('test_log', allure.attachment_type.HTML) as attachment_file:
+                        write_all_log_html(template, result.capstdout.split('\n'), attachment_file)
+                    self.test_log_paths[testcase_name] = os.path.join(self.attachment_store.report_dir,
+                                                                      attachment_file.file_name)
+                    render_elapsed = time.perf_counter() - render_start
+                    self.log.info(
+                        "Teardown reporting template render for %s took %.3fs",
+                        testcase_name,
+                        render_elapsed,
+                    )
+                elif not self.config_option.testlog_attachment:
                     parse_start = time.perf_counter()
                     all_log_groupings = self._parse_all_log(result.capstdout.split('\n'))
                     parse_elapsed = time.perf_counter() - parse_start
@@ -1202,12 +1370,8 @@ class EmailReport(object):
                         testcase_name,
                         parse_elapsed,
                     )
-                    template_file_name = os.path.join(self.CURRENT_DIR,
-                                            "resources/all_log_template.html")
                     render_start = time.perf_counter()
-                    with open(template_file_name) as html_src:
-                        html_template = html_src.read()
-                        template = Template(html_template)
+                    template = self.templates.get_template("all_log_template.html")
                     stdout_html = template.render(log_groupings = all_log_groupings)
                     render_elapsed = time.perf_counter() - render_start
                     self.log.info(
@@ -1426,6 +1590,7 @@ class EmailReport(object):
     pytest.hookimpl(tryfirst=True)
     def pytest_runtest_logreport(self, report):
         testcase_name =  self.get_test_name(report.nodeid)
+        retest_count = len(self.log.buffer_to_retest) if self.run_journal is not None else 0
         if report.when == 'setup':
             self.log.set_testcase(testcase_name)
             self.log.title("Start test:  %s" %(testcase_name))
@@ -1505,7 +1670,7 @@ class EmailReport(object):
                     # self.log.debug("url: {}".format(url))
                     # self.log.debug("Calling API service for live logging of executed testcases ")
                     # self.log.debug("JSON = {0}".format(json.dumps(CafyLog.collected_testcases, indent=4, sort_keys=True)))
-                    response = requests.post(url, json=CafyLog.collected_testcases, headers=headers)
+                    response = get_http_client().request('POST', url, retry_count=0, json=CafyLog.collected_testcases, headers=headers)
                     if response.status_code == 200:
                         self.log.info("Calling API service for live logging of executed testcase successful")
                     else:
@@ -1543,6 +1708,7 @@ class EmailReport(object):
                 self.model_coverage_report[testcase_name]=CafyLog.model_tracker_dict
                 CafyLog.model_tracker_dict={}
             self.log.title("Finish test: %s (%s)" %(testcase_name,status))
+            self._update_log_index()
             Cafy.RunInfo.block_exception = list()
             self.log.info("="*80)
 
@@ -1639,7 +1805,50 @@ class EmailReport(object):
                         self.testcase_failtrace_dict[testcase_name] = None
                 else:
                     self.temp_json["stack_exception"]= ""
-    
+        if self.run_journal is not None:
+            self.append_run_journal(report, testcase_name, retest_count)
+
+    def append_run_journal(self, report, testcase_name, retest_count):
+        '''
+        Append the phase report of a testcase to the run journal
+        :param retest_count: length of log.buffer_to_retest before the report was processed,
+                             the retest_data.json entries added by a teardown are journaled with it
+        '''
+        testcase = self.testcase_dict.get(testcase_name)
+        record = {
+            "name": testcase_name,
+            "nodeid": report.nodeid,
+            "when": report.when,
+            "outcome": report.outcome,
+            "status": testcase.status if testcase is not None else report.outcome,
+            "duration": report.duration,
+            "start": getattr(report, "start", None),
+            "stop": getattr(report, "stop", None),
+            "mode": self.hybrid_mode_status_dict.get(testcase_name),
+            "fail_message": report.longreprtext if report.failed else None,
+            "artifacts": {"all_log": os.path.join(CafyLog.work_dir, "all.log")},
+        }
+        if report.when == 'teardown':
+            test_log_path = self.test_log_paths.pop(testcase_name, None)
+            if test_log_path is not None:
+                record["artifacts"]["test_log"] = test_log_path
+            log_entry = self.log_indexer.entries.get(testcase_name) if self.log_indexer is not None else None
+            if log_entry is not None:
+                record["artifacts"]["all_log_range"] = [log_entry["start"], log_entry["end"]]
+            record["retest"] = self.log.buffer_to_retest[retest_count:]
+            record["mode_report"] = self.report_dump.get(testcase_name)
+        try:
+            self.run_journal.append(record)
+        except Exception as e:
+            self.log.warning("Error while writing the run journal: {}".format(e))
+
+    def _update_log_index(self):
+        if self.log_indexer is None:
+            return
+        try:
+            self.log_indexer.update()
+        except Exception as e:
+            self.log.warning("Error while indexing all.log: {}".format(e))
 
     def check_call_report(self, item, nextitem):
         """
@@ -2112,9 +2321,23 @@ class EmailReport(object):
         will call debug service api to start collection
         :param params: failure details of testcase for given run
         :param headers: headers associated with api request call
+        :return: response, or None when the collection is waited for in the background
         """
+        if getattr(self.config_option, 'debug_collector_async', False):
+            future = register_object.collector_call_future(params=params, headers=headers)
+            future.add_done_callback(partial(self._log_background_collection, params.get('testcase_name')))
+            return None
         return register_object.collector_call(params=params, headers=headers)
 
+    def _log_background_collection(self, testcase_name, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            self.log.warning("Debug collection for %s failed: %s" % (testcase_name, e))
+            return
+        if response is not None and response.status_code == 200 and response.text:
+            self.log.info("%s: Debug Collector logs: %s" % (testcase_name, response.text))
+
     def invoke_reg_on_failed_testcase_snapshot(self, params, headers):
         """
         will call debug service api to start collection
@@ -2122,7 +2345,49 @@ class EmailReport(object):
         :param headers: headers associated with api request call
         """
         self.log.info(f"Invoking snapshot collection for first failure with params: {params}")
-        return register_object.collector_call_snapshot(params=params, headers=headers)
+        testcase_name = params.get("testcase_name")
+        started = time.time()
+        if getattr(self.config_option, 'snapshot_async', False):
+            # own logger so the snapshot lines are told apart from the running testcases
+            snapshot_adapter = register_object.with_logger(CafyLog("snapshot"))
+            self.snapshot_started = started
+            self._record_snapshot(testcase_name, "background", started, "running")
+            self.snapshot_future = register_object.status_waiter.submit(
+                self._collect_snapshot, snapshot_adapter, params, headers, "background", started)
+            return None
+        return self._collect_snapshot(register_object, params, headers, "inline", started)
+
+    def _collect_snapshot(self, adapter, params, headers, mode, started):
+        testcase_name = params.get("testcase_name")
+        response = None
+        try:
+            response = adapter.collector_call_snapshot(params=params, headers=headers)
+        finally:
+            status = "completed" if response is not None and response.status_code == 200 else "failed"
+            self._record_snapshot(testcase_name, mode, started, status, response)
+            adapter.logger.info("First failure snapshot for %s %s in %.1fs" % (testcase_name, status, time.time() - started))
+        return response
+
+    def _record_snapshot(self, testcase_name, mode, started, status, response=None):
+        '''
+        Record the first failure snapshot in summary.json
+        :param mode: "inline" or "background"
+        :param status: "running", "completed", "failed" or "not_finished",
+                       "not_finished" is final: the summary keeps it when the snapshot ends later
+        '''
+        snapshot = {
+            "testcase_name": testcase_name,
+            "mode": mode,
+            "status": status,
+            "status_code": response.status_code if response is not None else None,
+            "started": datetime.fromtimestamp(started).isoformat(),
+            "duration": round(time.time() - started, 3),
+        }
+        with _CafyConfig.summary_lock:
+            if self.snapshot_abandoned:
+                return
+            self.snapshot_abandoned = status == "not_finished"
+            _CafyConfig.summary["first_failure_snapshot"] = snapshot
     
 
     def invoke_rc_on_failed_testcase(self, params, headers):
@@ -2132,6 +2397,10 @@ class EmailReport(object):
     def dump_hybrid_mode_report(self):
         path=CafyLog.work_dir
         file_name='testcase_mode.json'
+        if self.run_journal is not None:
+            self.run_journal.sync()
+            write_json_dict(os.path.join(path, file_name), lambda: iter_mode_report(self.run_journal.path))
+            return
         with open(os.path.join(path, file_name), 'w') as fp:
             json.dump(self.report_dump,fp)
 
@@ -2162,8 +2431,11 @@ class EmailReport(object):
 
     def pytest_terminal_summary(self, terminalreporter):
         '''this hook is the execution point of email plugin'''
-        #self._generate_email_report(terminalreporter)
-        self._generate_all_log_html()
+        # all.log.html is written while the tables and the email report are generated, from the
+        # lines logged so far, as these keep logging to all.log
+        pipeline = self._new_finish_pipeline()
+        pipeline.add("all_log_html", partial(self._generate_all_log_html, self._all_log_size()))
+        pipeline.start()
         if CafyLog.work_dir:
             option = terminalreporter.config.option
             # self._create_archive(option)
@@ -2210,10 +2482,9 @@ class EmailReport(object):
         terminalreporter.write_line("Reports: {allure_html_report}".format(allure_html_report=self.allure_html_report))
         self.collect_collection_report()
         self.cafypdb_log()
-        self._generate_email_report(terminalreporter)
-
-        if not self.no_email:
-            self._sendemail()
+        pipeline.add("email_report", partial(self._generate_email_report, terminalreporter))
+        pipeline.add("send_email", self._send_email_report, requires=("email_report",))
+        self._record_finish_timings("terminal_summary", pipeline.join())
 
         #Unset environ variables cafykit_mongo_learn & cafykit_mongo_read if set
         if os.environ.get('cafykit_mongo_learn'):
@@ -2223,61 +2494,63 @@ class EmailReport(object):
 
 
 
+    def _send_email_report(self):
+        # no_email may be set by the email report (--mail-if-fail)
+        if not self.no_email:
+            self._sendemail()
+
+    def _new_finish_pipeline(self):
+        return FinishPipeline(max_workers=max(1, getattr(self.config_option, 'finish_workers', 4)),
+                              default_timeout=getattr(self.config_option, 'finish_step_timeout', 900),
+                              logger=self.log)
+
+    def _record_finish_timings(self, phase, timings):
+        '''
+        Record the timings of the session finish steps of a phase (sessionfinish or terminal_summary)
+        in summary.json
+        '''
+        with _CafyConfig.summary_lock:
+            _CafyConfig.summary.setdefault("session_finish", {})[phase] = timings
+        self.log.info("Session finish %s steps: %s" % (phase, ", ".join(
+            "%s %s %ss" % (name, step["status"], step["duration"])
+            for name, step in timings.items() if name != "total")))
+        if self.archive:
+            self._write_summary()
+
+    def _write_summary(self):
+        summary_file = os.path.join(self.archive,"summary.json")
+        with _CafyConfig.summary_lock:
+            summary = json.dumps(_CafyConfig.summary, indent=4, sort_keys=True)
+        with open(summary_file, 'w') as outfile:
+            outfile.write(summary)
+
     def _parse_all_log(self, input_file_handler):
-        log_parsing_state = LogState.NONE
-        log_grouping = None
-        separator_line = re.compile('-[a-zA-Z]+-+.*> [=]+$')
-        start_test_line = re.compile('Start test:\W+(.*)$')
-        end_test_line = re.compile('Finish test:\W+(.*)\W\((.*)\)$')
-        split_log_line = re.compile('^-+([a-zA-Z]+)-+(.*)$')
-
-        all_log_groupings = []
-        for log_line in input_file_handler:
-            escape_re = re.compile(r'\x1b\[[0-9;]*m')
-            log_line = re.sub(escape_re, "", log_line)
-            if separator_line.search(log_line):
-                continue
-            elif start_test_line.search(log_line):
-                # When we encounter start of test case, irrespective of current state we reset to LogState.TESTCASE
-                name = start_test_line.search(log_line).group(1)
-                log_grouping = TestCase(name=name, description="")
-                all_log_groupings.append(log_grouping)
-                log_parsing_state = LogState.TESTCASE
-            elif end_test_line.search(log_line):
-                if log_parsing_state is LogState.TESTCASE:
-                    if end_test_line.search(log_line).group(2) == 'failed':
-                        log_grouping.failed = True
-                    log_parsing_state = LogState.NONE
-                else:
-                    # raise ValueError('Cannot end a test case from this state')
-                    pass
-            else:
-                if log_parsing_state is LogState.NONE:
-                    # print("Starting generic log")
-                    log_grouping = GenericLogGrouping()
-                    all_log_groupings.append(log_grouping)
-                    log_parsing_state = LogState.GENERIC
-                processed_log_line = split_log_line.search(log_line)
-                if processed_log_line:
-                    log_grouping.append_log_line(LogLine(html.escape(processed_log_line.group(2)), processed_log_line.group(1).upper()))
-                else:
-                    log_grouping.append_log_line(LogLine(html.escape(log_line), 'OUT'))
+        return list(iter_log_groupings(input_file_handler))
 
-        return all_log_groupings
+    def _all_log_size(self):
+        try:
+            return os.path.getsize(os.path.join(CafyLog.work_dir, "all.log"))
+        except (OSError, TypeError):
+            return None
 
-    def _generate_all_log_html(self):
+    def _generate_all_log_html(self, log_size=None):
+        '''
+        :param log_size: size of all.log when the step was added, see _all_log_size, None if there is no all.log
+        '''
+        if log_size is None:
+            return
         log_file_name = os.path.join(CafyLog.work_dir, "all.log")
         try:
-            input_file_handler = open(log_file_name, 'r')
-            all_log_groupings = self._parse_all_log(input_file_handler)
-            template_file_name = os.path.join(self.CURRENT_DIR,
-                                     "resources/all_log_template.html")
-            with open(template_file_name) as html_src:
-                html_template = html_src.read()
-                template = Template(html_template)
             output_file_name = os.path.join(CafyLog.work_dir, "all.log.html")
-            with open(output_file_name, 'w') as output_file:
-                output_file.write(template.render(log_groupings = all_log_groupings))
+            log_lines = iter_log_snapshot(log_file_name, log_size)
+            if getattr(self.config_option, 'all_log_html', 'full') == 'compact':
+                template = self.templates.get_template("all_log_compact_template.html")
+                write_compact_all_log_html(template, log_lines, output_file_name)
+            else:
+                template = self.templates.get_template("all_log_template.html")
+                # Groupings are parsed and written one at a time, so all.log is never held in memory
+                with open(output_file_name, 'w') as output_file:
+                    write_all_log_html(template, log_lines, output_file)
         except FileNotFoundError:
                 return
 
@@ -2304,13 +2577,13 @@ class EmailReport(object):
             os.system(cmd)
             #print("Report Generated at: {allure_report}".format(allure_report=allure_report))
             self.log.info("Report: {allure_html_report}".format(allure_html_report=allure_html_report))
-            _CafyConfig.summary["allure2"] = {
+            _CafyConfig.set_summary("allure2", {
                     "commandline" : cmd,
                     "html" :  allure_html_report,
                     "source_dir": allure_source_dir,
                     "report_dir": allure_report_dir,
                     "report": allure_report,
-                }
+                })
         except Exception as e:
             self.log.error("Error in generating allure report: {}".format(e))
 
@@ -2325,36 +2598,97 @@ class EmailReport(object):
             self.teardown_reporting_render_seconds,
             self.teardown_reporting_attach_seconds,
         )
+        if self.attachment_store is not None:
+            self.log.info("Allure %s", self.attachment_store.summary())
+        pipeline = self._new_finish_pipeline()
+        # the debug collections and the snapshot are waited for with their own timeout
+        join_timeout = getattr(self.config_option, 'debug_join_timeout', None)
+        wait_timeout = join_timeout + 60 if join_timeout else None
+        if self.testlog_renderer is not None:
+            # test_log attachments must be complete before the allure report is generated
+            pipeline.add("testlog_render", self.testlog_renderer.shutdown)
+        if self.cls_notifier is not None:
+            pipeline.add("cls_notifier", self._close_cls_notifier)
+        if self.snapshot_future is not None:
+            pipeline.add("first_failure_snapshot", self._wait_first_failure_snapshot, timeout=wait_timeout)
+        pipeline.add("test_data", self._save_test_data)
+        pipeline.add("allure_report", self._generate_allure_report, requires=("testlog_render",))
+        if CafyLog.debug_enable and CafyLog.registration_id:
+            self.log.title("End run for registration id: %s" % CafyLog.registration_id)
+            # collector logs must include the collections still running in the background
+            pipeline.add("debug_collections", self._join_debug_collections, timeout=wait_timeout)
+            pipeline.add("analyzer_log", self._get_analyzer_log, requires=("debug_collections",))
+            pipeline.add("collector_log", self._get_collector_log, requires=("debug_collections",))
+        pipeline.add("retest_data", self._write_retest_data)
+        if self.log_indexer is not None:
+            pipeline.add("log_index", self.log_indexer.close)
+        # for the email report of the terminal summary
+        pipeline.add("git_commit_id", get_git_commit_id)
+        if self.collection:
+            # last, as in the serial code: the snapshot and the collections may still use the devices
+            pipeline.add("collection_deconfigure", self.collection_manager.deconfigure,
+                         requires=pipeline.step_names())
+        self._record_finish_timings("sessionfinish", pipeline.join())
+
+    def _close_cls_notifier(self):
+        if not self.cls_notifier.close(timeout=300):
+            self.log.warning("CLS case-update notifier did not flush within 300s")
+
+    def _wait_first_failure_snapshot(self):
+        join_timeout = getattr(self.config_option, 'debug_join_timeout', None)
+        try:
+            self.snapshot_future.result(timeout=join_timeout)
+        except concurrent.futures.TimeoutError:
+            self.log.warning("First failure snapshot did not finish within %ss" % join_timeout)
+            self._record_snapshot(self.first_failed_testcase_name, "background",
+                                  self.snapshot_started, "not_finished")
+        except Exception as e:
+            self.log.warning("First failure snapshot failed: %s" % e)
+
+    def _save_test_data(self):
         test_data_file = os.path.join(CafyLog.work_dir, "testdata.json")
-        _CafyConfig.summary["test_data"] = {
+        _CafyConfig.set_summary("test_data", {
             "location": test_data_file
-        }
+        })
         self.log.info("Test data generated at %s" % test_data_file)
         CafyLog.TestData.save(test_data_file,overwrite=True)
 
-        self._generate_allure_report()
-
-        if CafyLog.debug_enable and CafyLog.registration_id:
-            self.log.title("End run for registration id: %s" % CafyLog.registration_id)
-            self._get_analyzer_log()
-            params = {"reg_id": CafyLog.registration_id,
-                      "topo_file": CafyLog.topology_file,
-                      "input_file": CafyLog.test_input_file}
-            headers = {'content-type': 'application/json'}
-            register_object.collector_log(params=params, headers=headers, work_dir=CafyLog.work_dir)
+    def _join_debug_collections(self):
+        join_timeout = getattr(self.config_option, 'debug_join_timeout', None)
+        not_done = register_object.join_status_waits(timeout=join_timeout)
+        if not_done:
+            self.log.warning("%d debug collection(s) did not finish within %ss" % (not_done, join_timeout))
 
+    def _get_collector_log(self):
+        params = {"reg_id": CafyLog.registration_id,
+                  "topo_file": CafyLog.topology_file,
+                  "input_file": CafyLog.test_input_file}
+        headers = {'content-type': 'application/json'}
+        register_object.collector_log(params=params, headers=headers, work_dir=CafyLog.work_dir)
 
+    def _write_retest_data(self):
         try:
-            with open(os.path.join(CafyLog.work_dir, "retest_data.json"), "w") as f:
-                f.write(json.dumps(self.log.buffer_to_retest, indent=4))
+            if self.run_journal is not None:
+                self.run_journal.close()
+                write_json_list(os.path.join(CafyLog.work_dir, "retest_data.json"),
+                                iter_retest_data(self.run_journal.path), indent=4)
+            else:
+                with open(os.path.join(CafyLog.work_dir, "retest_data.json"), "w") as f:
+                    f.write(json.dumps(self.log.buffer_to_retest, indent=4))
         except Exception as error:
             self.log.info(error)
-        summary_file = os.path.join(self.archive,"summary.json")
-        with open(summary_file, 'w') as outfile:
-            json.dump(_CafyConfig.summary, outfile, indent=4, sort_keys=True)
 
-        if self.collection:
-            self.collection_manager.deconfigure()
+@lru_cache(maxsize=None)
+def get_git_commit_id():
+    '''
+    Commit of origin/main in the run directory, None if unknown; cached so that it can be
+    fetched by a session finish step before the email report needs it
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'origin/main'], timeout=5, stderr=subprocess.DEVNULL).decode("utf-8").replace('\n', '')
+    except Exception:
+        return None
+
 
 class CafyReportData(object):
 
@@ -2416,10 +2750,7 @@ class CafyReportData(object):
         self.cafy_repo = EmailReport.CAFY_REPO
         self.topo_file = topo_file
         self.run_dir = self.terminalreporter.startdir.strpath
-        try:
-            self.git_commit_id = subprocess.check_output(['git', 'rev-parse', 'origin/main'], timeout=5, stderr=subprocess.DEVNULL).decode("utf-8").replace('\n', '')
-        except Exception:
-            self.git_commit_id = None
+        self.git_commit_id = get_git_commit_id()
         self.archive = CafyLog.work_dir
         # summary result
         status_lists = {
@@ -2509,62 +2840,3 @@ class CafyReportData(object):
         else:
             run_time = "{}s".format(_s)
         return run_time
-
-
-class LogGrouping:
-    def get_subgroupings(self):
-        return []
-
-    def get_title(self):
-        pass
-
-    def get_log_lines(self):
-        pass
-
-    def append_log_line(self, line):
-        pass
-
-
-class LogLine:
-    def __init__(self, line, type = None):
-        self.line = line
-        self.type = type
-
-class GenericLogGrouping(LogGrouping):
-    def __init__(self):
-        self.log_lines = []
-
-    def get_title(self):
-        if len(self.log_lines) > 0:
-            return self.log_lines[0].line[0:80] + "... and " + str(len(self.log_lines)) + " more lines"
-        else:
-            return "Generic log line"
-
-    def get_log_lines(self):
-        return self.log_lines
-
-    def append_log_line(self, line):
-        self.log_lines.append(line)
-
-
-class TestCase(LogGrouping):
-    def __init__(self, name=None, description=None):
-        self.name = name
-        self.description = description
-        self.log_lines = []
-        self.failed = False
-
-    def get_title(self):
-        return 'Test case: ' + self.name + (' ***Failed***' if self.failed else '')
-
-    def get_log_lines(self):
-        return self.log_lines
-
-    def append_log_line(self, line):
-        self.log_lines.append(line)
-
-class LogState(Enum):
-    NONE = 1
-    GENERIC = 2
-    TESTCASE = 3
-    STEP = 3
@@ -0,0 +1,138 @@
+'''
+Append-only run journal (run_journal.jsonl)
+
+One json line is appended per phase report (setup, call, teardown) of every
+testcase as soon as it is logged:
+
+    {"name", "nodeid", "when", "outcome", "status", "duration", "start", "stop",
+     "mode", "fail_message", "artifacts", "retest", "mode_report"}
+
+The lines are flushed at once, so dashboards can tail the file, and fsynced in
+batches (every fsync_every records or fsync_interval seconds, and on close),
+so a crash loses at most the last batch. retest_data.json and
+testcase_mode.json are derived from the journal by streaming over it.
+'''
+
+import json
+import os
+import threading
+import time
+
+from .jsonl import iter_jsonl
+
+RUN_JOURNAL_FILE_NAME = 'run_journal.jsonl'
+
+
+class RunJournal:
+    def __init__(self, path, fsync_interval=1.0, fsync_every=50, clock=time.monotonic):
+        '''
+        :param path: path of the jsonl file, truncated
+        :param fsync_interval: max seconds between two fsyncs, 0 fsyncs every record
+        :param fsync_every: max records between two fsyncs
+        :param clock: monotonic clock, for tests
+        '''
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_every = fsync_every
+        self._clock = clock
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+        self._last_sync = clock()
+        self._unsynced = 0
+        self.records = 0
+        self.syncs = 0
+
+    def append(self, record):
+        '''
+        :param record: json serializable dict, values which are not are written as strings
+        '''
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or self._clock() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = self._clock()
+        self._unsynced = 0
+        self.syncs += 1
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._unsynced:
+                self._sync()
+            self._file.close()
+
+
+def iter_run_journal(path):
+    '''
+    Yields the records of a run journal, skipping the malformed lines, e.g. a last line cut short by a crash
+    '''
+    return iter_jsonl(path)
+
+
+def iter_retest_data(path):
+    '''
+    Yields the retest_data.json entries (not passed testcases) recorded at teardown
+    '''
+    for record in iter_run_journal(path):
+        for entry in record.get('retest') or ():
+            yield entry
+
+
+def iter_mode_report(path):
+    '''
+    Yields (testcase name, testcase_mode.json entry) recorded at teardown
+    '''
+    for record in iter_run_journal(path):
+        if record.get('mode_report') is not None:
+            yield record['name'], record['mode_report']
+
+
+def write_json_list(path, items, indent=None):
+    '''
+    Write an iterable as a json list without building the list in memory
+    '''
+    with open(path, 'w') as json_file:
+        json_file.write('[')
+        separator = ''
+        for item in items:
+            json_file.write(separator)
+            if indent:
+                json_file.write('\n' + ' ' * indent)
+                json_file.write(json.dumps(item, indent=indent).replace('\n', '\n' + ' ' * indent))
+            else:
+                json_file.write(json.dumps(item))
+            separator = ','
+        json_file.write('\n]' if indent and separator else ']')
+
+
+def write_json_dict(path, items):
+    '''
+    Write (key, value) pairs as a json object without building the dict in memory,
+    a later value of a key replaces the earlier one, the keys are in the order of their last value
+    :param items: callable returning an iterable of (key, value), called twice
+    '''
+    last_index = dict()
+    for index, (key, _) in enumerate(items()):
+        last_index[key] = index
+    with open(path, 'w') as json_file:
+        json_file.write('{')
+        separator = ''
+        for index, (key, value) in enumerate(items()):
+            if last_index[key] != index:
+                continue
+            json_file.write('%s%s: %s' % (separator, json.dumps(key), json.dumps(value)))
+            separator = ', '
+        json_file.write('}')
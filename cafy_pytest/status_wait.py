@@ -0,0 +1,101 @@
+'''
+Waiting on the status endpoints of the debug server
+
+BackoffWait polls with short waits first and backs off exponentially (with
+jitter) up to a ceiling, instead of sleeping a fixed 30s/90s step. When the
+server supports long polling the poll itself blocks server side and no extra
+sleep is added. StatusWaiter runs such waits in the background and hands out
+futures which can be joined at the end of the session.
+'''
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+
+class BackoffWait:
+    def __init__(self, max_wait, initial=2.0, factor=2.0, ceiling=30.0, jitter=0.2, long_poll=0,
+                 sleep=time.sleep, clock=time.monotonic):
+        '''
+        :param max_wait: give up after this many seconds
+        :param initial: first pause between polls in seconds
+        :param factor: multiplier of the pause after every poll
+        :param ceiling: max pause between polls in seconds
+        :param jitter: +/- fraction of randomization of each pause
+        :param long_poll: seconds the server may hold a poll open (0 disables long polling);
+                          time spent inside a poll counts towards the next pause
+        '''
+        self.max_wait = max_wait
+        self.initial = initial
+        self.factor = factor
+        self.ceiling = ceiling
+        self.jitter = jitter
+        self.long_poll = long_poll
+        self._sleep = sleep
+        self._clock = clock
+        self.polls = 0
+
+    def run(self, poll):
+        '''
+        :param poll: callable(long_poll_seconds) returning (finished, value)
+                     finished=True stops waiting and value is returned
+        :return: value of the finishing poll, or None if max_wait elapsed
+        '''
+        deadline = self._clock() + self.max_wait
+        delay = self.initial
+        while True:
+            poll_start = self._clock()
+            self.polls += 1
+            finished, value = poll(self.long_poll)
+            if finished:
+                return value
+            now = self._clock()
+            remaining = deadline - now
+            if remaining <= 0:
+                return None
+            pause = min(delay * random.uniform(1 - self.jitter, 1 + self.jitter), self.ceiling)
+            pause = min(pause - (now - poll_start), remaining)
+            if pause > 0:
+                self._sleep(pause)
+            delay = min(delay * self.factor, self.ceiling)
+
+
+class StatusWaiter:
+    '''
+    Runs status waits on background threads and keeps track of the outstanding ones
+    '''
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cafy-status-wait")
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        :return: concurrent.futures.Future of fn(*args, **kwargs)
+        '''
+        future = self._executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def outstanding(self):
+        with self._lock:
+            return len(self._futures)
+
+    def join(self, timeout=None):
+        '''
+        Wait for the outstanding waits
+        :param timeout: max seconds to wait, None waits forever
+        :return: number of waits still running after timeout
+        '''
+        with self._lock:
+            futures = list(self._futures)
+        _, not_done = wait_futures(futures, timeout=timeout)
+        return len(not_done)
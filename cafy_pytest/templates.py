@@ -0,0 +1,50 @@
+'''
+Session wide registry of the report templates and static resources under resources/
+'''
+
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources")
+
+
+class ReportTemplates:
+    '''
+    Loads and compiles every template (and reads every static resource like
+    cafy_report.css) at most once per session.
+
+    With bytecode_cache_dir the compiled templates are also persisted to that
+    directory, so later runs skip compiling them altogether.
+    '''
+
+    def __init__(self, bytecode_cache_dir=None):
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        # auto_reload=False: templates ship with the package and never change
+        # during a run, so don't stat them on every get_template()
+        self.env = Environment(loader=FileSystemLoader(RESOURCES_DIR),
+                               bytecode_cache=bytecode_cache,
+                               auto_reload=False,
+                               cache_size=-1)
+        self._resources = {}
+
+    def get_template(self, name):
+        '''
+        :param name: file name of the template under resources/
+        :return: compiled jinja2 Template
+        '''
+        return self.env.get_template(name)
+
+    def get_resource(self, name):
+        '''
+        :param name: file name of a static resource under resources/
+        :return: content of the resource as str
+        '''
+        content = self._resources.get(name)
+        if content is None:
+            with open(os.path.join(RESOURCES_DIR, name)) as resource:
+                content = self._resources[name] = resource.read()
+        return content
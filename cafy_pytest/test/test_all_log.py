@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import pytest
+from cafy_pytest.all_log import (AllLogParser, GenericLogGrouping, TestCase, iter_log_groupings, iter_log_snapshot,
+                                 write_all_log_html, write_compact_all_log_html)
+from cafy_pytest.templates import ReportTemplates
+
+SAMPLE_LOG = [
+    "-Info----  setting up testbed\n",
+    "-Title--- 10:00:00 > ==========\n",
+    "-Title--- Start test:  TestClass.test_one\n",
+    "-Info---- configuring <interface>\n",
+    "-Error--- \x1b[31mcommand failed\x1b[0m\n",
+    "plain stdout line\n",
+    "-Title--- Finish test: TestClass.test_one (failed)\n",
+    "-Debug--- cleanup\n",
+]
+
+@pytest.fixture
+def template():
+    """
+    Fixture to provide the all_log_template.html template shipped with the plugin.
+    """
+    return ReportTemplates().get_template("all_log_template.html")
+
+class TestAllLog:
+    """
+    Test cases for all.log parsing and rendering.
+    """
+
+    def test_iter_log_groupings(self):
+        """
+        Test that groupings and per level views are built while parsing.
+        """
+        groupings = list(iter_log_groupings(SAMPLE_LOG))
+
+        assert [type(g) for g in groupings] == [GenericLogGrouping, TestCase, GenericLogGrouping]
+        testcase = groupings[1]
+        assert testcase.name == "TestClass.test_one"
+        assert testcase.failed
+        assert [l.type for l in testcase.get_log_lines()] == ['INFO', 'ERROR', 'OUT']
+        assert testcase.get_log_lines('INFO')[0].line == " configuring &lt;interface&gt;"
+        assert testcase.get_log_lines('ERROR')[0].line == " command failed"
+        assert testcase.get_log_lines('WARNING') == []
+
+    def test_iter_log_groupings_is_lazy(self):
+        """
+        Test that a grouping is yielded before the rest of the log is read.
+        """
+        def lines():
+            yield from SAMPLE_LOG[:4]
+            raise AssertionError("read past the first test case")
+
+        groupings = iter_log_groupings(lines())
+        assert isinstance(next(groupings), GenericLogGrouping)
+
+    def test_all_log_parser_feed(self):
+        """
+        Test feeding lines one at a time returns each grouping as it completes.
+        """
+        parser = AllLogParser()
+        completed = [parser.feed(line) for line in SAMPLE_LOG]
+
+        assert isinstance(completed[2], GenericLogGrouping)
+        assert isinstance(completed[7], TestCase)
+        assert [c for c in completed if c is not None] == [completed[2], completed[7]]
+        assert parser.close().get_log_lines('DEBUG')[0].line == " cleanup"
+        assert parser.close() is None
+
+    def test_iter_log_snapshot(self, tmpdir):
+        """
+        Test that only the complete lines logged before the snapshot are read.
+        """
+        log_path = tmpdir.join("all.log")
+        log_path.write_binary("".join(SAMPLE_LOG[:3]).encode())
+        size = log_path.size()
+        with open(str(log_path), "ab", buffering=0) as log_file:
+            log_file.write(b"-Info---- configuring\r\n-Info---- half")
+            assert list(iter_log_snapshot(str(log_path), size + 23)) == SAMPLE_LOG[:3] + ["-Info---- configuring\n"]
+            assert list(iter_log_snapshot(str(log_path), size + 12)) == SAMPLE_LOG[:3]
+            log_file.write(b" written\n")
+        assert list(iter_log_snapshot(str(log_path), size)) == SAMPLE_LOG[:3]
+
+    def test_write_all_log_html(self, template):
+        """
+        Test the streaming html rendering of a log.
+        """
+        output = io.StringIO()
+        write_all_log_html(template, SAMPLE_LOG, output)
+        rendered = output.getvalue()
+
+        assert "Test case: TestClass.test_one ***Failed***" in rendered
+        assert '<span style="color: red;"> command failed</span>' in rendered
+        assert rendered == template.render(log_groupings=iter_log_groupings(SAMPLE_LOG))
+
+    def test_write_compact_all_log_html(self, tmpdir):
+        """
+        Test the compact html report writes each line once, in a chunk per log grouping.
+        """
+        template = ReportTemplates().get_template("all_log_compact_template.html")
+        output_path = str(tmpdir.join("all.log.html"))
+        write_compact_all_log_html(template, SAMPLE_LOG, output_path)
+
+        chunks_dir = output_path + ".chunks"
+        assert sorted(os.listdir(chunks_dir)) == ["0.js", "1.js", "2.js"]
+        with open(os.path.join(chunks_dir, "1.js"), encoding="utf-8") as chunk_file:
+            chunk = chunk_file.read()
+        assert chunk.startswith("cafyLogChunk(1, ") and chunk.endswith(");\n")
+        assert json.loads(chunk[len("cafyLogChunk(1, "):-len(");\n")]) == {
+            "c": "015", "t": [" configuring &lt;interface&gt;", " command failed", "plain stdout line"]}
+
+        with open(output_path, encoding="utf-8") as output_file:
+            rendered = output_file.read()
+        assert "command failed" not in rendered
+        assert '"title": "Test case: TestClass.test_one ***Failed***"' in rendered
+        assert '"levels": [1, 1, 0, 0, 0, 1], "lines": 3' in rendered
+        assert 'var CHUNKS_DIR = "all.log.html.chunks";' in rendered
@@ -0,0 +1,134 @@
+import gzip
+import os
+from types import SimpleNamespace
+from uuid import uuid4
+
+import allure
+import pytest
+from allure_commons.model2 import TestResult as AllureTestResult
+from allure_commons.reporter import AllureReporter
+
+from cafy_pytest.attachments import AttachmentStore
+
+
+class FakePluginManager:
+    def __init__(self, reporter):
+        self.listener = SimpleNamespace(allure_logger=reporter)
+
+    def get_plugin(self, name):
+        return self.listener if name == "allure_listener" else None
+
+
+@pytest.fixture
+def reporter():
+    return AllureReporter()
+
+
+@pytest.fixture
+def config(tmpdir, reporter):
+    return SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(tmpdir)),
+                           pluginmanager=FakePluginManager(reporter))
+
+
+def start_test(reporter):
+    uuid = str(uuid4())
+    reporter.schedule_test(uuid, AllureTestResult(uuid=uuid, name="test"))
+    return reporter.get_test(uuid)
+
+
+def stored_files(tmpdir):
+    return sorted(os.listdir(str(tmpdir)))
+
+
+class TestAttachmentStore:
+    def test_identical_attachments_are_stored_once(self, tmpdir, config, reporter):
+        store = AttachmentStore(config)
+        first, second = start_test(reporter), start_test(reporter)
+        traceback = "Traceback (most recent call last):\n  ...\nValueError: bad\n"
+
+        first_name = store.attach(traceback, "Exception in step", allure.attachment_type.TEXT)
+        result = start_test(reporter)
+        second_name = store.attach(traceback.encode(), "Exception in step", allure.attachment_type.TEXT)
+        other_name = store.attach("other", "other", "application/json")
+
+        assert first_name == second_name and first_name.endswith("-attachment.txt")
+        assert other_name.endswith("-attachment.json")
+        assert stored_files(tmpdir) == sorted([first_name, other_name])
+        with open(str(tmpdir.join(first_name))) as attachment_file:
+            assert attachment_file.read() == traceback
+        # attached to the running test
+        assert [a.source for a in second.attachments] == [first_name]
+        assert [a.source for a in result.attachments] == [second_name, other_name]
+        assert result.attachments[0].type == "text/plain" and not first.attachments
+        assert (store.attached, store.deduplicated) == (3, 1)
+        assert store.bytes_written == len(traceback) + len("other")
+
+    def test_compressed_writer(self, tmpdir, config, reporter):
+        store = AttachmentStore(config, compress=True, compress_min_size=1000)
+        test = start_test(reporter)
+        with store.writer("test_log", allure.attachment_type.HTML) as writer:
+            for index in range(100):
+                writer.write("<p>line %d</p>\n" % index)
+        assert writer.file_name.endswith("-attachment.html.gz")
+        assert test.attachments[0].type == "text/html"
+        with gzip.open(str(tmpdir.join(writer.file_name)), "rt") as attachment_file:
+            assert attachment_file.read().count("<p>") == 100
+        # too small to be compressed
+        assert store.attach("small", "small", allure.attachment_type.TEXT).endswith("-attachment.txt")
+
+    def test_failed_writer_attaches_nothing(self, tmpdir, config, reporter):
+        store = AttachmentStore(config)
+        test = start_test(reporter)
+        with pytest.raises(ValueError):
+            with store.writer("test_log", allure.attachment_type.HTML) as writer:
+                writer.write("partial")
+                raise ValueError("render failed")
+        assert not test.attachments and stored_files(tmpdir) == []
+
+    def test_reserved_attachments_are_linked(self, tmpdir, config, reporter):
+        store = AttachmentStore(config, compress=True)
+        start_test(reporter)
+        paths = [store.reserve("test_log", allure.attachment_type.HTML) for _ in range(2)]
+        for path in paths:
+            assert path.endswith("-attachment.html.gz")
+            writer = store.open_reserved(path)
+            writer.write("<html>same log</html>")
+            store.commit_reserved(path, writer)
+        assert store.deduplicated == 1
+        # the content address and the two reserved names
+        assert len(stored_files(tmpdir)) == 3
+        assert os.path.samefile(paths[0], paths[1])
+        with gzip.open(paths[1], "rt") as attachment_file:
+            assert attachment_file.read() == "<html>same log</html>"
+
+    def test_allure_reporter_internals(self, config, reporter):
+        """
+        Test that the private AllureReporter._attach used by the store is still there, so that a new
+        allure-pytest does not silently fall back to plain attachments.
+        """
+        import inspect
+        parameters = inspect.signature(AllureReporter._attach).parameters
+        assert list(parameters)[:5] == ["self", "uuid", "name", "attachment_type", "extension"]
+        test = start_test(reporter)
+        assert reporter._attach("digest", name="log", attachment_type="text/plain", extension="txt") == \
+            "digest-attachment.txt"
+        assert [(a.source, a.type) for a in test.attachments] == [("digest-attachment.txt", "text/plain")]
+        assert AttachmentStore(config).active
+
+    def test_unsupported_allure_reporter_warns(self, tmpdir):
+        """
+        Test that the fallback to plain attachments is warned about.
+        """
+        config = SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(tmpdir)),
+                                 pluginmanager=FakePluginManager(object()))
+        store = AttachmentStore(config)
+        with pytest.warns(UserWarning, match="_attach"):
+            assert not store.active
+        assert store.attach("body", "name", allure.attachment_type.TEXT) is None
+
+    def test_inactive_allure(self, tmpdir):
+        config = SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(tmpdir)),
+                                 pluginmanager=SimpleNamespace(get_plugin=lambda name: None))
+        store = AttachmentStore(config)
+        assert not store.active
+        assert store.attach("body", "name", allure.attachment_type.TEXT) is None
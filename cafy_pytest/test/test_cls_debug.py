@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+from cafy_pytest import cls_debug
+from cafy_pytest.cls_debug import ClsConfigResolver, ClsNotifier, DebugAdapter
+
+CLS_ENV = ("CLS", "CLS_HOST", "LOGSTASH_SERVER", "LOGSTASH_PORT", "REG_ID")
+
+
+@pytest.fixture
+def cls_env(monkeypatch):
+    """
+    Fixture to provide a CLS enabled environment, without the CLS variables of the caller.
+    """
+    for name in CLS_ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("CLS", "1")
+    monkeypatch.setenv("LOGSTASH_SERVER", "logstash")
+    monkeypatch.setenv("LOGSTASH_PORT", "5044")
+    monkeypatch.setenv("REG_ID", "reg-1")
+    return monkeypatch
+
+
+@pytest.fixture
+def work_dir(tmpdir):
+    """
+    Fixture to provide a work dir with debug_activate/cls_data_file.json.
+    """
+    work_dir = tmpdir.mkdir("run").mkdir("2916")
+    work_dir.mkdir("debug_activate")
+    write_cls_data_file(str(work_dir), {"cls_host": "http://cls-a:8080"})
+    return str(work_dir)
+
+
+def write_cls_data_file(work_dir, meta, mtime_ns=None):
+    path = os.path.join(work_dir, "debug_activate", "cls_data_file.json")
+    with open(path, "w") as meta_file:
+        json.dump(meta, meta_file)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+class TestClsConfigResolver:
+    """
+    Test cases for the caching of the CLS configuration.
+    """
+
+    def test_unchanged_file_is_not_read_again(self, cls_env, work_dir, mocker):
+        """
+        Test that resolving again with an unchanged file and env uses the cache.
+        """
+        read = mocker.spy(cls_debug, "_read_cls_configuration")
+        resolver = ClsConfigResolver()
+        first = resolver.resolve(work_dir)
+        assert first == (1, "http://cls-a:8080", "logstash", "5044", "reg-1")
+        assert resolver.resolve(work_dir) is first
+        assert read.call_count == 1
+        assert (resolver.reads, resolver.hits) == (1, 1)
+
+    def test_rewritten_file_is_read(self, cls_env, work_dir):
+        """
+        Test that a rewrite changing the mtime or size of the file is picked up.
+        """
+        resolver = ClsConfigResolver()
+        write_cls_data_file(work_dir, {"cls_host": "http://cls-a:8080"}, mtime_ns=10 ** 18)
+        assert resolver.resolve(work_dir)[1] == "http://cls-a:8080"
+        # same size, other mtime
+        write_cls_data_file(work_dir, {"cls_host": "http://cls-b:8080"}, mtime_ns=10 ** 18 + 1000)
+        assert resolver.resolve(work_dir)[1] == "http://cls-b:8080"
+        # same mtime, other size
+        write_cls_data_file(work_dir, {"cls_host": "http://cls-bb:8080"}, mtime_ns=10 ** 18 + 1000)
+        assert resolver.resolve(work_dir)[1] == "http://cls-bb:8080"
+        assert resolver.reads == 3
+
+    def test_env_changes_invalidate_the_cache(self, cls_env, work_dir):
+        """
+        Test that a changed env default or registration id is resolved again.
+        """
+        resolver = ClsConfigResolver()
+        resolver.resolve(work_dir)
+        cls_env.setenv("LOGSTASH_PORT", "5045")
+        assert resolver.resolve(work_dir)[3] == "5045"
+        cls_env.setenv("REG_ID", "reg-2")
+        assert resolver.resolve(work_dir)[4] == "reg-2"
+        assert (resolver.reads, resolver.hits) == (3, 0)
+
+    def test_logs_only_changes(self, cls_env, work_dir, caplog):
+        """
+        Test that the resolution is logged when the resolved values change, not at every read.
+        """
+        caplog.set_level(logging.INFO, logger=cls_debug.__name__)
+        resolver = ClsConfigResolver()
+
+        def logged():
+            messages = [record.getMessage() for record in caplog.records if record.name == cls_debug.__name__]
+            caplog.clear()
+            return messages
+
+        resolver.resolve(work_dir)
+        assert logged() == ["CLS cls_host=http://cls-a:8080 (source: cls_data_file.json (cls_host / CLS_HOST))"]
+        resolver.resolve(work_dir)
+        assert logged() == []
+        # read again (other size) but resolved to the same values
+        write_cls_data_file(work_dir, {"cls_host": "http://cls-a:8080", "other": 1})
+        resolver.resolve(work_dir)
+        assert resolver.reads == 2 and logged() == []
+        write_cls_data_file(work_dir, {"cls_host": "http://cls-b:8080"})
+        resolver.resolve(work_dir)
+        assert logged() == ["CLS cls_host=http://cls-b:8080 (source: cls_data_file.json (cls_host / CLS_HOST))"]
+
+
+class BlockingSender:
+    """
+    Fake CLS case-update recording the calls, each call blocks until released.
+    """
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, test_case, *args):
+        self.calls.append((test_case,) + args)
+        self.started.set()
+        self.release.wait()
+        return True
+
+
+class TestClsNotifier:
+    """
+    Test cases for the background CLS case-update notifications.
+    """
+
+    def test_in_order_delivery(self):
+        """
+        Test that notifications sent one after the other arrive in order with their arguments.
+        """
+        sender = BlockingSender()
+        sender.release.set()
+        notifier = ClsNotifier(sender)
+        for index in range(5):
+            notifier.notify("T.test_%d" % index, "http://cls:8080")
+            assert notifier.flush(timeout=5)
+        assert notifier.close(timeout=5)
+        assert sender.calls == [("T.test_%d" % index, "http://cls:8080") for index in range(5)]
+        assert (notifier.queued, notifier.sent, notifier.coalesced, notifier.failed) == (5, 5, 0, 0)
+
+    def test_stale_updates_are_coalesced(self):
+        """
+        Test that only the latest of the testcases started while a notification is in flight is sent.
+        """
+        sender = BlockingSender()
+        notifier = ClsNotifier(sender)
+        notifier.notify("T.test_0", "host-a")
+        assert sender.started.wait(5)
+        for index in range(1, 4):
+            notifier.notify("T.test_%d" % index, "host-b")
+        # still blocked in the first send
+        assert not notifier.flush(timeout=0.05)
+        sender.release.set()
+        assert notifier.flush(timeout=5)
+        assert sender.calls == [("T.test_0", "host-a"), ("T.test_3", "host-b")]
+        assert (notifier.sent, notifier.coalesced) == (2, 2)
+        notifier.close(timeout=5)
+
+    def test_failures_are_counted(self):
+        """
+        Test that a failed or raising send does not stop the notifier.
+        """
+        results = iter([False, RuntimeError("cls down"), True])
+
+        def send(test_case):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        notifier = ClsNotifier(send)
+        for index in range(3):
+            notifier.notify("T.test_%d" % index)
+            assert notifier.flush(timeout=5)
+        assert (notifier.sent, notifier.failed) == (1, 2)
+        notifier.close()
+
+    def test_close_does_not_wait_for_a_hanging_sender(self):
+        """
+        Test that close(timeout) returns after timeout when the send hangs, and ignores later notifications.
+        """
+        sender = BlockingSender()
+        notifier = ClsNotifier(sender)
+        notifier.notify("T.test_0")
+        assert sender.started.wait(5)
+        started = time.monotonic()
+        assert notifier.close(timeout=0.1) is False
+        assert time.monotonic() - started < 2
+        notifier.notify("T.test_1")
+        assert notifier.queued == 1
+        sender.release.set()
+        notifier._thread.join(5)
+        assert not notifier._thread.is_alive()
+        assert sender.calls == [("T.test_0",)]
+
+
+class TestDebugAdapterWithLogger:
+    """
+    Test cases for the adapter copies used by background snapshots.
+    """
+
+    def test_copy_has_own_logger_and_shared_status_waiter(self):
+        """
+        Test that the copy logs to its own logger and its calls are joined by the original adapter.
+        """
+        adapter = DebugAdapter(debug=True, reg_id="reg-1", logger=logging.getLogger("cafy"))
+        snapshot_logger = logging.getLogger("snapshot")
+        copy = adapter.with_logger(snapshot_logger)
+        assert copy.logger is snapshot_logger
+        assert adapter.logger is not snapshot_logger
+        assert copy.status_waiter is adapter.status_waiter
+
+        release = threading.Event()
+        future = copy.status_waiter.submit(release.wait, 5)
+        assert adapter.join_status_waits(timeout=0.05) == 1
+        release.set()
+        assert adapter.join_status_waits(timeout=5) == 0
+        assert future.result() is True
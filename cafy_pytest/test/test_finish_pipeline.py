@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from cafy_pytest.finish_pipeline import FAILED, NOT_RUN, OK, TIMEOUT, FinishPipeline
+
+
+def test_independent_steps_overlap_and_dependencies_are_ordered():
+    order = []
+    lock = threading.Lock()
+
+    def step(name, seconds):
+        def run():
+            time.sleep(seconds)
+            with lock:
+                order.append(name)
+        return run
+
+    pipeline = FinishPipeline(max_workers=4)
+    pipeline.add("email_report", step("email_report", 0), requires=("allure_report", "collector_log"))
+    pipeline.add("allure_report", step("allure_report", 0.2), requires=("testlog_render",))
+    pipeline.add("testlog_render", step("testlog_render", 0.1))
+    pipeline.add("collector_log", step("collector_log", 0.3))
+    pipeline.add("retest_data", step("retest_data", 0), requires=("not_added",))
+    started = time.monotonic()
+    timings = pipeline.join()
+    elapsed = time.monotonic() - started
+
+    assert order.index("testlog_render") < order.index("allure_report") < order.index("email_report")
+    assert order[-1] == "email_report"
+    # collector_log overlaps with testlog_render and allure_report
+    assert elapsed < 0.55
+    assert all(timings[name]["status"] == OK for name in order)
+    assert timings["email_report"]["start"] >= timings["collector_log"]["duration"]
+    assert timings["total"] == pytest.approx(elapsed, abs=0.1)
+
+
+def test_failed_and_timed_out_steps_settle_their_dependents():
+    release = threading.Event()
+    ran = []
+
+    def fail():
+        raise OSError("allure not found")
+
+    pipeline = FinishPipeline(max_workers=2)
+    pipeline.add("allure_report", fail)
+    pipeline.add("collector_log", release.wait, timeout=0.1)
+    pipeline.add("email_report", lambda: ran.append("email_report"), requires=("allure_report", "collector_log"))
+    timings = pipeline.join()
+    release.set()
+
+    assert timings["allure_report"]["status"] == FAILED
+    assert timings["allure_report"]["error"] == "OSError: allure not found"
+    assert timings["collector_log"]["status"] == TIMEOUT
+    assert timings["email_report"]["status"] == OK and ran == ["email_report"]
+
+
+def test_start_then_join_and_cycles():
+    pipeline = FinishPipeline(max_workers=1)
+    pipeline.add("all_log_html", lambda: None)
+    pipeline.start()
+    pipeline.add("a", lambda: None, requires=("b",))
+    pipeline.add("b", lambda: None, requires=("a",))
+    timings = pipeline.join()
+    assert timings["all_log_html"]["status"] == OK
+    assert timings["a"]["status"] == timings["b"]["status"] == NOT_RUN
+    with pytest.raises(ValueError):
+        pipeline.add("a", lambda: None)
+
+
+@pytest.mark.parametrize("exception", [pytest.fail.Exception("failed"), SystemExit(2), KeyboardInterrupt()])
+def test_base_exception_settles_the_step(exception):
+    def raise_exception():
+        raise exception
+
+    pipeline = FinishPipeline(max_workers=1, default_timeout=None)
+    pipeline.add("allure_report", raise_exception)
+    pipeline.add("email_report", lambda: None, requires=("allure_report",))
+    started = time.monotonic()
+    timings = pipeline.join()
+    assert time.monotonic() - started < 5
+    assert timings["allure_report"]["status"] == FAILED
+    assert timings["allure_report"]["error"].startswith(type(exception).__name__)
+    assert timings["email_report"]["status"] == OK
@@ -0,0 +1,110 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from cafy_pytest import plugin
+from cafy_pytest.cls_debug import DebugAdapter
+
+PARAMS = {"testcase_name": "TestSanity.test_ping"}
+
+
+class FakeDebugAdapter(DebugAdapter):
+    """
+    Debug adapter whose snapshot collection blocks until released, remembering the logger it ran with.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(debug=True, reg_id="reg-1", **kwargs)
+        self.release = threading.Event()
+        self.loggers = []
+
+    def collector_call_snapshot(self, params, headers):
+        self.loggers.append(self.logger)
+        self.release.wait(5)
+        return SimpleNamespace(status_code=200, text="")
+
+
+@pytest.fixture
+def adapter(monkeypatch):
+    """
+    Fixture to provide the debug adapter used by the plugin.
+    """
+    adapter = FakeDebugAdapter(logger=plugin.CafyLog("cafy"))
+    monkeypatch.setattr(plugin, "register_object", adapter, raising=False)
+    yield adapter
+    adapter.release.set()
+    adapter.join_status_waits(timeout=5)
+
+
+@pytest.fixture
+def summary(monkeypatch):
+    """
+    Fixture to provide an empty summary.json content.
+    """
+    summary = {}
+    monkeypatch.setattr(plugin._CafyConfig, "summary", summary)
+    return summary
+
+
+@pytest.fixture
+def report(monkeypatch, tmpdir):
+    """
+    Fixture to provide an EmailReport taking the first failure snapshot in the background.
+    """
+    monkeypatch.setattr(plugin.CafyLog, "work_dir", str(tmpdir))
+    config_option = SimpleNamespace(snapshot_async=True, debug_join_timeout=0.2)
+    report = plugin.EmailReport(config_option, [], None, None, "localhost", 25, True, True,
+                                None, [], {}, [], False)
+    report.first_failed_testcase_name = PARAMS["testcase_name"]
+    return report
+
+
+class TestBackgroundSnapshot:
+    """
+    Test cases for the first failure snapshot taken with --snapshot-async.
+    """
+
+    def test_snapshot_runs_with_own_logger(self, report, adapter, summary):
+        """
+        Test that the snapshot is collected on a copy of the adapter logging to its own logger.
+        """
+        assert report.invoke_reg_on_failed_testcase_snapshot(PARAMS, {}) is None
+        assert summary["first_failure_snapshot"]["status"] == "running"
+        adapter.release.set()
+        report.snapshot_future.result(timeout=5)
+        assert len(adapter.loggers) == 1
+        assert adapter.loggers[0] is not adapter.logger
+        assert adapter.join_status_waits(timeout=5) == 0
+
+    def test_completion_is_recorded(self, report, adapter, summary):
+        """
+        Test that the summary records the completed snapshot and how long it took.
+        """
+        adapter.release.set()
+        report.invoke_reg_on_failed_testcase_snapshot(PARAMS, {})
+        report._wait_first_failure_snapshot()
+        snapshot = summary["first_failure_snapshot"]
+        assert snapshot["testcase_name"] == PARAMS["testcase_name"]
+        assert (snapshot["mode"], snapshot["status"], snapshot["status_code"]) == ("background", "completed", 200)
+        assert snapshot["duration"] >= 0
+
+    def test_unfinished_snapshot_is_recorded(self, report, adapter, summary):
+        """
+        Test that a snapshot still running past --debug-join-timeout is recorded as not finished.
+        """
+        report.invoke_reg_on_failed_testcase_snapshot(PARAMS, {})
+        report._wait_first_failure_snapshot()
+        snapshot = summary["first_failure_snapshot"]
+        assert snapshot["status"] == "not_finished"
+        assert snapshot["duration"] >= 0.2
+        assert not report.snapshot_future.done()
+
+    def test_late_completion_is_ignored(self, report, adapter, summary):
+        """
+        Test that a snapshot ending after the join timed out leaves the summary at not finished.
+        """
+        report.invoke_reg_on_failed_testcase_snapshot(PARAMS, {})
+        report._wait_first_failure_snapshot()
+        adapter.release.set()
+        assert report.snapshot_future.result(timeout=5).status_code == 200
+        assert summary["first_failure_snapshot"]["status"] == "not_finished"
@@ -1,6 +1,8 @@
+import os
 import time
 import pytest
 from cafy_pytest.cafy_gta import TimeCollectorPlugin
+from logger.cafylog import CafyLog
 
 @pytest.fixture
 def plugin():
@@ -26,7 +28,13 @@ class TestTimeCollectorPlugin:
         plugin.update_granular_time_testcase_dict(current_test, event, method_name, elapsed_time,feature_type)
 
         assert current_test in plugin.granular_time_testcase_dict
-        assert plugin.granular_time_testcase_dict[current_test][event][method_name][0] == [float(elapsed_time), 'non-infra']
+        stats = plugin.granular_time_testcase_dict[current_test][event][method_name]
+        assert (stats.count, stats.total, stats.feature_type) == (1, float(elapsed_time), 'non-infra')
+
+        plugin.update_granular_time_testcase_dict(current_test, event, method_name, 2.77, feature_type)
+        assert (stats.count, stats.minimum, stats.maximum) == (2, 1.23, 2.77)
+        assert stats.total == pytest.approx(4.0)
+        assert stats.samples is None
 
     def test_measure_time_for_set_or_get_methods(self, plugin):
         """
@@ -62,7 +70,8 @@ class TestTimeCollectorPlugin:
         plugin.original_sleep.assert_called_once_with(duration)
 
         # Check if the granular time is updated correctly
-        assert plugin.granular_time_testcase_dict["test_case_1"]["sleep"]["TestTimeCollectorPlugin.test_measure_sleep_time.time.sleep"][0] == [float(1500000.0), 'infra']
+        stats = plugin.granular_time_testcase_dict["test_case_1"]["sleep"]["TestTimeCollectorPlugin.test_measure_sleep_time.time.sleep"]
+        assert (stats.count, stats.total, stats.feature_type) == (1, float(1500000.0), 'infra')
 
     def test_update_CafyLog_gta_dict(self, plugin):
         """
@@ -97,6 +106,27 @@ class TestTimeCollectorPlugin:
         assert result["method1"] == ['1.23',occurence,'infra']
         assert result["method2"] == ['3.45',occurence,'non-infra']
 
+    def test_get_time_data_aggregates(self, plugin):
+        """
+        Test that get_time_data reports the aggregated timings in the same format.
+        """
+        plugin.max_samples = 2
+        for elapsed_time in (1.0, 2.5, 0.5):
+            plugin.update_granular_time_testcase_dict("test_case_1", "get_command", "method1", elapsed_time, "infra")
+        stats = plugin.granular_time_testcase_dict["test_case_1"]["get_command"]["method1"]
+        assert stats.samples == [1.0, 2.5]
+
+        result = plugin.get_time_data(plugin.granular_time_testcase_dict["test_case_1"]["get_command"], "get_command")
+
+        assert result["method1"][:3] == ['4.00', 3, 'infra']
+        assert result["method1"][3]["max"] == 2.5
+        assert plugin.total_get_command_time == 4.0
+
+        transformed = plugin.get_transformed_method_data("method1", result["method1"])
+        assert transformed["total_time"] == 4.0
+        assert transformed["occurence"] == 3
+        assert set(transformed) >= {"p50", "p90", "p99", "max"}
+
     def test_collect_granular_time_accouting_report(self, plugin):
         """
         Test the collect_granular_time_accouting_report method.
@@ -131,4 +161,318 @@ class TestTimeCollectorPlugin:
 
         # Check if methods are patched correctly
         assert item.cls.setup_method is None
-        assert item.cls.set_method is None
\ No newline at end of file
+        assert item.cls.set_method is None
+
+    @pytest.mark.parametrize("backend", ["patch", "monitoring", "setprofile"])
+    def test_raising_method_is_not_timed(self, backend):
+        """
+        Test that every backend times the set/get methods which return and none of those which raise.
+        """
+        class Device:
+            def get_version(self):
+                return "1.0"
+
+            def get_failing(self):
+                raise RuntimeError("failed")
+
+        plugin = TimeCollectorPlugin(backend=backend)
+        device = Device()
+        plugin.test_case_name = "T.test_raising"
+        if plugin.method_timer is None:
+            for name in ("get_version", "get_failing"):
+                setattr(device, name, plugin.measure_time_for_set_or_get_methods(getattr(Device, name), "Device")
+                        .__get__(device))
+        else:
+            for name in ("get_version", "get_failing"):
+                plugin.method_timer.track(getattr(Device, name).__code__, "get_command", "Device." + name, "infra")
+            plugin.method_timer.start()
+            plugin.flush_method_timer(plugin.test_case_name)
+        try:
+            for _ in range(2):
+                device.get_version()
+                with pytest.raises(RuntimeError):
+                    device.get_failing()
+        finally:
+            if plugin.method_timer is not None:
+                plugin.flush_method_timer()
+                plugin.method_timer.stop()
+        get_commands = plugin.granular_time_testcase_dict["T.test_raising"]["get_command"]
+        assert {source: stats.count for source, stats in get_commands.items()} == {"Device.get_version": 2}
+
+    def test_incremental_report_matches(self, tmp_path, monkeypatch):
+        """
+        Test that cafy_gta.json built from cafy_gta.jsonl is the same as the one built in memory.
+        """
+        monkeypatch.setenv("START_TIME", "0")
+        reports = []
+        for incremental in (False, True):
+            work_dir = tmp_path / str(incremental)
+            work_dir.mkdir()
+            monkeypatch.setattr(CafyLog, "work_dir", str(work_dir), raising=False)
+            plugin = TimeCollectorPlugin(incremental=incremental)
+            for test_case, timings in (("T.a", [1.0, 2.0]), ("T.b", [3.0]), ("T.a", [10.0])):
+                plugin.test_case_name = test_case
+                for elapsed_time in timings:
+                    plugin.update_granular_time_testcase_dict(test_case, "get_command", "D.get_x", elapsed_time, "infra")
+                teardown = plugin.pytest_runtest_teardown(None, None)
+                next(teardown)
+                with pytest.raises(StopIteration):
+                    next(teardown)
+                assert (test_case in plugin.granular_time_testcase_dict) != incremental
+            plugin.pytest_terminal_summary(None)
+            with open(os.path.join(str(work_dir), "cafy_gta.json")) as gta_file:
+                reports.append(gta_file.read())
+        assert reports[0] == reports[1]
+
+    def test_measure_sleep_time_in_function(self, plugin, mocker):
+        """
+        Test that a sleep called from a plain function is slept and timed.
+        """
+        mocker.patch.object(plugin, 'original_sleep')
+        plugin.test_case_name = "test_case_1"
+
+        def wait_for_device():
+            plugin.measure_sleep_time(0.5)
+        wait_for_device()
+
+        plugin.original_sleep.assert_called_once_with(0.5)
+        sleeps = plugin.granular_time_testcase_dict["test_case_1"]["sleep"]
+        assert list(sleeps) == [__name__ + ".wait_for_device.time.sleep"]
+
+    def test_thread_aware_attribution(self):
+        """
+        Test that sleeps of worker threads and asyncio tasks are attributed to the test which started them.
+        """
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from cafy_pytest.gta_context import set_current_test_case
+
+        plugin = TimeCollectorPlugin(thread_aware=True)
+        plugin.install_thread_aware_timing()
+        try:
+            plugin.test_case_name = "T.test_threads"
+            set_current_test_case(plugin.test_case_name)
+
+            def device_operation():
+                plugin.measure_sleep_time(0.05)
+
+            async def poll_devices():
+                await asyncio.gather(asyncio.sleep(0.05), asyncio.sleep(0.05))
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                future = executor.submit(device_operation)
+                set_current_test_case("T.test_next")
+                device_operation()
+                future.result()
+            set_current_test_case(plugin.test_case_name)
+            asyncio.run(poll_devices())
+        finally:
+            plugin.uninstall_thread_aware_timing()
+            set_current_test_case(None)
+
+        plugin.merge_thread_data("T.test_threads")
+        events = plugin.granular_time_testcase_dict["T.test_threads"]
+        sleeps = {source: stats.count for source, stats in events["sleep"].items()}
+        assert sleeps[__name__ + ".device_operation.time.sleep"] == 1
+        assert sleeps[__name__ + ".poll_devices.asyncio.sleep"] == 2
+        assert len(events["threads"]) == 2
+        assert events["concurrency"]["overlap"] > 0
+
+        report = plugin.get_test_time_report(events)
+        assert float(report["total_wall_time"]) < float(report["total_sleep_time"])
+        assert set(report["threads"]) == set(events["threads"])
+
+    def test_subprocess_timing(self):
+        """
+        Test that subprocess and os.system commands are timed in exc_command with their exit code and output size.
+        """
+        import subprocess
+        import sys
+
+        plugin = TimeCollectorPlugin(time_subprocesses=True)
+        plugin.install_subprocess_timing()
+        try:
+            plugin.test_case_name = "T.test_commands"
+            plugin.in_test = True
+
+            def run_commands():
+                subprocess.run([sys.executable, "-c", "print('x' * 9)"], stdout=subprocess.PIPE)
+                subprocess.call([sys.executable, "-c", "raise SystemExit(3)"])
+                os.system("exit 2")
+            run_commands()
+            plugin.in_test = False
+            subprocess.run([sys.executable, "-c", "pass"])
+        finally:
+            plugin.uninstall_subprocess_timing()
+        assert subprocess.Popen.wait.__module__ == "subprocess"
+
+        commands = plugin.granular_time_testcase_dict["T.test_commands"]["exc_command"]
+        python = os.path.basename(sys.executable)
+        source = __name__ + ".run_commands"
+        assert set(commands) == {source + ".subprocess." + python, source + ".os.system.exit"}
+        popen = commands[source + ".subprocess." + python]
+        assert (popen.count, popen.exit_codes, popen.output_bytes) == (2, {0: 1, 3: 1}, 10)
+        assert commands[source + ".os.system.exit"].exit_codes == {2: 1}
+
+        report = plugin.get_test_time_report(plugin.granular_time_testcase_dict["T.test_commands"])
+        assert float(report["total_exc_command_time"]) > 0
+
+    def test_text_mode_output_size(self):
+        """
+        Test that the output of a text mode subprocess is counted in bytes, not characters.
+        """
+        import subprocess
+        import sys
+
+        plugin = TimeCollectorPlugin(time_subprocesses=True)
+        plugin.install_subprocess_timing()
+        try:
+            plugin.test_case_name = "T.test_text"
+            plugin.in_test = True
+            stdout, stderr = subprocess.Popen(
+                [sys.executable, "-c", "import sys; sys.stdout.buffer.write('h\\u00e9llo \\u20ac'.encode('utf-8'))"],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8").communicate()
+            plugin.in_test = False
+        finally:
+            plugin.uninstall_subprocess_timing()
+        assert (stdout, stderr) == ("h\u00e9llo \u20ac", "")
+        commands = plugin.granular_time_testcase_dict["T.test_text"]["exc_command"]
+        assert [stats.output_bytes for stats in commands.values()] == [10]
+
+    def test_phase_and_fixture_timing(self):
+        """
+        Test that the phases and fixtures of a test are timed and reported with the unattributed time.
+        """
+        class FixtureDef:
+            def __init__(self, argname, scope):
+                self.argname, self.scope = argname, scope
+                self.finalizers = []
+
+            def addfinalizer(self, finalizer):
+                self.finalizers.append(finalizer)
+
+            def finish(self, plugin):
+                while self.finalizers:
+                    self.finalizers.pop()()
+                plugin.pytest_fixture_post_finalizer(self, None)
+
+        def run_hook(hook, sleep=0.0):
+            wrapper = hook()
+            next(wrapper)
+            time.sleep(sleep)
+            with pytest.raises(StopIteration):
+                next(wrapper)
+
+        plugin = TimeCollectorPlugin(time_phases=True)
+        plugin.test_case_name = "TestDevice.test_version"
+        collection = FixtureDef("enable_collection", "module")
+        setup_method = FixtureDef("_xunit_setup_method_fixture_TestDevice", "function")
+
+        setup = plugin.pytest_runtest_setup(None)
+        next(setup)
+        run_hook(lambda: plugin.pytest_fixture_setup(collection, None), 0.02)
+        run_hook(lambda: plugin.pytest_fixture_setup(setup_method, None))
+        with pytest.raises(StopIteration):
+            next(setup)
+        run_hook(lambda: plugin.pytest_runtest_call(None), 0.01)
+
+        teardown = plugin.pytest_runtest_teardown(None, None)
+        next(teardown)
+        collection.finish(plugin)
+        setup_method.finish(plugin)
+        with pytest.raises(StopIteration):
+            next(teardown)
+
+        events = plugin.granular_time_testcase_dict["TestDevice.test_version"]
+        assert set(events["phase"]) == {"setup", "call", "teardown"}
+        assert set(events["fixture"]) == {"enable_collection[module].setup", "enable_collection[module].teardown",
+                                          "TestDevice.setup_method[function].setup",
+                                          "TestDevice.setup_method[function].teardown"}
+        assert events["fixture"]["enable_collection[module].setup"].total >= 20000
+
+        report = plugin.get_test_time_report(events)
+        assert float(report["total_call_time"]) >= 10000
+        assert float(report["total_fixture_time"]) >= 20000
+        assert float(report["total_unattributed_time"]) >= 10000
+        assert report["phase"]["call"][2] == "phase"
+
+    def test_per_device_timing(self, mocker):
+        """
+        Test that set/get calls are timed per topology device and summarized in a table.
+        """
+        class Router:
+            def __init__(self, name):
+                self.name = name
+
+            def is_connected(self):
+                return True
+
+        class Bgp:
+            def __init__(self, device):
+                self.device = device
+
+            def get_neighbors(self):
+                return []
+
+            def set_neighbor(self, device, neighbor):
+                return neighbor
+
+        plugin = TimeCollectorPlugin(per_device=True)
+        plugin.test_case_name = "TestBgp.test_neighbors"
+        r1, r2 = Router("r1"), Router("r2")
+        get_neighbors = plugin.measure_time_for_set_or_get_methods(Bgp.get_neighbors, "Bgp")
+        set_neighbor = plugin.measure_time_for_set_or_get_methods(Bgp.set_neighbor, "Bgp")
+        get_neighbors(Bgp(r1))
+        get_neighbors(Bgp(r2))
+        set_neighbor(Bgp(None), r2, neighbor="10.0.0.1")
+        set_neighbor(Bgp(None), "r3", "10.0.0.1")
+
+        events = plugin.granular_time_testcase_dict["TestBgp.test_neighbors"]
+        assert {name: stats.count for name, stats in events["device"].items()} == {"r1": 1, "r2": 2}
+        report = plugin.get_test_time_report(events)
+        assert report["device"]["r2"][1:3] == [2, "device"]
+
+        terminalreporter = mocker.Mock()
+        plugin.write_device_summary(terminalreporter, plugin.get_aggregated_timing_stats())
+        table = terminalreporter.write_line.call_args_list[1][0][0]
+        assert "Device" in table and "r1" in table and "r2" in table
+        plugin.write_device_summary(terminalreporter, {})
+        assert terminalreporter.write_line.call_count == 2
+
+    @pytest.mark.parametrize("strict", [False, True])
+    def test_time_budget(self, mocker, strict):
+        """
+        Test that a test exceeding its time_budget marker warns, or fails in strict mode, at teardown.
+        """
+        from cafy_pytest.gta_budget import TimeBudgets, TimeBudgetWarning
+
+        class Outcome:
+            exception = None
+
+            def force_exception(self, exception):
+                self.exception = exception
+
+        plugin = TimeCollectorPlugin(time_budgets=TimeBudgets(default={"total": 100}), budget_strict=strict)
+        plugin.test_case_name = "TestBgp.test_neighbors"
+        plugin.update_granular_time_testcase_dict(plugin.test_case_name, 'sleep', 'TestBgp.wait', 3000000.0, 'non-infra')
+        item = mocker.Mock(nodeid="test_bgp.py::TestBgp::test_neighbors")
+        item.get_closest_marker.return_value = mocker.Mock(args=(), kwargs={"sleep": 2})
+
+        outcome = Outcome()
+        teardown = plugin.pytest_runtest_teardown(item, None)
+        next(teardown)
+        if strict:
+            with pytest.raises(StopIteration):
+                teardown.send(outcome)
+            assert isinstance(outcome.exception, pytest.fail.Exception)
+            assert "sleep 3.00s > 2.00s" in str(outcome.exception)
+        else:
+            with pytest.warns(TimeBudgetWarning, match="sleep 3.00s > 2.00s"), pytest.raises(StopIteration):
+                teardown.send(outcome)
+            assert outcome.exception is None
+        item.get_closest_marker.assert_called_once_with('time_budget')
+        assert plugin.budget_violations == [("TestBgp.test_neighbors", "sleep", 3.0, 2.0)]
+
+        terminalreporter = mocker.Mock()
+        plugin.write_budget_summary(terminalreporter)
+        assert "TestBgp.test_neighbors" in terminalreporter.write_line.call_args[0][0]
@@ -0,0 +1,52 @@
+import pytest
+
+from cafy_pytest.gta_budget import TimeBudgets
+
+
+class Marker:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def budget_file(tmpdir):
+    path = tmpdir.join("budgets.yaml")
+    path.write("default:\n"
+               "  total: 600\n"
+               "  sleep: 300\n"
+               "tests:\n"
+               "  TestBgp.test_neighbors:\n"
+               "    get_command: 30\n"
+               "  '*::TestIsis::*':\n"
+               "    sleep: 120\n")
+    return str(path)
+
+
+class TestTimeBudgets:
+    def test_budget_precedence(self, budget_file):
+        budgets = TimeBudgets.from_file(budget_file)
+        assert budgets.get_budget("TestOspf.test_area") == {"total": 600.0, "sleep": 300.0}
+        assert budgets.get_budget("TestBgp.test_neighbors") == {"total": 600.0, "sleep": 300.0, "get_command": 30.0}
+        assert budgets.get_budget("TestIsis.test_adj", "tests/test_isis.py::TestIsis::test_adj")["sleep"] == 120.0
+        marker = Marker(60, sleep=10)
+        assert budgets.get_budget("TestBgp.test_neighbors", marker=marker) == {
+            "total": 60.0, "sleep": 10.0, "get_command": 30.0}
+        assert TimeBudgets().get_budget("TestBgp.test_neighbors") == {}
+
+    def test_check(self):
+        budget = {"total": 10.0, "sleep": 5.0}
+        assert TimeBudgets.check(budget, {"total": 9.0, "sleep": 6.0}) == [("sleep", 6.0, 5.0)]
+        assert TimeBudgets.check(budget, {"total": 4.0, "sleep": 4.0}) == []
+
+    def test_invalid_budgets(self, tmpdir):
+        with pytest.raises(ValueError, match="unknown budget keys"):
+            TimeBudgets(default={"totl": 10})
+        with pytest.raises(ValueError, match="positive number"):
+            TimeBudgets(tests=[("Test*", {"sleep": "1m"})])
+        with pytest.raises(ValueError, match="unknown budget keys"):
+            TimeBudgets().get_budget("TestBgp.test_neighbors", marker=Marker(set=10))
+        path = tmpdir.join("budgets.yaml")
+        path.write("- total: 10\n")
+        with pytest.raises(ValueError, match="expected a mapping"):
+            TimeBudgets.from_file(str(path))
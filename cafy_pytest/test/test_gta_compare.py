@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from cafy_pytest.gta_compare import (IMPROVEMENT, REGRESSION, UNCHANGED, GtaRun, compare_runs, main,
+                                     mann_whitney_u)
+
+
+def make_run(get_per_call, sleep_time=1000.0, tests=10):
+    '''
+    GTA data of tests testcases calling Device.get_version 100 times and sleeping once
+    '''
+    gta = dict()
+    for index in range(tests):
+        # a bit of noise, so the runs are not identical
+        get_time = 100 * get_per_call * (1 + index / 100.0)
+        gta["TestDevice.test_%d" % index] = {
+            "categories": {
+                "sleep": [{"source": "TestDevice.test.time.sleep", "total_time": sleep_time,
+                           "occurence": 1.0, "type": "non-infra"}],
+                "get_command": [{"source": "Device.get_version", "total_time": get_time,
+                                 "occurence": 100.0, "type": "infra"}],
+            },
+            "totals": {"total_sleep_time": sleep_time, "total_set_command_time": 0.0,
+                       "total_get_command_time": get_time, "total_exc_command_time": 0.0,
+                       "total_time": sleep_time + get_time},
+        }
+    return gta
+
+
+def write_run(directory, gta, run_time=None):
+    os.makedirs(str(directory))
+    with open(os.path.join(str(directory), "cafy_gta.json"), "w") as gta_file:
+        json.dump(gta, gta_file)
+    if run_time is not None:
+        with open(os.path.join(str(directory), "cafy_gta_aggregated.json"), "w") as aggregated_file:
+            json.dump({"total_run_time": run_time}, aggregated_file)
+    return str(directory)
+
+
+def changes_by_name(comparison):
+    return {(change.kind, change.event, change.source): change for change in comparison["changes"]}
+
+
+class TestMannWhitneyU:
+    def test_separated_samples_are_significant(self):
+        assert mann_whitney_u([1, 2, 3, 4, 5, 6], [10, 11, 12, 13, 14, 15]) < 0.01
+
+    def test_same_samples_are_not_significant(self):
+        assert mann_whitney_u([1, 2, 3, 4], [1, 2, 3, 4]) == pytest.approx(1.0)
+        assert mann_whitney_u([5, 5, 5], [5, 5, 5]) == 1.0
+
+
+class TestCompareRuns:
+    def test_slower_getter_is_a_regression(self):
+        baseline = [GtaRun("a", make_run(50.0)), GtaRun("b", make_run(51.0))]
+        candidate = GtaRun("c", make_run(150.0))
+        comparison = compare_runs(baseline, candidate)
+        changes = changes_by_name(comparison)
+
+        getter = changes[("method", "get_command", "Device.get_version")]
+        assert getter.status == REGRESSION
+        assert getter.ratio == pytest.approx(150.0 / 50.5, rel=0.01)
+        assert getter.samples == (20, 10) and getter.p_value < 0.05
+        assert changes[("method", "sleep", "TestDevice.test.time.sleep")].status == UNCHANGED
+        assert changes[("event", "get_command", None)].status == REGRESSION
+        assert changes[("total", None, "total_event_time")].status == REGRESSION
+        assert comparison["test_cases"] == sorted(candidate.tests)
+
+    def test_faster_run_and_unaligned_tests(self):
+        candidate_gta = make_run(10.0, tests=12)
+        comparison = compare_runs([GtaRun("a", make_run(50.0))], GtaRun("b", candidate_gta))
+        changes = changes_by_name(comparison)
+        assert changes[("method", "get_command", "Device.get_version")].status == IMPROVEMENT
+        assert comparison["only_in_candidate"] == ["TestDevice.test_10", "TestDevice.test_11"]
+        assert len(comparison["test_cases"]) == 10
+
+    def test_small_change_is_ignored(self):
+        comparison = compare_runs([GtaRun("a", make_run(50.0))], GtaRun("b", make_run(50.0, sleep_time=1001.0)))
+        assert all(change.status == UNCHANGED for change in comparison["changes"])
+
+
+class TestMain:
+    def test_exit_status(self, tmpdir, capsys):
+        baseline = write_run(tmpdir.join("baseline"), make_run(50.0), run_time=2000000.0)
+        candidate = write_run(tmpdir.join("candidate"), make_run(150.0), run_time=2100000.0)
+        same = write_run(tmpdir.join("same"), make_run(50.0))
+        json_path = str(tmpdir.join("comparison.json"))
+
+        assert main([baseline, candidate, "--json", json_path]) == 1
+        output = capsys.readouterr().out
+        assert "REGRESSION" in output and "Device.get_version" in output
+        assert "Run time: 2000000.00us -> 2100000.00us" in output
+        with open(json_path) as json_file:
+            comparison = json.load(json_file)
+        assert comparison["candidate"].endswith(os.path.join("candidate", "cafy_gta.json"))
+        assert REGRESSION in [change["status"] for change in comparison["changes"]]
+
+        assert main([baseline, same]) == 0
+        assert main([candidate, baseline, "--threshold", "2"]) == 0
+
+    def test_new_time_is_written_as_null(self, tmpdir, capsys):
+        baseline = write_run(tmpdir.join("baseline"), make_run(50.0, sleep_time=0.0))
+        candidate = write_run(tmpdir.join("candidate"), make_run(50.0, sleep_time=5000.0))
+        json_path = str(tmpdir.join("comparison.json"))
+
+        assert main([baseline, candidate, "--json", json_path]) == 1
+        output = capsys.readouterr().out
+        assert "total_sleep_time: 0.00us -> 50000.00us xinf" in output
+        assert "threshold only" in output and "p=n/a" not in output
+        with open(json_path) as json_file:
+            changes = {(change["kind"], change["event"], change["source"]): change
+                       for change in json.load(json_file)["changes"]}
+        sleep_total = changes[("total", None, "total_sleep_time")]
+        assert (sleep_total["ratio"], sleep_total["p_value"], sleep_total["status"]) == (None, None, REGRESSION)
+        assert changes[("event", "sleep", None)]["ratio"] is None
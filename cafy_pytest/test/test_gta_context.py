@@ -0,0 +1,138 @@
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from cafy_pytest.gta_context import (ThreadBuffers, get_concurrency, get_current_test_case,
+                                     install_context_propagation, set_current_test_case,
+                                     uninstall_context_propagation, union_intervals)
+
+
+@pytest.fixture
+def propagation():
+    """
+    Fixture to install the context propagation into threads and executors.
+    """
+    install_context_propagation()
+    try:
+        yield
+    finally:
+        uninstall_context_propagation()
+        set_current_test_case(None)
+
+
+class TestGtaContext:
+    """
+    Test cases for the GTA testcase attribution across threads.
+    """
+
+    def test_test_case_propagates_to_threads_and_executors(self, propagation):
+        """
+        Test that threads and executor tasks see the testcase which started them.
+        """
+        seen = []
+        set_current_test_case("T.test_one")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            set_current_test_case("T.test_two")
+            future = executor.submit(get_current_test_case)
+        thread = threading.Thread(target=lambda: seen.append(get_current_test_case()))
+        thread.start()
+        thread.join()
+        assert future.result() == "T.test_two"
+        assert seen == ["T.test_two"]
+
+    def test_thread_buffers_pop_per_test(self):
+        """
+        Test that the data recorded by each thread is popped per testcase.
+        """
+        buffers = ThreadBuffers()
+
+        def record(test_case_name):
+            buffer = buffers.get()
+            buffer.granular.setdefault(test_case_name, {})["sleep"] = threading.current_thread().name
+            buffer.add_interval(test_case_name, 0.0, 1.0)
+
+        threads = [threading.Thread(target=record, args=("T.a",), name="worker-%d" % i) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record("T.b")
+
+        assert sorted(events["sleep"] for events in buffers.pop_granular("T.a")) == ["worker-0", "worker-1", "worker-2"]
+        assert len(buffers.pop_intervals("T.a")) == 3
+        assert buffers.test_cases() == {"T.b"}
+
+    def test_thread_buffers_of_exited_threads_are_dropped(self):
+        """
+        Test that the buffers of short lived threads do not pile up across testcases.
+        """
+        buffers = ThreadBuffers()
+
+        def record(test_case_name):
+            buffer = buffers.get()
+            buffer.granular.setdefault(test_case_name, {})["sleep"] = 1
+            buffer.add_interval(test_case_name, 0.0, 1.0)
+
+        for index in range(5):
+            test_case_name = "T.test_%d" % index
+            threads = [threading.Thread(target=record, args=(test_case_name,)) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # the data of the exited threads is still there until it is popped
+            assert len(buffers) == 20
+            assert len(buffers.pop_granular(test_case_name)) == 20
+            assert sum(len(flat) // 2 for flat in buffers.pop_intervals(test_case_name).values()) == 20
+            assert len(buffers) == 0
+        record("T.main")
+        buffers.pop_granular("T.main")
+        buffers.pop_intervals("T.main")
+        # the buffer of a running thread is kept
+        assert len(buffers) == 1
+
+    def test_pop_while_a_thread_records(self, monkeypatch):
+        """
+        Test that an interval recorded by another thread while the testcase is popped is not lost.
+        """
+        from cafy_pytest import gta_context
+
+        entered, resume = threading.Event(), threading.Event()
+        current_lane = gta_context._current_lane
+
+        def slow_lane():
+            entered.set()
+            resume.wait(5)
+            return current_lane()
+
+        monkeypatch.setattr(gta_context, "_current_lane", slow_lane)
+        buffers = ThreadBuffers()
+        thread = threading.Thread(target=lambda: buffers.get().add_interval("T.a", 0.0, 1.0))
+        thread.start()
+        assert entered.wait(5)
+        # the teardown pops the testcase while the thread is inside add_interval
+        assert buffers.pop_intervals("T.a") == {}
+        assert buffers.test_cases() == set()
+        resume.set()
+        thread.join(5)
+        assert buffers.test_cases() == {"T.a"}
+        assert [list(flat) for flat in buffers.pop_intervals("T.a").values()] == [[0.0, 1.0]]
+
+    def test_union_intervals(self):
+        """
+        Test that overlapping and nested intervals are merged.
+        """
+        assert union_intervals([(5, 6), (0, 2), (1, 3), (1.5, 1.8)]) == [[0, 3], [5, 6]]
+
+    def test_concurrency(self):
+        """
+        Test busy time per thread, wall and overlap time of two threads partly running at once.
+        """
+        lanes = {
+            ("MainThread", None): array('d', [0.0, 4.0, 1.0, 2.0]),  # nested call counted once
+            ("worker", None): array('d', [2.0, 6.0]),
+        }
+        threads, wall, overlap = get_concurrency(lanes)
+        assert threads == {"MainThread": [4.0, 2], "worker": [4.0, 1]}
+        assert wall == 6.0
+        assert overlap == 2.0
@@ -0,0 +1,38 @@
+from cafy_pytest.gta_journal import GtaJournal
+
+
+class TestGtaJournal:
+    """
+    Test cases for the per testcase GTA journal.
+    """
+
+    def test_index_groups_records_per_test(self, tmp_path):
+        """
+        Test that the records of a test which ran twice are read back together, in run order.
+        """
+        journal = GtaJournal(str(tmp_path / "cafy_gta.jsonl"))
+        journal.append("T.a", {"sleep": {"m": {"value": 1}}})
+        journal.append("T.b", {"sleep": {"m": {"value": 2}}})
+        journal.append("T.a", {"sleep": {"m": {"value": 3}}})
+
+        index = journal.index()
+
+        assert list(index) == ["T.a", "T.b"]
+        assert journal.read(index["T.a"]) == [{"sleep": {"m": {"value": 1}}}, {"sleep": {"m": {"value": 3}}}]
+        assert [test for test, _ in journal] == ["T.a", "T.b", "T.a"]
+        journal.close()
+
+    def test_truncated_last_line_is_skipped(self, tmp_path):
+        """
+        Test that a record cut short by a crash does not prevent reading the others.
+        """
+        path = tmp_path / "cafy_gta.jsonl"
+        journal = GtaJournal(str(path))
+        journal.append("T.a", {})
+        journal.close()
+        with open(str(path), "a") as journal_file:
+            journal_file.write('{"test": "T.b", "eve')
+
+        journal._file = open(str(path), "a")
+        assert list(journal.index()) == ["T.a"]
+        journal.close()
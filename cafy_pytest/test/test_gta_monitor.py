@@ -0,0 +1,89 @@
+import sys
+import pytest
+from cafy_pytest.gta_monitor import MONITORING, SETPROFILE, MethodTimer, TimingBuffer
+
+
+class Device:
+    def set_hostname(self, name):
+        self.name = name
+        return name
+
+    def get_hostname(self):
+        return self.name
+
+    def get_failing(self):
+        raise RuntimeError("failed")
+
+    def other(self):
+        return self.get_hostname()
+
+
+@pytest.fixture(params=[MONITORING, SETPROFILE])
+def timer(request):
+    """
+    Fixture to provide a started MethodTimer for each backend.
+    """
+    if request.param == MONITORING and not hasattr(sys, "monitoring"):
+        pytest.skip("sys.monitoring requires python 3.12+")
+    timer = MethodTimer(request.param)
+    for name in ("set_hostname", "get_hostname", "get_failing"):
+        event = "set_command" if name.startswith("set") else "get_command"
+        timer.track(getattr(Device, name).__code__, event, "Device." + name, "infra")
+    timer.start()
+    try:
+        yield timer
+    finally:
+        timer.stop()
+
+
+class TestMethodTimer:
+    """
+    Test cases for the MethodTimer GTA backends.
+    """
+
+    def test_records_tracked_methods(self, timer):
+        """
+        Test that only the tracked methods are recorded, per testcase.
+        """
+        device = Device()
+        timer.begin("TestA.test_one")
+        device.set_hostname("r1")
+        device.other()
+        device.other()
+        name, timings = timer.begin("TestA.test_two")
+        assert name == "TestA.test_one"
+        sources = [timer.methods[method_id][1] for method_id, _ in timings]
+        assert sources == ["Device.set_hostname", "Device.get_hostname", "Device.get_hostname"]
+        assert all(duration >= 0 for _, duration in timings)
+        assert len(timer.begin(None)[1]) == 0
+
+    def test_exception_keeps_stack_balanced(self, timer):
+        """
+        Test that a method raising an exception does not break the following timings.
+        """
+        device = Device()
+        device.set_hostname("r1")
+        timer.begin("TestA.test_one")
+        with pytest.raises(RuntimeError):
+            device.get_failing()
+        device.get_hostname()
+        _, timings = timer.begin(None)
+        sources = [timer.methods[method_id][1] for method_id, _ in timings]
+        assert sources == ["Device.get_hostname"]
+        assert timer._stack() == []
+
+    def test_classes_are_not_modified(self, timer):
+        """
+        Test that the timed methods are the original functions.
+        """
+        assert Device.__dict__["get_hostname"].__code__.co_filename == __file__
+
+    def test_timing_buffer_grows(self):
+        """
+        Test that the TimingBuffer doubles its preallocated capacity when full.
+        """
+        timings = TimingBuffer(capacity=2)
+        for i in range(5):
+            timings.append(i, float(i))
+        assert list(timings) == [(i, float(i)) for i in range(5)]
+        assert len(timings.method_ids) == 8
@@ -0,0 +1,74 @@
+import json
+import pytest
+from cafy_pytest.gta_stats import LogHistogram, TimingStats, histograms_to_dict, merge_histogram_dicts
+
+
+class TestGtaStats:
+    """
+    Test cases for the GTA timing aggregates and histograms.
+    """
+
+    def test_percentiles_show_the_tail(self):
+        """
+        Test that a rare slow call shows in p99 and max but not in p50.
+        """
+        stats = TimingStats("infra")
+        for i in range(1000):
+            stats.add(30000000.0 if i % 50 == 0 else 50000.0)
+        latency = stats.latency()
+        assert latency["p50"] == pytest.approx(50000.0, rel=0.01)
+        assert latency["p90"] == pytest.approx(50000.0, rel=0.01)
+        assert latency["p99"] == pytest.approx(30000000.0, rel=0.01)
+        assert latency["max"] == 30000000.0
+
+    def test_merge(self):
+        """
+        Test that merging gives the same result as recording all timings in one record.
+        """
+        first, second, combined = TimingStats("infra"), TimingStats("infra"), TimingStats("infra")
+        for value in range(1, 101):
+            (first if value % 2 else second).add(float(value))
+            combined.add(float(value))
+        first.merge(second)
+        assert (first.count, first.total, first.minimum, first.maximum) == (100, 5050.0, 1.0, 100.0)
+        assert first.histogram.counts == combined.histogram.counts
+        assert first.latency() == combined.latency()
+        assert first.stddev == pytest.approx(combined.stddev)
+
+    def test_empty_record_is_strict_json(self):
+        """
+        Test that a record without calls is written without Infinity and read back mergeable.
+        """
+        empty = TimingStats("infra")
+        data = json.loads(json.dumps(empty.to_dict(), allow_nan=False))
+        assert (data["min"], data["max"]) == (None, None)
+        restored = TimingStats.from_dict(data)
+        restored.add(5.0)
+        assert (restored.minimum, restored.maximum) == (5.0, 5.0)
+        restored.merge(TimingStats.from_dict(data))
+        assert (restored.count, restored.minimum, restored.maximum) == (1, 5.0, 5.0)
+
+    def test_histogram_dicts_merge_across_runs(self):
+        """
+        Test that histograms written as json by two runs merge into one.
+        """
+        run_1 = {"get_command": {"Device.get_state": LogHistogram()}}
+        run_2 = {"get_command": {"Device.get_state": LogHistogram(), "Device.get_version": LogHistogram()}}
+        run_1["get_command"]["Device.get_state"].add(10.0)
+        run_2["get_command"]["Device.get_state"].add(1000.0)
+        run_2["get_command"]["Device.get_version"].add(5.0)
+
+        merged = {}
+        for run in (run_1, run_2):
+            merge_histogram_dicts(merged, json.loads(json.dumps(histograms_to_dict(run))))
+
+        assert merged["get_command"]["Device.get_state"].count == 2
+        assert merged["get_command"]["Device.get_state"].value_at_percentile(100) == pytest.approx(1000.0, rel=0.01)
+        assert merged["get_command"]["Device.get_version"].count == 1
+
+    def test_merge_different_growth(self):
+        """
+        Test that histograms with different buckets are not merged.
+        """
+        with pytest.raises(ValueError):
+            LogHistogram(1.02).merge(LogHistogram(1.05))
@@ -0,0 +1,96 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from cafy_pytest import gta_upload
+from cafy_pytest.gta_upload import GtaSender, GtaSpool, main
+
+
+class GtaStandIn(BaseHTTPRequestHandler):
+    status_code = 200
+    received = []
+    encodings = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.encodings.append(self.headers.get('Content-Encoding'))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if self.status_code == 200:
+            self.received.append(json.loads(body))
+        self.send_response(self.status_code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def gta_server():
+    """
+    Fixture to provide a local stand-in of the GTA endpoint.
+    """
+    GtaStandIn.status_code = 200
+    GtaStandIn.received = []
+    GtaStandIn.encodings = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GtaStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:%d/api/gta" % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def time_report(tests):
+    return {"TestSuite.test_%d" % i: {"categories": {}, "totals": {"total_time": float(i)}} for i in range(tests)}
+
+
+class TestGtaUpload:
+    """
+    Test cases for the spooled GTA upload.
+    """
+
+    def test_batches_are_sent_and_removed(self, tmp_path, gta_server, mocker):
+        """
+        Test that the run is split in compressed batches, written once, which are sent as plain json and removed.
+        """
+        spool = GtaSpool(str(tmp_path / "gta_spool"))
+        gzip_open = mocker.spy(gta_upload.gzip, "open")
+        paths = spool.write_batches(1234, time_report(5), {"total_run_time": 1.0}, tests_per_batch=2)
+        assert len(paths) == 3
+        assert gzip_open.call_count == 3
+        assert sorted(path.name for path in (tmp_path / "gta_spool").iterdir()) == [
+            "gta-1234-%04d.json.gz" % i for i in range(3)]
+
+        sent, left = GtaSender(gta_server, "key", backoff=0).drain(spool)
+
+        assert (sent, left) == (3, 0)
+        assert spool.pending() == []
+        assert [batch["batch"] for batch in GtaStandIn.received] == [{"index": i, "count": 3} for i in range(3)]
+        assert sorted(test for batch in GtaStandIn.received for test in batch["gta"]) == sorted(time_report(5))
+        assert all(batch["run_id"] == 1234 for batch in GtaStandIn.received)
+        assert [batch.get("aggregated_gta") for batch in GtaStandIn.received] == [{"total_run_time": 1.0}, None, None]
+        assert GtaStandIn.encodings == [None] * 3
+
+    def test_endpoint_down_leaves_spool_for_replay(self, tmp_path, gta_server):
+        """
+        Test that batches refused by the endpoint stay in the spool and are uploaded by the replay CLI.
+        """
+        spool = GtaSpool(str(tmp_path / "gta_spool"))
+        spool.write_batches(1234, time_report(4), {}, tests_per_batch=2)
+        GtaStandIn.status_code = 503
+
+        sent, left = GtaSender(gta_server, "key", max_attempts=2, backoff=0).drain(spool)
+
+        assert (sent, left) == (0, 2)
+        assert len(spool.pending()) == 2
+
+        GtaStandIn.status_code = 200
+        assert main([spool.spool_dir, "--url", gta_server, "--compress"]) == 0
+        assert spool.pending() == []
+        assert len(GtaStandIn.received) == 2
+        assert GtaStandIn.encodings[-2:] == ["gzip", "gzip"]
@@ -0,0 +1,103 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+import requests
+
+from cafy_pytest.http_client import HttpClient
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with the server's status, keeping the connection alive.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.hits += 1
+        body = b"ok"
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """
+    Fixture to provide a local HTTP server counting the requests it gets.
+    """
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    server = ThreadingServer(("127.0.0.1", 0), StatusHandler)
+    server.hits = 0
+    server.status = 200
+    server.url = "http://127.0.0.1:%d/" % server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    """
+    Fixture to provide an HttpClient retrying without backoff.
+    """
+    client = HttpClient(pool_connections=2, pool_maxsize=2, retry_count=3, backoff_factor=0, timeout=5)
+    yield client
+    client.close()
+
+
+class TestHttpClient:
+    """
+    Test cases for the pooled HTTP client.
+    """
+
+    def test_one_session_per_retry_count(self, client):
+        """
+        Test that the session of a retry policy is created once and reused.
+        """
+        assert client.session() is client.session(3)
+        assert client.session(0) is client.session(0)
+        assert client.session(0) is not client.session()
+        assert client.session(0).get_adapter("http://host/").max_retries.total == 0
+        assert client.session().get_adapter("https://host/").max_retries.total == 3
+
+    def test_pool_sizes(self, client):
+        """
+        Test that the adapters of the sessions get the pool sizes of the client.
+        """
+        adapter = client.session().get_adapter("http://host/")
+        assert adapter._pool_connections == 2
+        assert adapter._pool_maxsize == 2
+
+    @pytest.mark.parametrize("retry_count, attempts", [(0, 1), (2, 3)])
+    def test_retry_count(self, client, server, retry_count, attempts):
+        """
+        Test that a retried status is attempted retry_count more times, retry_count=0 meaning one attempt.
+        """
+        server.status = 503
+        with pytest.raises(requests.exceptions.RetryError):
+            client.request("GET", server.url, retry_count=retry_count)
+        assert server.hits == attempts
+
+    def test_connection_stats(self, client, server):
+        """
+        Test that the requests, attempts and reused connections are counted per host.
+        """
+        for _ in range(3):
+            assert client.request("GET", server.url).status_code == 200
+        server.status = 503
+        with pytest.raises(requests.exceptions.RetryError):
+            client.request("GET", server.url, retry_count=1)
+        stats = client.connection_stats()
+        assert stats == {"127.0.0.1": {"requests": 4, "attempts": 5, "connections": 2, "reused": 3}}
@@ -0,0 +1,22 @@
+from cafy_pytest.gta_journal import GtaJournal
+from cafy_pytest.jsonl import iter_jsonl, parse_json_line
+
+
+def test_malformed_lines_are_skipped(tmpdir):
+    path = tmpdir.join("records.jsonl")
+    path.write('{"name": "test_a"}\nnot json\n\n{"name": "test_b"}\n{"name": "tes')
+    assert list(iter_jsonl(str(path))) == [{"name": "test_a"}, {"name": "test_b"}]
+    assert parse_json_line(b'{"name": "tes') is None
+
+
+def test_gta_journal_skips_malformed_lines(tmpdir):
+    path = str(tmpdir.join("cafy_gta.jsonl"))
+    journal = GtaJournal(path)
+    journal.append("T.test_a", {"set": {}})
+    journal._file.write('{"test": "T.te\n')
+    journal.append("T.test_b", {"get": {}})
+    assert list(journal) == [("T.test_a", {"set": {}}), ("T.test_b", {"get": {}})]
+    offsets = journal.index()
+    assert list(offsets) == ["T.test_a", "T.test_b"]
+    assert journal.read(offsets["T.test_b"]) == [{"get": {}}]
+    journal.close()
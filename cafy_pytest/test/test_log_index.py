@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from cafy_pytest.log_index import (LogIndex, LogIndexer, build_log_index, compress_log, iter_log_index, main,
+                                   read_log_range)
+
+
+def make_testcase_log(name, status, lines=3):
+    return ([b"-Title--- 10:00:00 > ==========\n",
+             b"-Title--- Start test:  " + name.encode() + b"\n"] +
+            [b"-Info---- \x1b[32mstep %d of %s\x1b[0m\n" % (index, name.encode()) for index in range(lines)] +
+            [b"-Error--- failed\n" if status == "failed" else b"plain stdout\n",
+             b"-Title--- Finish test: " + name.encode() + b" (" + status.encode() + b")\n"])
+
+
+@pytest.fixture
+def work_dir(tmpdir):
+    with open(str(tmpdir.join("all.log")), "wb") as log_file:
+        log_file.write(b"-Info---- setting up testbed\n")
+        for name, status in (("TestA.test_one", "passed"), ("TestA.test_two", "failed"), ("TestA.test_one", "passed")):
+            log_file.writelines(make_testcase_log(name, status, lines=2000))
+    return str(tmpdir)
+
+
+class TestLogIndexer:
+    def test_incremental_update(self, tmpdir):
+        log_path = str(tmpdir.join("all.log"))
+        indexer = LogIndexer(log_path)
+        assert indexer.update() == []
+        with open(log_path, "wb") as log_file:
+            log_file.write(b"-Info---- setting up\n")
+            log_file.writelines(make_testcase_log("TestA.test_one", "failed"))
+            # the next testcase, with its last line not flushed yet
+            log_file.write(b"-Title--- Start test:  TestA.test_two\n-Info---- half a li")
+        finished = indexer.update()
+        assert [(entry["name"], entry["status"]) for entry in finished] == [("TestA.test_one", "failed")]
+        assert finished[0]["levels"] == {"INFO": 3, "ERROR": 1, "TITLE": 1}
+        with open(log_path, "rb") as log_file:
+            data = log_file.read()
+        assert data[finished[0]["start"]:finished[0]["end"]] == b"".join(make_testcase_log("TestA.test_one", "failed")[1:])
+
+        with open(log_path, "ab") as log_file:
+            log_file.write(b"ne\n")
+        assert indexer.update() == []
+        unfinished = indexer.close()
+        assert unfinished[0]["name"] == "TestA.test_two" and unfinished[0]["status"] is None
+        assert unfinished[0]["levels"] == {"INFO": 1}
+        assert [entry["name"] for entry in iter_log_index(log_path + ".idx")] == ["TestA.test_one", "TestA.test_two"]
+
+
+class TestLogIndex:
+    def test_extract(self, work_dir):
+        build_log_index(os.path.join(work_dir, "all.log"))
+        index = LogIndex(work_dir)
+        assert [entry["status"] for entry in index.get_entries("TestA.test_one")] == ["passed", "passed"]
+        log = index.extract("TestA.test_two")
+        assert log.startswith(b"-Title--- Start test:  TestA.test_two\n")
+        assert log.endswith(b"Finish test: TestA.test_two (failed)\n") and log.count(b"\n") == 2003
+        with pytest.raises(KeyError):
+            index.extract("TestA.test_three")
+
+    @pytest.mark.parametrize("frame_size", [4096, 1024 * 1024])
+    def test_compressed_log(self, work_dir, frame_size):
+        log_path = os.path.join(work_dir, "all.log")
+        with open(log_path, "rb") as log_file:
+            data = log_file.read()
+        entries = LogIndex(work_dir).entries
+        compressed_path = compress_log(log_path, frame_size=frame_size)
+        os.remove(log_path)
+
+        index = LogIndex(work_dir)
+        assert index.log_path == compressed_path and index.entries == entries
+        assert index.extract("TestA.test_one", 0) == data[entries[0]["start"]:entries[0]["end"]]
+        assert index.extract("TestA.test_one") == data[entries[2]["start"]:entries[2]["end"]]
+        # ranges crossing frame boundaries
+        for start, end in ((0, 10), (frame_size - 5, frame_size + 5), (100, len(data)), (len(data) - 1, len(data))):
+            assert read_log_range(compressed_path, start, end) == data[start:end]
+        with open(compressed_path + ".frames") as frames_file:
+            assert len(json.load(frames_file)["frames"]) == -(-len(data) // frame_size)
+
+
+class TestMain:
+    def test_show_and_compress(self, work_dir, capsysbinary):
+        assert main(["list", work_dir]) == 0
+        output = capsysbinary.readouterr().out.decode()
+        assert "TestA.test_two failed" in output and "ERROR=1" in output
+
+        output_path = os.path.join(work_dir, "test_two.log")
+        assert main(["show", work_dir, "TestA.test_two", "-o", output_path]) == 0
+        with open(output_path, "rb") as output_file:
+            test_log = output_file.read()
+
+        assert main(["compress", work_dir]) == 0
+        assert not os.path.exists(os.path.join(work_dir, "all.log"))
+        capsysbinary.readouterr()
+        assert main(["show", work_dir, "TestA.test_two"]) == 0
+        assert capsysbinary.readouterr().out == test_log
+        assert main(["show", work_dir, "TestA.test_three"]) == 1
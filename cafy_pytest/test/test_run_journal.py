@@ -0,0 +1,65 @@
+import json
+
+from cafy_pytest.run_journal import (RunJournal, iter_mode_report, iter_retest_data, iter_run_journal,
+                                     write_json_dict, write_json_list)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_append_is_visible_and_fsynced_in_batches(tmpdir):
+    clock = Clock()
+    path = str(tmpdir.join("run_journal.jsonl"))
+    journal = RunJournal(path, fsync_interval=1.0, fsync_every=3, clock=clock)
+    journal.append({"name": "test_a", "when": "setup"})
+    # flushed at once, for the readers tailing the file
+    assert [record["name"] for record in iter_run_journal(path)] == ["test_a"]
+    journal.append({"name": "test_a", "when": "call"})
+    assert journal.syncs == 0
+    journal.append({"name": "test_a", "when": "teardown"})
+    assert journal.syncs == 1
+    clock.now = 1.5
+    journal.append({"name": "test_b", "when": "setup", "duration": object()})
+    assert journal.syncs == 2
+    journal.append({"name": "test_b", "when": "call"})
+    journal.close()
+    journal.close()
+    assert journal.syncs == 3 and journal.records == 5
+
+
+def test_truncated_last_line_is_skipped(tmpdir):
+    path = tmpdir.join("run_journal.jsonl")
+    path.write('{"name": "test_a"}\n{"name": "tes')
+    assert list(iter_run_journal(str(path))) == [{"name": "test_a"}]
+
+
+def test_derived_files_match_in_memory_dumps(tmpdir):
+    path = str(tmpdir.join("run_journal.jsonl"))
+    journal = RunJournal(path)
+    retest = [{"name": "test_a", "testcase_status": "failed", "error": "boom", "stack_exception": "E  x\nE  y"},
+              {"name": "test_c", "testcase_status": "skipped", "exception": None}]
+    modes = {"test_a": {"final_status": "cli"}, "test_b": {"final_status": "ydk", "cli_percentage": 0.0}}
+    journal.append({"name": "test_a", "when": "call"})
+    journal.append({"name": "test_a", "when": "teardown", "retest": retest[:1], "mode_report": modes["test_a"]})
+    journal.append({"name": "test_b", "when": "teardown", "retest": [], "mode_report": {"final_status": "cli"}})
+    journal.append({"name": "test_b", "when": "teardown", "retest": [], "mode_report": modes["test_b"]})
+    journal.append({"name": "test_c", "when": "teardown", "retest": retest[1:], "mode_report": None})
+    journal.close()
+
+    retest_path = str(tmpdir.join("retest_data.json"))
+    write_json_list(retest_path, iter_retest_data(path), indent=4)
+    with open(retest_path) as retest_file:
+        assert retest_file.read() == json.dumps(retest, indent=4)
+    write_json_list(retest_path, iter([]), indent=4)
+    with open(retest_path) as retest_file:
+        assert retest_file.read() == json.dumps([], indent=4)
+
+    mode_path = str(tmpdir.join("testcase_mode.json"))
+    write_json_dict(mode_path, lambda: iter_mode_report(path))
+    with open(mode_path) as mode_file:
+        assert mode_file.read() == json.dumps(modes)
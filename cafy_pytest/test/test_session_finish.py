@@ -0,0 +1,87 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cafy_pytest import plugin
+
+
+class StepRecorder:
+    """
+    Replaces the session finish steps, remembering which steps ended before collection_deconfigure started.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ended = []
+        self.ended_before_deconfigure = None
+
+    def step(self, name, duration=0.05):
+        def run(*args, **kwargs):
+            time.sleep(duration)
+            with self.lock:
+                self.ended.append(name)
+        return run
+
+    def deconfigure(self):
+        with self.lock:
+            self.ended_before_deconfigure = list(self.ended)
+
+
+@pytest.fixture
+def report(monkeypatch, tmpdir, mocker):
+    """
+    Fixture to provide an EmailReport with --collection whose session finish steps are recorded.
+    """
+    monkeypatch.setattr(plugin.CafyLog, "work_dir", str(tmpdir))
+    monkeypatch.setattr(plugin._CafyConfig, "summary", {})
+    config_option = SimpleNamespace(debug_join_timeout=5, finish_workers=8)
+    report = plugin.EmailReport(config_option, [], None, None, "localhost", 25, True, True,
+                                None, [], {}, ["model_coverage"], False)
+    report.log = mocker.Mock()
+    report.recorder = recorder = StepRecorder()
+    report.collection_manager = SimpleNamespace(deconfigure=recorder.deconfigure)
+    report.snapshot_future = object()
+    # the snapshot outlasts the debug collector logs
+    report._wait_first_failure_snapshot = recorder.step("_wait_first_failure_snapshot", duration=0.3)
+    for name in ("_save_test_data", "_generate_allure_report",
+                 "_write_retest_data", "_join_debug_collections", "_get_analyzer_log", "_get_collector_log"):
+        setattr(report, name, recorder.step(name))
+    monkeypatch.setattr(plugin, "get_git_commit_id", recorder.step("get_git_commit_id"))
+    return report
+
+
+class TestSessionFinish:
+    """
+    Test cases for the order of the session finish steps.
+    """
+
+    @pytest.mark.parametrize("debug", [False, True])
+    def test_collection_deconfigure_runs_last(self, report, monkeypatch, debug):
+        """
+        Test that the collections are deconfigured once every other step settled, with or without debug.
+        """
+        monkeypatch.setattr(plugin.CafyLog, "debug_enable", debug, raising=False)
+        monkeypatch.setattr(plugin.CafyLog, "registration_id", "reg-1" if debug else None, raising=False)
+        report.pytest_sessionfinish()
+        expected = {"_wait_first_failure_snapshot", "_save_test_data", "_generate_allure_report",
+                    "_write_retest_data", "get_git_commit_id"}
+        if debug:
+            expected |= {"_join_debug_collections", "_get_analyzer_log", "_get_collector_log"}
+        assert set(report.recorder.ended_before_deconfigure) == expected
+        timings = plugin._CafyConfig.summary["session_finish"]["sessionfinish"]
+        assert timings["collection_deconfigure"]["status"] == "ok"
+
+    def test_all_log_html_renders_the_log_logged_before_the_step(self, report, tmpdir):
+        """
+        Test that the lines logged to all.log after the all_log_html step was added are not rendered.
+        """
+        report.config_option.all_log_html = "full"
+        all_log = tmpdir.join("all.log")
+        all_log.write("-Title--- Start test:  TestClass.test_one\n-Info---- before the summary\n")
+        log_size = report._all_log_size()
+        all_log.write("-Info---- logged by the terminal summary\n-Info---- half", mode="a")
+        report._generate_all_log_html(log_size)
+        rendered = tmpdir.join("all.log.html").read()
+        assert "before the summary" in rendered
+        assert "terminal summary" not in rendered and "half" not in rendered
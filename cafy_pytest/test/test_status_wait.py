@@ -0,0 +1,77 @@
+import threading
+from cafy_pytest.status_wait import BackoffWait, StatusWaiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestStatusWait:
+    """
+    Test cases for the debug server status waiting.
+    """
+
+    def test_backoff_up_to_ceiling(self):
+        """
+        Test that pauses grow exponentially and are capped by the ceiling.
+        """
+        fake = FakeClock()
+        waiter = BackoffWait(900, initial=2, ceiling=30, jitter=0, sleep=fake.sleep, clock=fake.clock)
+        polls = []
+
+        def poll(long_poll):
+            polls.append(long_poll)
+            return len(polls) == 7, "done"
+
+        assert waiter.run(poll) == "done"
+        assert fake.sleeps == [2, 4, 8, 16, 30, 30]
+        assert polls == [0] * 7
+
+    def test_gives_up_after_max_wait(self):
+        """
+        Test that the wait returns None once max_wait elapsed, never sleeping past it.
+        """
+        fake = FakeClock()
+        waiter = BackoffWait(100, initial=2, ceiling=30, jitter=0.2, sleep=fake.sleep, clock=fake.clock)
+        assert waiter.run(lambda long_poll: (False, None)) is None
+        assert fake.now == 100
+        assert max(fake.sleeps) <= 30 * 1.2
+
+    def test_long_poll_time_counts_towards_pause(self):
+        """
+        Test that time spent in a long poll is not slept again.
+        """
+        fake = FakeClock()
+        waiter = BackoffWait(900, initial=2, ceiling=30, jitter=0, long_poll=60,
+                             sleep=fake.sleep, clock=fake.clock)
+        polls = []
+
+        def poll(long_poll):
+            polls.append(long_poll)
+            fake.now += long_poll
+            return len(polls) == 3, "done"
+
+        assert waiter.run(poll) == "done"
+        assert fake.sleeps == []
+        assert polls == [60, 60, 60]
+
+    def test_status_waiter_join(self):
+        """
+        Test that join waits for the submitted waits.
+        """
+        status_waiter = StatusWaiter()
+        release = threading.Event()
+        future = status_waiter.submit(release.wait, 5)
+        assert status_waiter.join(timeout=0.01) == 1
+        release.set()
+        assert status_waiter.join(timeout=5) == 0
+        assert future.result() is True
@@ -0,0 +1,85 @@
+import os
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from allure_commons.model2 import TestResult as AllureTestResult
+from allure_commons.reporter import AllureReporter
+
+from cafy_pytest import plugin
+from cafy_pytest.attachments import AttachmentStore
+from cafy_pytest.run_journal import iter_run_journal
+
+NODEID = "test_sample.py::TestClass::test_one"
+CAPSTDOUT = "-Title--- Start test:  TestClass.test_one\n-Info---- configuring <interface>\n"
+
+
+class FakePluginManager:
+    def __init__(self, reporter):
+        self.listener = SimpleNamespace(allure_logger=reporter)
+
+    def get_plugin(self, name):
+        return self.listener if name == "allure_listener" else None
+
+
+@pytest.fixture
+def config(tmpdir):
+    """
+    Fixture to provide a pytest config with allure running a test.
+    """
+    reporter = AllureReporter()
+    uuid = str(uuid4())
+    reporter.schedule_test(uuid, AllureTestResult(uuid=uuid, name="test_one"))
+    report_dir = tmpdir.mkdir("allure")
+    return SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(report_dir)),
+                           pluginmanager=FakePluginManager(reporter))
+
+
+@pytest.fixture
+def report(monkeypatch, tmpdir, mocker, config, request):
+    """
+    Fixture to provide an EmailReport writing a run journal and storing its attachments.
+    """
+    monkeypatch.setattr(plugin.CafyLog, "work_dir", str(tmpdir))
+    monkeypatch.setattr(plugin, "get_attachment_store", lambda: AttachmentStore(config))
+    config_option = SimpleNamespace(testlog_attachment=False, testlog_async_render=request.param,
+                                    testlog_render_workers=1, run_journal=True, run_journal_fsync_interval=0)
+    report = plugin.EmailReport(config_option, [], None, None, "localhost", 25, True, True,
+                                None, [], {}, [], False)
+    report.log = mocker.Mock(buffer_to_retest=[])
+    yield report
+    if report.testlog_renderer is not None:
+        report.testlog_renderer.shutdown()
+    report.run_journal.close()
+
+
+def run_teardown(report, config):
+    result = SimpleNamespace(nodeid=NODEID, capstdout=CAPSTDOUT, outcome="passed", when="teardown",
+                             longrepr=None, failed=False, longreprtext="", duration=0.1)
+    hook = report.pytest_runtest_makereport(SimpleNamespace(config=config), SimpleNamespace(when="teardown"))
+    next(hook)
+    with pytest.raises(StopIteration):
+        hook.send(SimpleNamespace(get_result=lambda: result))
+    report.append_run_journal(result, "TestClass.test_one", 0)
+
+
+class TestTeardownReporting:
+    """
+    Test cases for the test_log attachment of the teardown reporting.
+    """
+
+    @pytest.mark.parametrize("report", [False, True], indirect=True, ids=["sync", "background"])
+    def test_test_log_is_journaled(self, report, config):
+        """
+        Test that the run journal references the test_log attachment, rendered in the teardown or in background.
+        """
+        run_teardown(report, config)
+        if report.testlog_renderer is not None:
+            report.testlog_renderer.shutdown()
+        report.run_journal.close()
+        records = list(iter_run_journal(os.path.join(plugin.CafyLog.work_dir, plugin.RUN_JOURNAL_FILE_NAME)))
+        path = records[-1]["artifacts"]["test_log"]
+        assert os.path.dirname(path) == config.option.allure_report_dir
+        with open(path) as attachment_file:
+            assert "configuring &lt;interface&gt;" in attachment_file.read()
+        assert report.test_log_paths == {}
@@ -0,0 +1,50 @@
+import os
+
+from cafy_pytest.templates import RESOURCES_DIR, ReportTemplates
+
+TEMPLATES = ("all_log_template.html", "all_log_compact_template.html", "mail_template.html")
+
+
+class TestReportTemplates:
+    """
+    Test cases for the session wide registry of the report templates.
+    """
+
+    def test_templates_are_compiled_once(self, mocker):
+        """
+        Test that every template is compiled once however many times it is looked up.
+        """
+        templates = ReportTemplates()
+        compile_spy = mocker.spy(templates.env, "compile")
+        first = [templates.get_template(name) for name in TEMPLATES]
+        second = [templates.get_template(name) for name in TEMPLATES]
+        assert all(a is b for a, b in zip(first, second))
+        assert compile_spy.call_count == len(TEMPLATES)
+
+    def test_resources_are_read_once(self, mocker):
+        """
+        Test that a static resource is read from the package once.
+        """
+        templates = ReportTemplates()
+        open_spy = mocker.patch("cafy_pytest.templates.open", create=True, wraps=open)
+        css = templates.get_resource("cafy_report.css")
+        assert templates.get_resource("cafy_report.css") is css
+        assert open_spy.call_count == 1
+        with open(os.path.join(RESOURCES_DIR, "cafy_report.css")) as resource:
+            assert css == resource.read()
+
+    def test_bytecode_cache_dir_is_reused(self, tmpdir, mocker):
+        """
+        Test that --template-cache-dir is filled by a run and spares the compiling to the next ones.
+        """
+        cache_dir = str(tmpdir.join("template_cache"))
+        first_run = ReportTemplates(cache_dir)
+        rendered = [first_run.get_template(name) for name in TEMPLATES]
+        assert len(os.listdir(cache_dir)) == len(TEMPLATES)
+
+        next_run = ReportTemplates(cache_dir)
+        compile_spy = mocker.spy(next_run.env, "compile")
+        cached = [next_run.get_template(name) for name in TEMPLATES]
+        assert compile_spy.call_count == 0
+        assert [template.render(log_groupings=[], log_types=[], chunks_dir="") for template in cached[:2]] == \
+            [template.render(log_groupings=[], log_types=[], chunks_dir="") for template in rendered[:2]]
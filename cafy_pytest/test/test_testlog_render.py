@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from allure_commons.model2 import TestResult as AllureTestResult
+from allure_commons.reporter import AllureReporter
+
+from cafy_pytest.templates import ReportTemplates
+from cafy_pytest.testlog_render import TestLogRenderer
+
+CAPSTDOUT = "-Title--- Start test:  TestClass.test_one\n-Info---- configuring <interface>\n"
+
+
+class FakePluginManager:
+    def __init__(self, reporter):
+        self.listener = SimpleNamespace(allure_logger=reporter)
+
+    def get_plugin(self, name):
+        return self.listener if name == "allure_listener" else None
+
+
+class BlockingTemplate:
+    """
+    Stand-in of all_log_template.html whose rendering blocks until released.
+    """
+    def __init__(self):
+        self.release = threading.Event()
+        self.rendering = threading.Semaphore(0)
+
+    def stream(self, log_groupings):
+        template = self
+
+        class Stream:
+            def enable_buffering(self, size):
+                pass
+
+            def dump(self, output_file):
+                template.rendering.release()
+                template.release.wait(5)
+                output_file.write("<html>%d groupings</html>" % len(list(log_groupings)))
+        return Stream()
+
+
+@pytest.fixture
+def reporter():
+    """
+    Fixture to provide an allure reporter running a test.
+    """
+    reporter = AllureReporter()
+    uuid = str(uuid4())
+    reporter.schedule_test(uuid, AllureTestResult(uuid=uuid, name="test"))
+    return reporter
+
+
+@pytest.fixture
+def config(tmpdir, reporter):
+    """
+    Fixture to provide a pytest config with allure active.
+    """
+    return SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(tmpdir)),
+                           pluginmanager=FakePluginManager(reporter))
+
+
+@pytest.fixture
+def logger(mocker):
+    """
+    Fixture to provide a logger.
+    """
+    return mocker.Mock()
+
+
+class TestTestLogRenderer:
+    """
+    Test cases for the background rendering of the test_log attachments.
+    """
+
+    def test_rendered_into_the_reserved_attachment(self, tmpdir, config, reporter, logger):
+        """
+        Test that the html is rendered into the file of the attachment reserved in the running allure test.
+        """
+        renderer = TestLogRenderer(ReportTemplates().get_template("all_log_template.html"), logger)
+        assert renderer.submit(config, "TestClass.test_one", CAPSTDOUT) is True
+        renderer.shutdown()
+        path = renderer.last_attachment_path
+        test = reporter.get_test(None)
+        assert [(a.name, a.type, a.source) for a in test.attachments] == [
+            ("test_log", "text/html", os.path.basename(path))]
+        assert os.path.dirname(path) == str(tmpdir)
+        with open(path) as attachment_file:
+            assert "configuring &lt;interface&gt;" in attachment_file.read()
+        assert not os.path.exists(path + ".tmp")
+        assert (renderer.submitted, renderer.rendered, renderer.failed) == (1, 1, 0)
+
+    def test_inactive_allure(self, tmpdir, logger):
+        """
+        Test that nothing is queued when allure is not active, the caller renders synchronously.
+        """
+        config = SimpleNamespace(option=SimpleNamespace(allure_report_dir=str(tmpdir)),
+                                 pluginmanager=SimpleNamespace(get_plugin=lambda name: None))
+        renderer = TestLogRenderer(BlockingTemplate(), logger)
+        assert renderer.submit(config, "TestClass.test_one", CAPSTDOUT) is False
+        assert renderer.last_attachment_path is None
+        assert renderer.submitted == 0
+        renderer.shutdown()
+
+    def test_submit_blocks_when_max_pending_is_reached(self, config, logger):
+        """
+        Test that the teardown waits for a free slot once max_pending logs are queued or rendering.
+        """
+        template = BlockingTemplate()
+        renderer = TestLogRenderer(template, logger, max_workers=1, max_pending=2)
+        assert renderer.submit(config, "T.test_0", CAPSTDOUT)
+        assert template.rendering.acquire(timeout=5)
+        assert renderer.submit(config, "T.test_1", CAPSTDOUT)
+        blocked = threading.Thread(target=renderer.submit, args=(config, "T.test_2", CAPSTDOUT))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive() and renderer.submitted == 2
+        template.release.set()
+        blocked.join(5)
+        assert not blocked.is_alive()
+        assert renderer.submitted == 3 and renderer.wait_seconds >= 0.2
+        renderer.shutdown()
+        assert renderer.rendered == 3
+
+    def test_shutdown_drains_the_pending_renders(self, config, logger):
+        """
+        Test that shutdown returns once every queued log is written.
+        """
+        template = BlockingTemplate()
+        renderer = TestLogRenderer(template, logger, max_workers=2, max_pending=8)
+        paths = []
+        for index in range(5):
+            assert renderer.submit(config, "T.test_%d" % index, CAPSTDOUT)
+            paths.append(renderer.last_attachment_path)
+        threading.Timer(0.1, template.release.set).start()
+        started = time.monotonic()
+        renderer.shutdown()
+        assert time.monotonic() - started >= 0.05
+        assert (renderer.rendered, renderer.failed) == (5, 0)
+        for path in paths:
+            with open(path) as attachment_file:
+                assert attachment_file.read() == "<html>1 groupings</html>"
@@ -0,0 +1,114 @@
+'''
+Background rendering of the per testcase html log (test_log allure attachment)
+
+The teardown hook only reserves the allure attachment and hands the captured
+stdout to a bounded pool of worker threads; the html is rendered straight into
+the attachment file while the next testcase runs. With an AttachmentStore the
+file is streamed through it, compressed and hard linked to its content address.
+'''
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import allure
+
+from .all_log import write_all_log_html
+from .attachments import commit_attachment, open_attachment, reserve_allure_attachment
+
+
+class TestLogRenderer:
+    # Not a pytest test class, even though the name looks like one
+    __test__ = False
+
+    def __init__(self, template, logger, max_workers=2, max_pending=None, attachment_store=None):
+        '''
+        :param template: jinja2 Template of all_log_template.html
+        :param logger: CafyLog logger
+        :param max_workers: number of rendering threads
+        :param max_pending: max number of captured logs queued or rendering at once,
+                            submit() blocks the teardown when this is reached (default 2 * max_workers)
+        :param attachment_store: AttachmentStore writing the attachments, or None
+        '''
+        self.template = template
+        self.log = logger
+        self.max_workers = max_workers
+        self.attachment_store = attachment_store
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="cafy-testlog-render")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rendered = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+        self.wait_seconds = 0.0
+        # attachment of the last submitted testcase, for the run journal
+        self.last_attachment_path = None
+
+    def submit(self, config, testcase_name, capstdout):
+        '''
+        Queue rendering of the captured stdout of a testcase
+        :param config: pytest config
+        :param testcase_name: testcase name, used for logging
+        :param capstdout: captured stdout of the testcase
+        :return: True if queued, False if the caller should render synchronously
+        '''
+        if self.attachment_store is not None:
+            attachment_path = self.attachment_store.reserve('test_log', allure.attachment_type.HTML)
+        else:
+            attachment_path = reserve_allure_attachment(config, 'test_log', allure.attachment_type.HTML)
+        if attachment_path is None:
+            return False
+        self.last_attachment_path = attachment_path
+        wait_start = time.perf_counter()
+        self._pending.acquire()
+        self.wait_seconds += time.perf_counter() - wait_start
+        self.submitted += 1
+        try:
+            future = self._executor.submit(self._render, testcase_name, attachment_path, capstdout)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return True
+
+    def _render(self, testcase_name, attachment_path, capstdout):
+        render_start = time.perf_counter()
+        try:
+            if self.attachment_store is not None:
+                writer = self.attachment_store.open_reserved(attachment_path)
+                try:
+                    write_all_log_html(self.template, capstdout.split('\n'), writer)
+                except Exception:
+                    writer.close()
+                    raise
+                self.attachment_store.commit_reserved(attachment_path, writer)
+            else:
+                with open_attachment(attachment_path) as attachment_file:
+                    write_all_log_html(self.template, capstdout.split('\n'), attachment_file)
+                commit_attachment(attachment_path)
+            with self._lock:
+                self.rendered += 1
+                self.render_seconds += time.perf_counter() - render_start
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            self.log.warning("Error while rendering test_log html for {}: {}".format(testcase_name, e))
+
+    def shutdown(self):
+        '''
+        Wait for all queued renderings to be written and stop the workers
+        '''
+        drain_start = time.perf_counter()
+        self._executor.shutdown(wait=True)
+        self.log.info(
+            "Background test_log rendering: submitted=%s rendered=%s failed=%s render=%.3fs "
+            "teardown backpressure=%.3fs drain=%.3fs",
+            self.submitted,
+            self.rendered,
+            self.failed,
+            self.render_seconds,
+            self.wait_seconds,
+            time.perf_counter() - drain_start,
+        )
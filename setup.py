@@ -15,7 +15,9 @@ setup(
     url='https://github.com/cafykit/cafy-pytest',
     description='Pytest Cafy Plugin', 	
     install_requires=[
-        'allure-pytest',
+        # AttachmentStore adds the attachment entries with AllureReporter._attach,
+        # see test_attachments.py before moving the bound
+        'allure-pytest>=2.8,<2.17',
         'jinja2',
         'pytest>=2.3',
         'PyYAML',
@@ -27,7 +29,10 @@ setup(
     ],
     # the following makes a plugin available to pytest
     entry_points={
-        'pytest11': ['cafy_pytest = cafy_pytest.plugin']
+        'pytest11': ['cafy_pytest = cafy_pytest.plugin'],
+        'console_scripts': ['cafy-gta-replay = cafy_pytest.gta_upload:main',
+                            'cafy-gta-compare = cafy_pytest.gta_compare:main',
+                            'cafy-log = cafy_pytest.log_index:main'],
     },
     # custom PyPI classifier for pytest plugins
     classifiers=[